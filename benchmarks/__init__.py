@@ -0,0 +1,5 @@
+# SPDX-License-Identifier: Apache-2.0
+#
+# Benchmarks of the chaincode shim, run from the repository root:
+#
+#      python -m benchmarks.<module>
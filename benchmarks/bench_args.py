@@ -0,0 +1,43 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Cost of reading the args of a transaction carrying a large binary document
+#
+#      python -m benchmarks.bench_args [--size 1048576] [--number 2000]
+#
+# "eager" is what get_function_and_parameters does: every arg decoded to str, then the document encoded back to
+# bytes for put_state. "lazy" reads the function name and the key through ChaincodeArgs and passes the raw
+# document on.
+
+import argparse
+import timeit
+
+from src.fabric_shim.args import ChaincodeArgs
+
+
+def eager(raw_args):
+    args = [arg.decode() for arg in raw_args]
+    function, params = args[0], args[1:]
+    return function, params[0], params[1].encode()
+
+
+def lazy(raw_args):
+    args = ChaincodeArgs(raw_args)
+    return args.function, args.string(1), args[2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=1 << 20, help='bytes of the document arg')
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    raw_args = [b'StoreDocument', b'doc1', b'x' * args.size]
+    for name, fn in (('eager', eager), ('lazy', lazy)):
+        elapsed = timeit.timeit(lambda: fn(raw_args), number=args.number)
+        print('%-6s %10.2f us/tx' % (name, 1e6 * elapsed / args.number))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Throughput and latency of main.py's MyChaincode driven by fake peers
+#
+#      python -m benchmarks.bench_chaincode [--connections 1] [--concurrency 16] [--read-ratio 0.8]
+#                                           [--duration 10] [--json results.json]
+#
+# A chaincode server is started (in a spawned process, or on the benchmark's own event loop with --in-process) and
+# fake peer connections run ReadAsset/UpdateAsset/DeleteAsset transactions against a shared in-memory world state
+# for a fixed time. Latency is measured per transaction, from sending TRANSACTION to receiving COMPLETED. With
+# --json the configuration, the shim version and the results are written as one JSON document, so runs of two
+# shim versions can be compared.
+
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import time
+
+from src.version import VERSION
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.server import start, _internal_server
+from main import MyChaincode
+
+from tests.fake_peer import FakePeerConnection
+
+CC_ID = 'basic_1.0:bench'
+
+
+def percentile(ordered, fraction):
+    """Nearest rank percentile of an ascending list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    return {
+        'transactions': len(ordered),
+        'errors': errors,
+        'tps': len(ordered) / elapsed if elapsed else 0.0,
+        'latency_ms': {
+            'mean': 1000 * sum(ordered) / len(ordered) if ordered else 0.0,
+            'p50': 1000 * percentile(ordered, 0.50),
+            'p90': 1000 * percentile(ordered, 0.90),
+            'p99': 1000 * percentile(ordered, 0.99),
+            'max': 1000 * ordered[-1] if ordered else 0.0,
+        },
+    }
+
+
+def seed_store(keys):
+    store = {}
+    for i in range(keys):
+        asset = {'id': 'asset%d' % i, 'color': 'blue', 'size': 5, 'owner': 'Tomoko', 'appraised_value': 300}
+        store[('', asset['id'])] = json.dumps(asset).encode()
+    return store
+
+
+def transaction(rng, args):
+    """Pick the operation and args of the next transaction according to the read/delete ratios"""
+    key = b'asset%d' % rng.randrange(args.keys)
+    draw = rng.random()
+    if draw < args.read_ratio:
+        return 'read', [b'ReadAsset', key]
+    if draw < args.read_ratio + args.delete_ratio:
+        return 'delete', [b'DeleteAsset', key]
+    return 'write', [b'UpdateAsset', key, b'red', b'10', b'Brad', b'%d' % rng.randrange(1000)]
+
+
+def _serve(args):
+    start(MyChaincode, cc_id=CC_ID, address=args.address, write_batch=args.write_batch,
+          max_concurrent_tx=args.max_concurrent_tx)
+
+
+async def _connect(peers):
+    # the connections wait for the server to be listening
+    await asyncio.wait_for(asyncio.gather(*(peer.connect() for peer in peers)), 30)
+
+
+async def run(args):
+    server = None
+    if args.in_process:
+        server = _internal_server(ccid=CC_ID, cc=MyChaincode, address=args.address, key=None, cert=None,
+                                  write_batch=args.write_batch,
+                                  max_concurrent_tx=args.max_concurrent_tx)
+        await server.start()
+
+    store = seed_store(args.keys)
+    peers = [FakePeerConnection(args.address, store, delay=args.peer_delay) for _ in range(args.connections)]
+    await _connect(peers)
+
+    measuring = False
+    deadline = time.monotonic() + args.warmup
+    latencies = {'read': [], 'write': [], 'delete': []}
+    errors = {'read': 0, 'write': 0, 'delete': 0}
+
+    async def client(peer, seed):
+        rng = random.Random(seed)
+        while time.monotonic() < deadline:
+            op, tx_args = transaction(rng, args)
+            started = time.perf_counter()
+            response = await peer.invoke(tx_args)
+            latency = time.perf_counter() - started
+            if not measuring:
+                continue
+            if response.status >= ResponseCode.ERRORTHRESHOLD:
+                errors[op] += 1
+            else:
+                latencies[op].append(latency)
+
+    clients = [(peer, i * args.concurrency + j) for i, peer in enumerate(peers) for j in range(args.concurrency)]
+    try:
+        if args.warmup:
+            await asyncio.gather(*(client(peer, -seed - 1) for peer, seed in clients))
+        measuring = True
+        deadline = time.monotonic() + args.duration
+        started = time.monotonic()
+        await asyncio.gather(*(client(peer, seed) for peer, seed in clients))
+        elapsed = time.monotonic() - started
+    finally:
+        await asyncio.gather(*(peer.close() for peer in peers))
+        if server is not None:
+            await server.stop(0)
+
+    result = summarize([latency for op in latencies.values() for latency in op], sum(errors.values()), elapsed)
+    result['by_operation'] = {op: summarize(latencies[op], errors[op], elapsed) for op in latencies
+                              if latencies[op] or errors[op]}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--address', default='127.0.0.1:9999')
+    parser.add_argument('--connections', type=int, default=1, help='peer streams, each on its own TCP connection')
+    parser.add_argument('--concurrency', type=int, default=16, help='transactions in flight per connection')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds measured')
+    parser.add_argument('--warmup', type=float, default=2.0, help='seconds run before measuring')
+    parser.add_argument('--keys', type=int, default=1000, help='assets in the world state')
+    parser.add_argument('--read-ratio', type=float, default=0.8, help='fraction of ReadAsset transactions')
+    parser.add_argument('--delete-ratio', type=float, default=0.0,
+                        help='fraction of DeleteAsset transactions, the rest are UpdateAsset')
+    parser.add_argument('--peer-delay', type=float, default=0.0,
+                        help='seconds the fake peer holds back each state request answer')
+    parser.add_argument('--write-batch', action='store_true', help='start the server with write_batch')
+    parser.add_argument('--max-concurrent-tx', type=int, default=100)
+    parser.add_argument('--in-process', action='store_true',
+                        help='serve the chaincode on the benchmark event loop instead of a separate process')
+    parser.add_argument('--json', metavar='PATH', help="write the results as JSON ('-' for stdout)")
+    parser.add_argument('--label', default='', help='free text stored with the JSON results')
+    args = parser.parse_args()
+    if args.read_ratio + args.delete_ratio > 1:
+        parser.error('--read-ratio plus --delete-ratio must not exceed 1')
+
+    server = None
+    if not args.in_process:
+        # spawned, so the server never inherits this process' gRPC state
+        server = multiprocessing.get_context('spawn').Process(target=_serve, args=(args,))
+        server.start()
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    latency = result['latency_ms']
+    print('%d tx in %.1fs: %.1f tx/s, latency p50 %.2fms p99 %.2fms max %.2fms, %d errors'
+          % (result['transactions'], args.duration, result['tps'], latency['p50'], latency['p99'], latency['max'],
+             result['errors']))
+    for op, op_result in result['by_operation'].items():
+        print('  %-6s %8.1f tx/s  p50 %.2fms p99 %.2fms  %d errors'
+              % (op, op_result['tps'], op_result['latency_ms']['p50'], op_result['latency_ms']['p99'],
+                 op_result['errors']))
+
+    if args.json:
+        document = {
+            'benchmark': 'bench_chaincode',
+            'label': args.label,
+            'shim_version': VERSION,
+            'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'config': {name: value for name, value in vars(args).items() if name not in ('json', 'label')},
+            'results': result,
+        }
+        if args.json == '-':
+            json.dump(document, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, 'w') as f:
+                json.dump(document, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Encoded size and encode/decode time of the model codecs on assets of realistic sizes
+#
+#      python -m benchmarks.bench_codecs [--number 20000]
+#
+# The baseline is what chaincodes did before the model layer: json.dumps(asset.__dict__) of a plain object, and
+# json.loads plus a plain object built from the dict.
+
+import argparse
+import json
+import timeit
+
+from src.fabric_shim.models import Model, get_codec
+
+
+class PlainAsset:
+    def __init__(self, id_=None, color=None, size=None, owner=None, appraised_value=None):
+        self.id = id_
+        self.color = color
+        self.size = size
+        self.owner = owner
+        self.appraised_value = appraised_value
+
+
+class SmallAsset(Model):
+    """The asset of main.py"""
+    id: str = ''
+    color: str = ''
+    size: int = 0
+    owner: str = ''
+    appraised_value: int = 0
+
+
+class MediumAsset(SmallAsset):
+    description: str = ''
+    price: float = 0.0
+    transferable: bool = True
+    issued_at: int = 0
+
+
+class LargeAsset(MediumAsset):
+    document: bytes = b''
+
+
+class LargeHexAsset(MediumAsset):
+    """LargeAsset for the json codec: JSON has no bytes type, the document is stored hex encoded like the baseline"""
+    document: str = ''
+
+
+ASSETS = {
+    'small': SmallAsset('asset12345', 'blue', 5, 'Tomoko', 300),
+    'medium': MediumAsset('asset12345', 'blue', 5, 'Tomoko', 300, 'x' * 200, 1234.5, True, 1700000000),
+    'large': LargeAsset('asset12345', 'blue', 5, 'Tomoko', 300, 'x' * 200, 1234.5, True, 1700000000,
+                        bytes(range(256)) * 16),
+}
+
+
+def bench_baseline(record, number):
+    plain = PlainAsset()
+    plain.__dict__.update(record.to_dict())
+    if isinstance(getattr(plain, 'document', None), bytes):
+        plain.document = plain.document.hex()
+    data = json.dumps(plain.__dict__).encode()
+
+    def decode():
+        values = json.loads(data)
+        asset = PlainAsset()
+        asset.__dict__.update(values)
+        return asset
+
+    return len(data), timeit.timeit(lambda: json.dumps(plain.__dict__).encode(), number=number), \
+        timeit.timeit(decode, number=number)
+
+
+def bench_codec(record, codec, number):
+    encode, decode = get_codec(codec).compile(type(record))
+    data = encode(record)
+    assert decode(data) == record
+    return len(data), timeit.timeit(lambda: encode(record), number=number), \
+        timeit.timeit(lambda: decode(data), number=number)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=20000)
+    parser.add_argument('--codecs', nargs='+', default=['json', 'struct', 'protobuf'])
+    args = parser.parse_args()
+
+    print('%-7s %-10s %8s %12s %12s' % ('asset', 'codec', 'bytes', 'encode us', 'decode us'))
+    for size, record in ASSETS.items():
+        rows = [('baseline', bench_baseline(record, args.number))]
+        for codec in args.codecs:
+            codec_record = record
+            if codec == 'json' and isinstance(record, LargeAsset):
+                codec_record = LargeHexAsset.from_dict(dict(record.to_dict(), document=record.document.hex()))
+            try:
+                rows.append((codec, bench_codec(codec_record, codec, args.number)))
+            except ImportError as e:
+                print('%-7s %-10s skipped: %s' % (size, codec, e))
+        for codec, (length, encode_time, decode_time) in rows:
+            print('%-7s %-10s %8d %12.2f %12.2f' % (size, codec, length, 1e6 * encode_time / args.number,
+                                                    1e6 * decode_time / args.number))
+
+
+if __name__ == '__main__':
+    main()
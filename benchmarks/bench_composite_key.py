@@ -0,0 +1,72 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Composite key encoder/decoder benchmark
+#
+#      python -m benchmarks.bench_composite_key [--keys N] [--attributes N]
+
+import argparse
+import timeit
+
+from src.fabric_shim.utils import MIN_UNICODE_RUNE_VALUE, COMPOSITEKEY_NS, validate_composite_key_attribute, \
+    encode_composite_key, encode_composite_keys, decode_composite_key, decode_composite_keys
+
+
+def legacy_create_composite_key(object_type, attributes):
+    """ChaincodeStub.create_composite_key before the encoder rewrite (repeated concatenation)"""
+    validate_composite_key_attribute(object_type)
+    composite_key = COMPOSITEKEY_NS + object_type + MIN_UNICODE_RUNE_VALUE
+    for attribute in attributes:
+        validate_composite_key_attribute(attribute)
+        composite_key = composite_key + attribute + MIN_UNICODE_RUNE_VALUE
+    return composite_key
+
+
+def legacy_split_composite_key(composite_key):
+    """ChaincodeStub.split_composite_key before the decoder rewrite"""
+    object_type = None
+    attributes = []
+    if composite_key and len(composite_key) > 1 and composite_key[0] == COMPOSITEKEY_NS:
+        split_key = composite_key[1:].split(MIN_UNICODE_RUNE_VALUE)
+        object_type = split_key[0]
+        split_key.pop()
+        if len(split_key) > 1:
+            split_key.pop(0)
+            attributes = split_key
+    return object_type, attributes
+
+
+def _report(name, seconds, n):
+    print('%-28s %10.1f ns/key %12.0f keys/s' % (name, seconds / n * 1e9, n / seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keys', type=int, default=100000)
+    parser.add_argument('--attributes', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    attributes_list = [['owner%d' % (i % 97), 'color%d' % (i % 7), 'asset%d' % i][:args.attributes]
+                       + ['attr%d' % j for j in range(3, args.attributes)] for i in range(args.keys)]
+    keys = encode_composite_keys('asset', attributes_list)
+
+    assert keys == [legacy_create_composite_key('asset', a) for a in attributes_list]
+    assert decode_composite_keys(keys) == [legacy_split_composite_key(k) for k in keys]
+
+    cases = [
+        ('legacy create', lambda: [legacy_create_composite_key('asset', a) for a in attributes_list]),
+        ('encode_composite_key', lambda: [encode_composite_key('asset', a) for a in attributes_list]),
+        ('encode_composite_keys', lambda: encode_composite_keys('asset', attributes_list)),
+        ('legacy split', lambda: [legacy_split_composite_key(k) for k in keys]),
+        ('decode_composite_key', lambda: [decode_composite_key(k) for k in keys]),
+        ('decode_composite_keys', lambda: decode_composite_keys(keys)),
+    ]
+    print('%d keys, %d attributes per key' % (args.keys, args.attributes))
+    for name, fn in cases:
+        _report(name, min(timeit.repeat(fn, number=1, repeat=args.repeat)), args.keys)
+
+
+if __name__ == '__main__':
+    main()
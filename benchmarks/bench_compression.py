@@ -0,0 +1,126 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Effect of gRPC compression (TransportConfig) on transactions writing a large document with put_state
+#
+#      python -m benchmarks.bench_compression [--size 262144] [--number 200] [--concurrency 4] [--random]
+#
+# A chaincode server storing the document arg of each transaction is served in-process once per compression
+# setting; a fake peer connection (compressing its TRANSACTION messages the same way) runs `--number` transactions.
+# Throughput, latency and the bytes a PUT_STATE message takes on the wire are reported. On a loopback connection
+# compression only adds CPU time, the wire size shows what it saves on a real network. --random uses incompressible
+# documents.
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import time
+import zlib
+
+from src.fabric_shim.interfaces import Chaincode, ChaincodeStubInterface
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.server import _internal_server
+from src.fabric_shim.transport import TransportConfig, COMPRESSION
+from fabric_protos_python.peer import chaincode_shim_pb2 as ccshim_pb2
+from fabric_protos_python.peer import proposal_response_pb2 as pb
+
+from tests.fake_peer import FakePeerConnection
+
+CC_ID = 'documents_1.0:bench'
+
+
+class DocumentChaincode(Chaincode):
+    async def init(self, stub: ChaincodeStubInterface) -> pb.Response:
+        return pb.Response(status=ResponseCode.OK)
+
+    async def invoke(self, stub: ChaincodeStubInterface) -> pb.Response:
+        args = stub.get_args()
+        await stub.put_state(args.string(1), args[2])
+        return pb.Response(status=ResponseCode.OK)
+
+
+def make_document(size, rng, incompressible):
+    if incompressible:
+        return os.urandom(size)
+    records = []
+    length = 0
+    while length < size:
+        record = json.dumps({'id': 'asset%d' % len(records), 'color': rng.choice(['blue', 'red', 'green']),
+                             'size': rng.randrange(100), 'owner': rng.choice(['Tomoko', 'Brad', 'Jin Soo']),
+                             'appraised_value': rng.randrange(1000)})
+        records.append(record)
+        length += len(record) + 2
+    return ('[' + ', '.join(records) + ']').encode()[:size]
+
+
+def wire_size(document, compression, threshold):
+    """Bytes of the PUT_STATE message carrying `document` as the chaincode server sends it: compressed as gRPC would,
+    unless it is smaller than `threshold`"""
+    payload = ccshim_pb2.PutState(key='doc', value=document).SerializeToString()
+    message = ccshim_pb2.ChaincodeMessage(type=ccshim_pb2.ChaincodeMessage.PUT_STATE, payload=payload,
+                                          txid='0' * 64, channel_id='mychannel').SerializeToString()
+    if len(message) < threshold:
+        return len(message)
+    if compression == 'gzip':
+        return len(gzip.compress(message))
+    if compression == 'deflate':
+        return len(zlib.compress(message))
+    return len(message)
+
+
+async def run_one(args, compression, documents):
+    transport = TransportConfig(compression=compression)
+    server = _internal_server(ccid=CC_ID, cc=DocumentChaincode, address=args.address, key=None, cert=None,
+                              transport=transport)
+    await server.start()
+    peer = FakePeerConnection(args.address, compression=transport.grpc_compression())
+    try:
+        await peer.connect()
+        latencies = []
+        next_tx = iter(range(args.number))
+
+        async def client():
+            for i in next_tx:
+                started = time.perf_counter()
+                response = await peer.invoke([b'PutDocument', b'doc%d' % i, documents[i % len(documents)]])
+                latencies.append(time.perf_counter() - started)
+                if response.status >= ResponseCode.ERRORTHRESHOLD:
+                    raise Exception(response.message)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await peer.close()
+        await server.stop(0)
+    latencies.sort()
+    return args.number / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+async def run(args):
+    rng = random.Random(0)
+    documents = [make_document(args.size, rng, args.random) for _ in range(8)]
+    threshold = TransportConfig().compression_threshold
+    for compression in COMPRESSION:
+        tps, p50, p99 = await run_one(args, compression, documents)
+        print('%-8s %8.1f tx/s  p50 %7.2fms  p99 %7.2fms  PUT_STATE on the wire %9d bytes'
+              % (compression, tps, 1000 * p50, 1000 * p99, wire_size(documents[0], compression, threshold)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--address', default='127.0.0.1:9997')
+    parser.add_argument('--size', type=int, default=256 * 1024, help='bytes of the document written per tx')
+    parser.add_argument('--number', type=int, default=200, help='transactions per compression setting')
+    parser.add_argument('--concurrency', type=int, default=4, help='transactions in flight')
+    parser.add_argument('--random', action='store_true', help='incompressible documents')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Cost of main.py's MyChaincode logic alone, run on a MockStub without gRPC or a peer
+#
+#      python -m benchmarks.bench_mock_stub [--number 100000] [--read-ratio 0.8] [--latency 0] [--profile]
+#
+# With --profile the run is done under cProfile and the functions with the largest cumulative time are printed.
+
+import argparse
+import asyncio
+import cProfile
+import json
+import pstats
+import random
+import time
+
+from src.fabric_shim.mock_stub import MockStub
+from main import MyChaincode
+
+
+async def run(number, keys, read_ratio, latency):
+    stub = MockStub('basic', MyChaincode, latency=latency)
+    stub.seed({'asset%d' % i: json.dumps({'id': 'asset%d' % i, 'color': 'blue', 'size': 5, 'owner': 'Tomoko',
+                                          'appraised_value': 300}) for i in range(keys)})
+    rng = random.Random(0)
+    transactions = []
+    for _ in range(number):
+        key = b'asset%d' % rng.randrange(keys)
+        if rng.random() < read_ratio:
+            transactions.append([b'ReadAsset', key])
+        else:
+            transactions.append([b'UpdateAsset', key, b'red', b'10', b'Brad', b'%d' % rng.randrange(1000)])
+
+    started = time.perf_counter()
+    for args in transactions:
+        await stub.mock_invoke(args)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=100000, help='transactions to run')
+    parser.add_argument('--keys', type=int, default=1000, help='assets in the world state')
+    parser.add_argument('--read-ratio', type=float, default=0.8, help='fraction of ReadAsset transactions')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated peer round trip in seconds')
+    parser.add_argument('--profile', action='store_true')
+    args = parser.parse_args()
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    elapsed = asyncio.run(run(args.number, args.keys, args.read_ratio, args.latency))
+    if profiler:
+        profiler.disable()
+
+    print('%d tx in %.2fs: %.0f tx/s, %.2fus/tx' % (args.number, elapsed, args.number / elapsed,
+                                                   1e6 * elapsed / args.number))
+    if profiler:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Re-registration time of a chaincode connected to the peer as a client (ChaincodeClient)
+#
+#      python -m benchmarks.bench_reconnect [--drops 20] [--concurrency 8]
+#
+# main.py's MyChaincode dials a FakePeer. Transactions run continuously while the fake peer drops the stream
+# `--drops` times; the time from each drop to the next READY stream and the transactions that failed are reported.
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from src.fabric_shim.client import ChaincodeClient, Backoff
+from src.fabric_shim.response import ResponseCode
+from main import MyChaincode
+
+from tests.fake_peer import FakePeer
+
+CC_ID = 'basic_1.0:bench'
+
+
+async def run(args):
+    store = {('', 'asset%d' % i): json.dumps({'id': 'asset%d' % i, 'color': 'blue', 'size': 5, 'owner': 'Tomoko',
+                                              'appraised_value': 300}).encode() for i in range(args.keys)}
+    peer = FakePeer(args.address, store)
+    await peer.start()
+    client = ChaincodeClient(args.address, CC_ID, MyChaincode,
+                             backoff=Backoff(initial=args.backoff, maximum=args.backoff * 8))
+    client_task = asyncio.ensure_future(client.run())
+    await peer.wait_registered()
+
+    done = False
+    counts = {'ok': 0, 'failed': 0}
+
+    async def transactions(seed):
+        rng = random.Random(seed)
+        while not done:
+            stream = await peer.wait_registered()
+            try:
+                response = await stream.invoke([b'ReadAsset', b'asset%d' % rng.randrange(args.keys)])
+            except Exception:
+                counts['failed'] += 1
+                continue
+            counts['ok' if response.status < ResponseCode.ERRORTHRESHOLD else 'failed'] += 1
+
+    workers = [asyncio.ensure_future(transactions(i)) for i in range(args.concurrency)]
+    outages = []
+    try:
+        for _ in range(args.drops):
+            await asyncio.sleep(args.interval)
+            dropped = time.perf_counter()
+            peer.drop()
+            await peer.wait_registered()
+            outages.append(time.perf_counter() - dropped)
+    finally:
+        done = True
+        for worker in workers:
+            worker.cancel()
+        await client.stop()
+        await client_task
+        await peer.stop()
+    return outages, counts, client.streams
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--address', default='127.0.0.1:9998')
+    parser.add_argument('--drops', type=int, default=20, help='times the fake peer drops the stream')
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between two drops')
+    parser.add_argument('--concurrency', type=int, default=8, help='transactions in flight')
+    parser.add_argument('--keys', type=int, default=1000, help='assets in the world state')
+    parser.add_argument('--backoff', type=float, default=0.05, help='initial backoff delay in seconds')
+    args = parser.parse_args()
+
+    outages, counts, streams = asyncio.run(run(args))
+    outages.sort()
+    print('%d drops, %d streams: re-registered in %.1fms median, %.1fms max; %d tx ok, %d failed'
+          % (len(outages), streams, 1000 * outages[len(outages) // 2], 1000 * outages[-1],
+             counts['ok'], counts['failed']))
+
+
+if __name__ == '__main__':
+    main()
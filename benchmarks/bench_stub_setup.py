@@ -0,0 +1,82 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Per-transaction cost of building a ChaincodeStub
+#
+#      python -m benchmarks.bench_stub_setup [--number N]
+#
+# Compares the eager SignedProposal decoding ChaincodeStub.__init__ used to do with the lazy properties, for a
+# transaction that never looks at the proposal and for one that reads its creator and timestamp.
+
+import argparse
+import timeit
+
+from fabric_protos_python.common import common_pb2 as cm_pb
+from fabric_protos_python.msp import identities_pb2 as id_pb
+from fabric_protos_python.peer import chaincode_pb2 as cc_pb2
+from fabric_protos_python.peer import proposal_pb2 as pr_pb
+
+from src.fabric_shim.stub import ChaincodeStub
+from tests.fake_peer import make_signed_proposal
+
+
+class _Client:
+    write_batch = False
+
+
+def legacy_decode(signed_proposal_pb):
+    """The decoding ChaincodeStub.__init__ did for every transaction before it became lazy"""
+    decoded_sp = {'signature': signed_proposal_pb.signature}
+    proposal = pr_pb.Proposal.FromString(signed_proposal_pb.proposal_bytes)
+    decoded_sp['proposal'] = {}
+    header = cm_pb.Header.FromString(proposal.header)
+    decoded_sp['proposal']['header'] = {}
+    signature_header = cm_pb.SignatureHeader.FromString(header.signature_header)
+    decoded_sp['proposal']['header']['signatureHeader'] = \
+        {'nonce': signature_header.nonce, 'creator_u8': signature_header.creator}
+    creator = id_pb.SerializedIdentity.FromString(signature_header.creator)
+    decoded_sp['proposal']['header']['signatureHeader']['creator'] = creator
+    channel_header = cm_pb.ChannelHeader.FromString(header.channel_header)
+    decoded_sp['proposal']['header']['channelHeader'] = channel_header
+    decoded_sp['proposal']['payload'] = pr_pb.ChaincodeProposalPayload.FromString(proposal.payload)
+    return {'mspid': creator.mspid, 'idBytes': creator.id_bytes}, channel_header.timestamp
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    cc_args = [b'CreateAsset', b'asset1', b'blue', b'5', b'Tomoko', b'300']
+    signed_proposal = make_signed_proposal('mychannel', 'a' * 64, cc_args)
+    cc_input = cc_pb2.ChaincodeInput(args=cc_args)
+    client = _Client()
+
+    def legacy():
+        ChaincodeStub(client, 'mychannel', 'tx', cc_input, None)
+        legacy_decode(signed_proposal)
+
+    def lazy_untouched():
+        ChaincodeStub(client, 'mychannel', 'tx', cc_input, signed_proposal)
+
+    def lazy_creator_and_timestamp():
+        stub = ChaincodeStub(client, 'mychannel', 'tx', cc_input, signed_proposal)
+        stub.get_creator()
+        stub.get_tx_timestamp()
+
+    cases = [
+        ('eager decode (before)', legacy),
+        ('lazy, proposal untouched', lazy_untouched),
+        ('lazy, creator + timestamp', lazy_creator_and_timestamp),
+    ]
+    baseline = None
+    for name, fn in cases:
+        seconds = min(timeit.repeat(fn, number=args.number, repeat=args.repeat)) / args.number
+        baseline = baseline or seconds
+        print('%-28s %8.2f us/tx  x%.2f' % (name, seconds * 1e6, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
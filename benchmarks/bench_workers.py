@@ -0,0 +1,99 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Throughput of a CPU bound chaincode served by start(workers=N)
+#
+#      python -m benchmarks.bench_workers [--workers 1 2 4] [--connections 8] [--duration 10]
+#
+# For each N a chaincode server with N worker processes is started, then several fake peer connections (each one
+# its own TCP connection, so SO_REUSEPORT spreads them over the workers) run transactions for a fixed time.
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+from src.fabric_shim.interfaces import Chaincode, ChaincodeStubInterface
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.server import start
+from fabric_protos_python.peer import proposal_response_pb2 as pb
+
+from tests.fake_peer import FakePeerConnection
+
+
+class CpuBoundChaincode(Chaincode):
+    """Decodes and validates a JSON document, then reads and writes one key"""
+
+    async def init(self, stub: ChaincodeStubInterface) -> pb.Response:
+        return pb.Response(status=ResponseCode.OK)
+
+    async def invoke(self, stub: ChaincodeStubInterface) -> pb.Response:
+        _, params = stub.get_function_and_parameters()
+        document = json.loads(params[1])
+        checksum = 0
+        for item in document['items']:
+            if not isinstance(item['id'], str) or item['qty'] < 0:
+                return pb.Response(status=ResponseCode.ERROR, message='invalid item')
+            checksum = (checksum * 31 + hash(item['id']) + item['qty']) & 0xFFFFFFFF
+        await stub.get_state(params[0])
+        await stub.put_state(params[0], str(checksum))
+        return pb.Response(status=ResponseCode.OK)
+
+
+def _serve(address, workers):
+    start(CpuBoundChaincode, cc_id='bench:1', address=address, workers=workers)
+
+
+async def _drive(address, connections, concurrency, duration, items):
+    document = json.dumps({'items': [{'id': 'item%d' % i, 'qty': i} for i in range(items)]}).encode()
+    peers = [FakePeerConnection(address) for _ in range(connections)]
+    # the connections wait for the server to be listening
+    await asyncio.wait_for(asyncio.gather(*(peer.connect() for peer in peers)), 30)
+    done = 0
+    deadline = time.monotonic() + duration
+
+    async def client(peer, n):
+        nonlocal done
+        while time.monotonic() < deadline:
+            await peer.invoke([b'Validate', b'key%d' % n, document])
+            done += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(client(peer, i * concurrency + j)
+                           for i, peer in enumerate(peers) for j in range(concurrency)))
+    elapsed = time.monotonic() - started
+    await asyncio.gather(*(peer.close() for peer in peers))
+    return done / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=8, help='transactions in flight per connection')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--items', type=int, default=2000, help='items in the JSON document of each transaction')
+    parser.add_argument('--address', default='127.0.0.1:9999')
+    args = parser.parse_args()
+
+    print('cpus=%d connections=%d concurrency=%d items=%d' % (os.cpu_count(), args.connections, args.concurrency,
+                                                             args.items))
+    baseline = None
+    for workers in args.workers:
+        # spawned, so the server (and the workers it forks) never inherit this process' gRPC state
+        server = multiprocessing.get_context('spawn').Process(target=_serve, args=(args.address, workers))
+        server.start()
+        try:
+            tps = asyncio.run(_drive(args.address, args.connections, args.concurrency, args.duration, args.items))
+        finally:
+            server.terminate()
+            server.join()
+        baseline = baseline or tps
+        print('workers=%-3d %10.1f tx/s  x%.2f' % (workers, tps, tps / baseline))
+
+
+if __name__ == '__main__':
+    main()
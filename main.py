@@ -1,10 +1,8 @@
-from ctypes import c_char
-
 from src.fabric_shim.interfaces import Chaincode, ChaincodeStubInterface
 from src.fabric_shim.server import start
 from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.models import Model, put_model
 
-import json
 from fabric_protos_python.peer import proposal_response_pb2 as pb
 
 # HOST = '127.0.0.1'
@@ -13,13 +11,12 @@ from fabric_protos_python.peer import proposal_response_pb2 as pb
 # cc_id: str = "basic_1.0:6f953644cba819469faf754a24e6a839b3065703a0e55d559e419de3c6361a9d"
 
 
-class Asset:
-    def __init__(self, id_=None, color=None, size=None, owner=None, appraised_value=None):
-        self.id: str = id_
-        self.color: str = color
-        self.size: int = size
-        self.owner: str = owner
-        self.appraised_value: int = appraised_value
+class Asset(Model):
+    id: str = None
+    color: str = None
+    size: int = None
+    owner: str = None
+    appraised_value: int = None
 
 
 class MyChaincode(Chaincode):
@@ -44,7 +41,7 @@ class MyChaincode(Chaincode):
         elif action == "ReadAsset":
             asset_id = inputs[0]
             result: Asset = await self.read_asset(self, stub, asset_id)
-            return pb.Response(status=ResponseCode.OK, message=result)
+            return pb.Response(status=ResponseCode.OK, payload=result)
         elif action == "DeleteAsset":
             asset_id = inputs[0]
             await self.delete_state(self, stub, asset_id)
@@ -63,7 +60,7 @@ class MyChaincode(Chaincode):
             await self.create_asset(self, stub, asset)
 
     async def create_asset(self, stub: ChaincodeStubInterface, asset: Asset):
-        await stub.put_state(asset.id, json.dumps(asset.__dict__))
+        await put_model(stub, asset.id, asset)
 
     async def read_asset(self, stub: ChaincodeStubInterface, key: str) -> Asset:
         return await stub.get_state(key)
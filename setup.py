@@ -27,7 +27,7 @@ setup(
     author='Hyperledger Community',
     url='https://github.com/ic-matcom/fabric-chaincode-python/',
     download_url='https://github.com/ic-matcom/fabric-chaincode-python/',
-    packages=find_packages(exclude=['docs', 'tests*']),
+    packages=find_packages(exclude=['docs', 'tests*', 'benchmarks*']),
     platforms='any',
     install_requires=requirements,
     tests_require=test_requirements,
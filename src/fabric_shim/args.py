@@ -0,0 +1,65 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Arguments of the chaincode calling transaction
+from collections.abc import Sequence
+
+
+class ChaincodeArgs(Sequence):
+    """The args of a transaction (function name first) as a sequence of bytes, decoded only on demand
+
+    Indexing returns the raw bytes of an arg, view(i) wraps it in a memoryview and string(i) decodes it to str
+    (cached). Nothing is decoded or copied up front: protobuf builds a new bytes object on every access to an
+    element of `ChaincodeInput.args`, so each element is fetched once and kept. A large binary arg can be passed as
+    is to put_state (or sliced through view()) without the decode/encode round trip of get_function_and_parameters.
+
+    Typical usage example:
+        args = stub.get_args()
+        if args.function == 'StoreDocument':
+            await stub.put_state(args.string(1), args[2])
+    """
+
+    __slots__ = ('_source', '_raw', '_str')
+
+    def __init__(self, source) -> None:
+        # the protobuf repeated field, or any sequence of bytes
+        self._source = source
+        n = len(source)
+        self._raw = [None] * n
+        self._str = [None] * n
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            raw, source = self._raw, self._source
+            for i in range(*index.indices(len(raw))):
+                if raw[i] is None:
+                    raw[i] = source[i]
+            return raw[index]
+        raw = self._raw[index]
+        if raw is None:
+            raw = self._raw[index] = self._source[index]
+        return raw
+
+    def view(self, index) -> memoryview:
+        """The arg as a memoryview, slicing it does not copy"""
+        return memoryview(self[index])
+
+    def string(self, index) -> str:
+        """The arg decoded as UTF-8"""
+        value = self._str[index]
+        if value is None:
+            value = self._str[index] = self[index].decode()
+        return value
+
+    def strings(self, start: int = 0):
+        """The args from `start` on, decoded as UTF-8"""
+        return [self.string(i) for i in range(start, len(self._raw))]
+
+    @property
+    def function(self) -> str:
+        """The function name (first arg), '' when there are no args. The other args are not touched"""
+        return self.string(0) if self._raw else ''
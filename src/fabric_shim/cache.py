@@ -0,0 +1,111 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Transaction scoped cache of peer replies
+import asyncio
+
+
+class TxCache:
+    """Memoizes the replies of idempotent peer requests for the life of one transaction.
+
+    Entries are keyed by the request (ex: ``(collection, key)`` for GET_STATE). Concurrent lookups of a key that is
+    still being loaded wait on the same peer round trip instead of issuing a new one. Failed loads are not cached.
+    """
+
+    def __init__(self) -> None:
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    async def get_or_load(self, key, loader):
+        """Return the cached value of `key`, calling the `loader` coroutine function on a miss"""
+        fut = self._entries.get(key)
+        if fut is not None:
+            self.hits += 1
+            return await asyncio.shield(fut)
+
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._entries[key] = fut
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            self._discard(key, fut)
+            fut.cancel()
+            raise
+        except Exception as e:
+            self._discard(key, fut)
+            if not fut.done():
+                fut.set_exception(e)
+                # mark the exception as retrieved, concurrent waiters (if any) still receive it
+                fut.exception()
+            raise
+
+        if not fut.done():
+            fut.set_result(value)
+        return value
+
+    async def get_or_load_many(self, keys, loader):
+        """Return the values of `keys` (in order), loading all the misses with one call to `loader`.
+
+        `loader` is a coroutine function taking the list of missing keys and returning their values in the same order.
+        """
+        futs = []
+        missing = {}
+        for key in keys:
+            fut = self._entries.get(key)
+            if fut is None:
+                fut = missing.get(key)
+            if fut is None:
+                self.misses += 1
+                fut = missing[key] = asyncio.get_running_loop().create_future()
+                self._entries[key] = fut
+            else:
+                self.hits += 1
+            futs.append(fut)
+
+        if missing:
+            try:
+                values = await loader(list(missing))
+            except asyncio.CancelledError:
+                for key, fut in missing.items():
+                    self._discard(key, fut)
+                    fut.cancel()
+                raise
+            except Exception as e:
+                for key, fut in missing.items():
+                    self._discard(key, fut)
+                    if not fut.done():
+                        fut.set_exception(e)
+                        fut.exception()
+                raise
+            for fut, value in zip(missing.values(), values):
+                if not fut.done():
+                    fut.set_result(value)
+
+        return [await asyncio.shield(fut) for fut in futs]
+
+    def _discard(self, key, fut):
+        if self._entries.get(key) is fut:
+            del self._entries[key]
+
+    def invalidate(self, key):
+        """Drop the entry of `key`, the next lookup goes to the peer"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry, pending loads are cancelled"""
+        for fut in self._entries.values():
+            if not fut.done():
+                fut.cancel()
+        self._entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
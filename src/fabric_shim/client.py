@@ -0,0 +1,151 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Chaincode as a client: the chaincode dials the peer's ChaincodeSupport.Register stream
+#
+# The main API list of the client mode is as follows:
+#
+#      ChaincodeClient: keeps a Register stream to the peer open, re-registering after failures
+#      Backoff: jittered exponential delays between reconnection attempts
+#      load_client_tls_config(): mutual TLS credentials for the connection to the peer
+
+import asyncio
+import random
+
+import grpc
+
+from src.fabric_shim.handler import Handler, STATES
+from src.fabric_shim.interfaces import Chaincode
+from src.fabric_shim.logging import LOGGER
+from src.fabric_shim.transport import TransportConfig
+from fabric_protos_python.peer import chaincode_shim_pb2_grpc as ccshim_grpc_pb2
+
+
+def load_client_tls_config(root_certs: bytes = None, key: bytes = None, cert: bytes = None) \
+        -> grpc.ChannelCredentials:
+    """
+    load_client_tls_config loads the TLS configuration of the connection to the peer
+
+    Returns:
+      A grpc.ChannelCredentials, presenting `key`/`cert` to peers that require client authentication
+    """
+    return grpc.ssl_channel_credentials(root_certs, key, cert)
+
+
+class Backoff:
+    """Exponential backoff with full jitter: the n-th delay is uniform in [0, min(maximum, initial * multiplier^n)]
+
+    The jitter keeps the chaincodes that lost the same peer from reconnecting in lockstep.
+    """
+
+    def __init__(self, initial: float = 0.5, maximum: float = 30.0, multiplier: float = 2.0,
+                 rng: random.Random = None) -> None:
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.attempts = 0
+        self._rng = rng or random.Random()
+
+    def next(self) -> float:
+        """Delay before the next attempt"""
+        ceiling = min(self.maximum, self.initial * self.multiplier ** self.attempts)
+        self.attempts += 1
+        return self._rng.uniform(0, ceiling)
+
+    def reset(self):
+        self.attempts = 0
+
+
+class ChaincodeClient:
+    """Chaincode connected to the peer as a client, through ChaincodeSupport.Register
+
+    One gRPC channel (a long-lived HTTP/2 connection set up by `transport`) is kept for the life of the client. The
+    default TransportConfig pings the peer every 60s, the most the peer's default enforcement policy
+    (peer.keepalive.minInterval) accepts, so NATs and load balancers do not drop an idle connection. When the
+    Register stream ends or fails, it is re-opened on that channel after a Backoff delay, which is reset once a
+    stream reaches READY. The same Handler serves every stream. The peer forgets the transactions of a lost stream,
+    so the transactions still running or queued when a stream is lost are cancelled without being answered (their
+    proposals already failed on the peer side).
+
+    Typical usage example:
+        client = ChaincodeClient('peer0.org1.example.com:7052', 'basic_1.0:hash', MyChaincode)
+        await client.run()
+    """
+
+    def __init__(self, peer_address: str, cc_id: str, cc: Chaincode, credentials: grpc.ChannelCredentials = None,
+                 transport: TransportConfig = None, backoff: Backoff = None, **handler_options) -> None:
+        self.peer_address = peer_address
+        self.credentials = credentials
+        self.transport = transport or TransportConfig()
+        self.backoff = backoff or Backoff()
+        self.handler = Handler(cc_id, cc, **handler_options)
+        # Register streams opened, the first one included
+        self.streams = 0
+        self._channel = None
+        self._call = None
+        self._stopping = False
+        self._stop_requested = asyncio.Event()
+
+    def _open_channel(self) -> grpc.aio.Channel:
+        options = self.transport.channel_options()
+        compression = self.transport.grpc_compression()
+        if self.credentials is not None:
+            return grpc.aio.secure_channel(self.peer_address, self.credentials, options=options,
+                                           compression=compression)
+        return grpc.aio.insecure_channel(self.peer_address, options=options, compression=compression)
+
+    async def run(self):
+        """Serve the peer until stop() is called, reconnecting as needed"""
+        self._channel = self._open_channel()
+        try:
+            while not self._stopping:
+                await self._chat()
+                if self._stopping:
+                    break
+                delay = self.backoff.next()
+                LOGGER.info('Re-registering with the peer at %s in %.2fs (attempt %d)',
+                            self.peer_address, delay, self.backoff.attempts)
+                try:
+                    await asyncio.wait_for(self._stop_requested.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self._channel.close()
+            self._channel = None
+
+    async def _chat(self):
+        # wait_for_ready: while the channel is reconnecting the call waits for it instead of failing at once
+        self._call = ccshim_grpc_pb2.ChaincodeSupportStub(self._channel).Register(wait_for_ready=True)
+        self.streams += 1
+        try:
+            await self.handler.chat_with_peer(self._call, self._call)
+            if not self._stopping:
+                LOGGER.warning('The peer at %s closed the chaincode stream', self.peer_address)
+        except asyncio.CancelledError:
+            # stop() cancels the call, which surfaces as a cancellation of the stream read
+            if not self._stopping:
+                raise
+        except Exception as e:
+            if not self._stopping:
+                LOGGER.warning('The chaincode stream to the peer at %s failed: %s', self.peer_address, e)
+        finally:
+            if self.handler.state == STATES.READY:
+                self.backoff.reset()
+            self._call.cancel()
+            self._call = None
+
+    async def stop(self, drain_timeout: float = 0):
+        """Close the stream and stop reconnecting, the transactions still running are cancelled.
+
+        With a `drain_timeout` the handler is drained first (see Handler.drain): the transactions in flight get that
+        many seconds to complete.
+        """
+        if drain_timeout:
+            await self.handler.drain(drain_timeout)
+        self._stopping = True
+        self._stop_requested.set()
+        if self._call is not None:
+            self._call.cancel()
+        if self.handler.scheduler is not None:
+            self.handler.scheduler.cancel_all()
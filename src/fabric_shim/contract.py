@@ -0,0 +1,266 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Contract API: chaincode written as a class of decorated transaction methods
+#
+# The main API list of the contract layer is as follows:
+#
+#      Contract: Chaincode base class dispatching Init/Invoke to the transaction named by the first arg
+#      transaction(): decorator registering a method as a transaction
+#      register_arg_parser(): teach the argument binding a new parameter type
+#
+# Typical usage example:
+#
+#     class AssetContract(Contract):
+#         @transaction
+#         async def create_asset(self, stub, asset_id: str, size: int, owner: str):
+#             await stub.put_state(asset_id, json.dumps({'size': size, 'owner': owner}))
+#
+#         @transaction(name='ReadAsset', read_only=True)
+#         async def read_asset(self, stub, asset_id: str) -> bytes:
+#             return await stub.get_state(asset_id)
+#
+#     start(AssetContract)
+
+import inspect
+import json
+import typing
+
+from fabric_protos_python.peer import proposal_response_pb2 as pb
+
+from src.fabric_shim.interfaces import Chaincode, ChaincodeStubInterface
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.executor import get_executor
+from src.fabric_shim.logging import LOGGER
+
+# function answering with the metadata (transactions and their parameters) of the contract, as in fabric-contract-api
+METADATA_FUNCTION = 'org.hyperledger.fabric:GetMetadata'
+
+
+def _parse_bool(arg: bytes) -> bool:
+    value = bytes(arg).lower()
+    if value in (b'true', b'1'):
+        return True
+    if value in (b'false', b'0'):
+        return False
+    raise ValueError('%r is not a boolean' % bytes(arg))
+
+
+def _parse_str(arg: bytes) -> str:
+    return bytes(arg).decode()
+
+
+# annotation -> function turning the raw argument (bytes) into the value passed to the transaction
+_ARG_PARSERS = {
+    bytes: bytes,
+    str: _parse_str,
+    int: int,
+    float: float,
+    bool: _parse_bool,
+    dict: json.loads,
+    list: json.loads,
+    typing.Any: _parse_str,
+    inspect.Parameter.empty: _parse_str,
+}
+
+
+def register_arg_parser(annotation, parser):
+    """Parse the transaction parameters annotated with `annotation` with parser(raw_bytes)"""
+    _ARG_PARSERS[annotation] = parser
+
+
+def _arg_parser(annotation):
+    parser = _ARG_PARSERS.get(annotation)
+    if parser is not None:
+        return parser
+    # typing.Optional[X], typing.List[X], typing.Dict[K, V]
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        options = [option for option in typing.get_args(annotation) if option is not type(None)]
+        if len(options) == 1:
+            return _arg_parser(options[0])
+    elif origin in (list, dict):
+        return json.loads
+    from_bytes = getattr(annotation, 'from_bytes', None)
+    if callable(from_bytes):
+        return from_bytes
+    raise TypeError('no argument parser for %r, see register_arg_parser()' % (annotation,))
+
+
+def _to_response(result) -> pb.Response:
+    """Turn the value returned by a transaction into the Response sent to the peer"""
+    if isinstance(result, pb.Response):
+        return result
+    if result is None:
+        payload = b''
+    elif isinstance(result, (bytes, bytearray, memoryview)):
+        payload = bytes(result)
+    elif isinstance(result, str):
+        payload = result.encode()
+    elif isinstance(result, (dict, list)):
+        payload = json.dumps(result).encode()
+    else:
+        to_bytes = getattr(result, 'to_bytes', None)
+        payload = to_bytes() if callable(to_bytes) and not isinstance(result, int) else str(result).encode()
+    return pb.Response(status=ResponseCode.OK, payload=payload)
+
+
+def _schema_name(annotation):
+    if annotation is inspect.Parameter.empty:
+        return 'str'
+    if isinstance(annotation, type):
+        return annotation.__name__
+    return str(annotation).replace('typing.', '')
+
+
+class TransactionSpec:
+    """A transaction of a contract, with its argument binding compiled from the method signature"""
+
+    __slots__ = ('fn', 'name', 'read_only', 'cpu_bound', 'params', 'parsers', 'min_args', 'max_args')
+
+    def __init__(self, fn, name: str, read_only: bool, cpu_bound: bool) -> None:
+        self.fn = fn
+        self.name = name
+        self.read_only = read_only
+        self.cpu_bound = cpu_bound
+        self.params = []
+        self.parsers = ()
+        self.min_args = self.max_args = 0
+
+    def compile(self):
+        """Resolve the parameter parsers from the type hints, once per class"""
+        signature = inspect.signature(self.fn)
+        hints = typing.get_type_hints(self.fn)
+        # (self, stub, *transaction args)
+        params = list(signature.parameters.values())[2:]
+        for param in params:
+            if param.kind not in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD):
+                raise TypeError('transaction %s: parameter %s must be positional' % (self.name, param.name))
+        self.params = [(param.name, hints.get(param.name, param.annotation)) for param in params]
+        self.parsers = tuple(_arg_parser(annotation) for _, annotation in self.params)
+        self.max_args = len(params)
+        self.min_args = sum(1 for param in params if param.default is param.empty)
+
+    def bind(self, args):
+        """Parse the raw transaction args (function name excluded)"""
+        if not self.min_args <= len(args) <= self.max_args:
+            expected = self.max_args if self.min_args == self.max_args else '%d to %d' % (self.min_args, self.max_args)
+            raise ValueError('transaction %s expects %s arguments, got %d' % (self.name, expected, len(args)))
+        try:
+            return [parse(arg) for parse, arg in zip(self.parsers, args)]
+        except Exception as e:
+            raise ValueError('transaction %s: invalid arguments: %s' % (self.name, e))
+
+    def metadata(self):
+        return {
+            'name': self.name,
+            'tags': ['EVALUATE'] if self.read_only else ['SUBMIT'],
+            'parameters': [{'name': name, 'schema': _schema_name(annotation)} for name, annotation in self.params],
+        }
+
+
+def transaction(fn=None, *, name: str = None, read_only: bool = False, cpu_bound: bool = False):
+    """Register a contract method as a transaction
+
+    The method is called as method(self, stub, *args) with the transaction args parsed according to the parameter
+    annotations (str when missing, see register_arg_parser()). Its return value becomes the response payload, unless
+    it is a Response already; raising answers with an error response.
+
+    name        Function name clients use, the method name by default.
+    read_only   The transaction is a query: its writes are refused.
+    cpu_bound   Run the transaction in the chaincode executor, see executor.cpu_bound(). The stub is passed
+                along, so this needs the thread executor.
+    """
+    def register(method):
+        method.__transaction__ = TransactionSpec(method, name or method.__name__, read_only, cpu_bound)
+        return method
+
+    return register(fn) if fn is not None else register
+
+
+class Contract(Chaincode):
+    """Chaincode dispatching Init/Invoke to its @transaction methods
+
+    The dispatch table (function name, as bytes, to TransactionSpec) and the argument parsers are built once when
+    the subclass is defined, so a call costs one dict lookup plus one parser call per argument whatever the number
+    of transactions. The function name is never decoded.
+
+    The handler calls init/invoke with the chaincode class as `self`; the transactions run on a single instance of
+    the class created on first use, so they can keep using `self` as usual.
+    """
+
+    _transactions = {}
+    _contract_instance = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        transactions = {}
+        for klass in reversed(cls.__mro__):
+            for attr in vars(klass).values():
+                spec = getattr(attr, '__transaction__', None)
+                if isinstance(spec, TransactionSpec):
+                    spec.compile()
+                    transactions[spec.name.encode()] = spec
+        cls._transactions = transactions
+        cls._contract_instance = None
+
+    @classmethod
+    def get_transactions(cls):
+        """The transactions of the contract by function name"""
+        return {name.decode(): spec for name, spec in cls._transactions.items()}
+
+    @classmethod
+    def get_metadata(cls):
+        return {'contracts': {cls.__name__: {
+            'name': cls.__name__,
+            'transactions': [spec.metadata() for spec in cls._transactions.values()],
+        }}}
+
+    @classmethod
+    def _instance(cls):
+        instance = cls.__dict__.get('_contract_instance')
+        if instance is None:
+            instance = cls()
+            cls._contract_instance = instance
+        return instance
+
+    async def init(self, stub: ChaincodeStubInterface) -> pb.Response:
+        """Run the transaction named by the first arg, if any"""
+        if not stub.get_args():
+            return pb.Response(status=ResponseCode.OK)
+        return await self.invoke(self, stub) if isinstance(self, type) else await self.invoke(stub)
+
+    async def invoke(self, stub: ChaincodeStubInterface) -> pb.Response:
+        contract = self._instance() if isinstance(self, type) else self
+        args = stub.get_args()
+        if not args:
+            return pb.Response(status=ResponseCode.ERROR, message='no transaction function given')
+        spec = contract._transactions.get(bytes(args[0]))
+        if spec is None:
+            return await contract.unknown_transaction(stub, bytes(args[0]).decode(errors='replace'))
+
+        try:
+            params = spec.bind(args[1:])
+        except ValueError as e:
+            return pb.Response(status=ResponseCode.ERROR, message=str(e))
+
+        if spec.read_only:
+            stub.read_only = True
+        try:
+            if spec.cpu_bound:
+                result = await get_executor().run(spec.fn, contract, stub, *params)
+            else:
+                result = await spec.fn(contract, stub, *params)
+        except Exception as e:
+            LOGGER.info('Transaction %s failed: %s', spec.name, e)
+            return pb.Response(status=ResponseCode.ERROR, message=str(e))
+        return _to_response(result)
+
+    async def unknown_transaction(self, stub: ChaincodeStubInterface, function: str) -> pb.Response:
+        """Called for a function name without transaction, answers with an error (and with the contract metadata for
+        org.hyperledger.fabric:GetMetadata)"""
+        if function == METADATA_FUNCTION:
+            return _to_response(self.get_metadata())
+        return pb.Response(status=ResponseCode.ERROR,
+                           message='function %s is not a transaction of %s' % (function, type(self).__name__))
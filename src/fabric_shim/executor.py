@@ -0,0 +1,256 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Offload of CPU bound chaincode code to a thread or process pool
+#
+# The main API list of the executor is as follows:
+#
+#      cpu_bound(): decorator running a chaincode function in the pool
+#      run_cpu_bound(): run one function (a section of a chaincode function) in the pool
+#      configure_executor(): choose the pool kind and size, called by server.start()
+#      get_executor(): the executor of this process, its stats() show the pool size and depth
+
+import asyncio
+import concurrent.futures
+import functools
+import importlib
+import multiprocessing
+import os
+
+from src.fabric_shim.interfaces import ChaincodeStubInterface
+
+
+class ExecutorKind:
+    THREAD = 'thread'  # offloaded coroutines keep using the stub, the GIL is released only by C code
+    PROCESS = 'process'  # true parallelism, the function and its arguments must be picklable, no stub access
+
+
+def _on_loop(loop, awaitable):
+    """Run `awaitable` on `loop` (the gRPC loop) and return an awaitable for the calling (worker) loop"""
+    async def call():
+        return await awaitable
+    return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(call(), loop))
+
+
+class ThreadStubProxy:
+    """Stub handed to coroutines running in a pool thread.
+
+    The stub and the handler behind it belong to the event loop of the peer stream. Every coroutine method of the
+    stub is forwarded to that loop and awaited from the worker thread's own loop; query iterators are proxied the
+    same way, one result at a time. Plain methods (get_txid, get_function_and_parameters, ...) are called directly.
+    """
+
+    def __init__(self, stub, loop) -> None:
+        self._stub = stub
+        self._loop = loop
+
+    def __getattr__(self, name):
+        attr = getattr(self._stub, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def forwarded(*args, **kwargs):
+            return self._wrap_result(await _on_loop(self._loop, attr(*args, **kwargs)))
+        return forwarded
+
+    def _wrap_result(self, result):
+        if hasattr(result, '__aiter__'):
+            return ThreadIteratorProxy(result, self._loop)
+        if isinstance(result, tuple):
+            return tuple(self._wrap_result(item) for item in result)
+        return result
+
+
+class ThreadIteratorProxy:
+    """Async iterator consumed from a pool thread, driving an iterator that lives on the gRPC loop"""
+
+    def __init__(self, iterator, loop) -> None:
+        self._iterator = iterator
+        self._loop = loop
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        results = self._iterator.__aiter__()
+        try:
+            while True:
+                try:
+                    item = await _on_loop(self._loop, results.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            await _on_loop(self._loop, results.aclose())
+
+    async def close(self):
+        await _on_loop(self._loop, self._iterator.close())
+
+
+def _resolve(module, qualname):
+    target = importlib.import_module(module)
+    for part in qualname.split('.'):
+        target = getattr(target, part)
+    # a @cpu_bound function would offload again, run the function it wraps
+    if getattr(target, '__cpu_bound__', False):
+        target = target.__wrapped__
+    return target
+
+
+def _call_by_name(module, qualname, args, kwargs):
+    """Process pool entry point: functions are sent by name, decorated ones cannot be pickled by reference"""
+    result = _resolve(module, qualname)(*args, **kwargs)
+    if asyncio.iscoroutine(result):
+        result = asyncio.run(result)
+    return result
+
+
+class ChaincodeExecutor:
+    """Thread or process pool running the CPU bound parts of chaincode functions.
+
+    At most `max_workers` calls execute at once and at most `max_queue` more wait for a worker inside the pool;
+    callers beyond that wait on the event loop (None for no limit). stats() reports the pool size and depth.
+    """
+
+    def __init__(self, kind: str = ExecutorKind.THREAD, max_workers: int = None, max_queue: int = None) -> None:
+        if kind not in (ExecutorKind.THREAD, ExecutorKind.PROCESS):
+            raise ValueError('executor kind must be "%s" or "%s", got "%s"'
+                             % (ExecutorKind.THREAD, ExecutorKind.PROCESS, kind))
+        self.kind = kind
+        if not max_workers:
+            cpus = os.cpu_count() or 1
+            max_workers = cpus if kind == ExecutorKind.PROCESS else min(32, cpus + 4)
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = None
+        self._slots = None
+        # submitted to the pool and not finished yet, waiting on the event loop for room in the pool
+        self.in_flight = 0
+        self.blocked = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.kind == ExecutorKind.PROCESS:
+                # spawned workers do not inherit the gRPC state of this process
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+            else:
+                self._pool = concurrent.futures.ThreadPoolExecutor(self.max_workers,
+                                                                   thread_name_prefix='chaincode-cpu')
+        return self._pool
+
+    def _get_slots(self):
+        if self.max_queue is not None and self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+        return self._slots
+
+    def _prepare(self, fn, args, kwargs, loop):
+        if self.kind == ExecutorKind.PROCESS:
+            if any(isinstance(arg, ChaincodeStubInterface) for arg in (*args, *kwargs.values())):
+                raise TypeError('the chaincode stub cannot be sent to a process pool, '
+                                'offload pure functions or use the thread executor')
+            return functools.partial(_call_by_name, fn.__module__, fn.__qualname__, args, kwargs)
+
+        if asyncio.iscoroutinefunction(fn):
+            args = [ThreadStubProxy(arg, loop) if isinstance(arg, ChaincodeStubInterface) else arg for arg in args]
+            kwargs = {name: ThreadStubProxy(arg, loop) if isinstance(arg, ChaincodeStubInterface) else arg
+                      for name, arg in kwargs.items()}
+            return lambda: asyncio.run(fn(*args, **kwargs))
+        return functools.partial(fn, *args, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in the pool and return its result. `fn` may be a coroutine function"""
+        loop = asyncio.get_running_loop()
+        call = self._prepare(fn, args, kwargs, loop)
+        slots = self._get_slots()
+        if slots is not None:
+            self.blocked += 1
+            try:
+                await slots.acquire()
+            finally:
+                self.blocked -= 1
+        self.in_flight += 1
+        try:
+            result = await loop.run_in_executor(self._get_pool(), call)
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            if slots is not None:
+                slots.release()
+        self.completed += 1
+        return result
+
+    def stats(self):
+        return {
+            'kind': self.kind,
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'active': min(self.in_flight, self.max_workers),
+            'queued': max(0, self.in_flight - self.max_workers),
+            'blocked': self.blocked,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+_settings = {'kind': ExecutorKind.THREAD, 'max_workers': None, 'max_queue': None}
+_executor = None
+
+
+def configure_executor(kind: str = ExecutorKind.THREAD, max_workers: int = None, max_queue: int = None):
+    """Set the pool used by cpu_bound/run_cpu_bound. The pool is created on first use, in the serving process"""
+    ChaincodeExecutor(kind, max_workers, max_queue)  # validate
+    _settings.update(kind=kind, max_workers=max_workers, max_queue=max_queue)
+    shutdown_executor(wait=False)
+
+
+def shutdown_executor(wait: bool = True):
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+def get_executor() -> ChaincodeExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ChaincodeExecutor(**_settings)
+    return _executor
+
+
+async def run_cpu_bound(fn, *args, **kwargs):
+    """Run a CPU heavy function (or coroutine function) in the chaincode executor
+
+    Typical usage example:
+        digest = await run_cpu_bound(verify_signatures, document)
+    """
+    return await get_executor().run(fn, *args, **kwargs)
+
+
+def cpu_bound(fn):
+    """Mark a chaincode function as CPU bound: every call runs in the chaincode executor
+
+    Coroutine functions running in the thread executor get a stub whose state calls are forwarded to the event loop
+    of the peer stream, so `await stub.get_state(key)` keeps working.
+
+    Typical usage example:
+        @cpu_bound
+        async def validate(self, stub, document): ...
+    """
+    @functools.wraps(fn)
+    async def offloaded(*args, **kwargs):
+        return await get_executor().run(fn, *args, **kwargs)
+
+    offloaded.__cpu_bound__ = True
+    return offloaded
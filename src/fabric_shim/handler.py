@@ -11,6 +11,8 @@
 #      chat_with_peer(): Starts a two-way communication flow with the peer node
 
 import datetime
+import logging
+import time
 from typing import AsyncIterable
 import asyncio
 import grpc
@@ -22,8 +24,11 @@ from src.fabric_shim.stub import ChaincodeStub
 from src.fabric_shim.msg_queue_handler import MsgQueueHandler, QueueMessage
 from src.fabric_shim.response import new_error_msg, ResponseCode
 from src.fabric_shim.utils import generate_logging_prefix
-from src.fabric_shim.logging import LOGGER
+from src.fabric_shim.logging import LOGGER, LogSampler, Redacted
 from src.fabric_shim.interfaces import Chaincode
+from src.fabric_shim.write_batch import WriteOp
+from src.fabric_shim.scheduler import TxScheduler, DEFAULT_MAX_CONCURRENT_TX, DEFAULT_MAX_PENDING_TX
+from src.fabric_shim.metrics import METRICS
 
 
 class STATES:
@@ -32,42 +37,131 @@ class STATES:
     READY = "ready"  # ready for requests
 
 
-MIN_UNICODE_RUNE_VALUE = '\u0000'  # U + 0000
-MAX_UNICODE_RUNE_VALUE = '\u0010FFFF'  # U+10FFFF - maximum (and unallocated) code point
-COMPOSITEKEY_NS = '\x00'
-EMPTY_KEY_SUBSTITUTE = '\x01'
-
-STATE = STATES.CREATED
+# Seconds to wait for the peer to answer a request. It matches the peer's default chaincode execute timeout, after
+# which the peer has abandoned the transaction anyway.
+DEFAULT_REQUEST_TIMEOUT = 30.0
+# Seconds a transaction may run before it is answered with an error response
+DEFAULT_TX_TIMEOUT = 30.0
+# Seconds drain() waits for the in-flight transactions before aborting them. It stays below the 30s Kubernetes
+# grants a terminating pod by default (terminationGracePeriodSeconds).
+DEFAULT_DRAIN_TIMEOUT = 20.0
+# Seconds the aborted transactions get to send their COMPLETED message once a drain has timed out
+DRAIN_ABORT_GRACE = 1.0
 
 
 class Handler:
-    def __init__(self, cc_id: str, cc: Chaincode) -> None:
+    def __init__(self, cc_id: str, cc: Chaincode, write_batch: bool = False,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT, tx_timeout: float = DEFAULT_TX_TIMEOUT,
+                 max_concurrent_tx: int = DEFAULT_MAX_CONCURRENT_TX,
+                 max_pending_tx: int = DEFAULT_MAX_PENDING_TX, compression_threshold: int = None) -> None:
         self.chaincode_id = cc_pb2.ChaincodeID()
         self.chaincode_id.name = cc_id
         self.chaincode = cc
         self.msg_queue_handler = None
+        self.scheduler = None
         self.context = None
+        # handshake state of this handler's peer stream
+        self.state = STATES.CREATED
+        # buffer put_state/delete_state in the stub and flush them once per transaction, as WRITE_BATCH_STATE
+        # messages if the peer advertises them (peer_params) and one message per key otherwise
+        self.write_batch = write_batch
+        # deadlines (seconds) of a peer request and of a whole transaction, None or 0 disables them
+        self.request_timeout = request_timeout or None
+        self.tx_timeout = tx_timeout or None
+        # transactions executing at once, and queued per channel, see TxScheduler
+        self.max_concurrent_tx = max_concurrent_tx
+        self.max_pending_tx = max_pending_tx
+        # the stream accepts one write at a time
+        self._write_lock = asyncio.Lock()
+        # ChaincodeAdditionalParams advertised by the peer in the REGISTERED message (None for older peers)
+        self.peer_params = None
+        self._log_sampler = LogSampler()
+        # with compression on (see TransportConfig), messages smaller than this many bytes are sent uncompressed
+        self.compression_threshold = compression_threshold
+        # set by drain(): new transactions are refused and, once `_aborting`, the running ones are cancelled
+        self.draining = False
+        self._aborting = False
+        # transactions refused because the handler was draining
+        self.refused = 0
+        # flow control: set when reads paused by pause_reads() may resume, and the number of pauses
+        self._flow = asyncio.Event()
+        self.read_pauses = 0
+        # writes started by the stream reader, which never waits for them
+        self._background = set()
+        # the chaincode Init/Invoke calls in progress
+        self._calls = set()
 
     async def handle_stub_interaction(self, msg, action="Invoke"):
         """handle_message calls the Init | Invoke function of the associated chaincode."""
-        # Get the function and args from Payload
-        cc_input = cc_pb2.ChaincodeInput()
-        cc_input.ParseFromString(msg.payload)
-        
-        stub = ChaincodeStub(self, msg.channel_id, msg.txid, cc_input, msg.proposal)
-
-        if action == 'init':
-            method = 'Init'
-            resp: pr_pb.Response = await self.chaincode.init(self.chaincode, stub)
-        else:
-            method = 'Invoke'
-            resp: pr_pb.Response = await self.chaincode.invoke(self.chaincode, stub)
-
-        # check that a response object has been returned otherwise assume an error.
+        method = 'Init' if action.lower() == 'init' else 'Invoke'
+        log_prefix = generate_logging_prefix(msg.channel_id, msg.txid)
+        # the peer stream the transaction came on, its COMPLETED message is only meaningful there
+        stream = self.context
+        self.msg_queue_handler.open_tx(msg.channel_id, msg.txid, self.tx_timeout)
+        started = time.perf_counter() if METRICS.enabled else None
+        function = ''
+        stub = None
+        try:
+            # Get the function and args from Payload
+            cc_input = cc_pb2.ChaincodeInput()
+            cc_input.ParseFromString(msg.payload)
+            if started is not None and cc_input.args:
+                function = cc_input.args[0].decode(errors='replace')
+
+            stub = ChaincodeStub(self, msg.channel_id, msg.txid, cc_input, msg.proposal)
+
+            if method == 'Init':
+                call = self.chaincode.init(self.chaincode, stub)
+            else:
+                call = self.chaincode.invoke(self.chaincode, stub)
+
+            task = asyncio.ensure_future(call)
+            self._calls.add(task)
+            task.add_done_callback(self._calls.discard)
+            if self._aborting:
+                task.cancel()
+            try:
+                resp: pr_pb.Response = await asyncio.wait_for(task, self.tx_timeout)
+            except asyncio.CancelledError:
+                if not self._aborting:
+                    raise
+                err_msg = '%s Calling chaincode %s() was aborted, the chaincode is shutting down' \
+                          % (log_prefix, method)
+                LOGGER.warning(err_msg)
+                resp = pr_pb.Response(status=ResponseCode.ERROR, message=err_msg)
+            except asyncio.TimeoutError:
+                err_msg = '%s Calling chaincode %s() exceeded the transaction deadline of %ss' \
+                          % (log_prefix, method, self.tx_timeout)
+                LOGGER.error(err_msg)
+                resp = pr_pb.Response(status=ResponseCode.ERROR, message=err_msg)
+            except Exception as e:
+                err_msg = '%s Calling chaincode %s() raised: %s' % (log_prefix, method, e)
+                LOGGER.error(err_msg)
+                resp = pr_pb.Response(status=ResponseCode.ERROR, message=err_msg)
+
+            # check that a response object has been returned otherwise assume an error.
+
+            if resp and resp.status and resp.status < ResponseCode.ERRORTHRESHOLD:
+                await stub.close_iterators()
+                try:
+                    await stub.flush_writes()
+                except Exception as e:
+                    err_msg = '%s Flushing the write set of %s() failed: %s' % (log_prefix, method, e)
+                    LOGGER.error(err_msg)
+                    resp = pr_pb.Response(
+                        status=ResponseCode.ERROR,
+                        message=err_msg
+                    )
+            else:
+                # the peer drops the iterators of a failed transaction by itself
+                stub.release_iterators()
+        except Exception as e:
+            err_msg = '%s Could not set up the chaincode %s() call: %s' % (log_prefix, method, e)
+            LOGGER.error(err_msg)
+            resp = pr_pb.Response(status=ResponseCode.ERROR, message=err_msg)
 
         if not resp or not resp.status:
-            err_msg = '%s Calling chaincode %s() has not called success or error.' \
-                      % (generate_logging_prefix(msg.channel_id, msg.txid), method)
+            err_msg = '%s Calling chaincode %s() has not called success or error.' % (log_prefix, method)
             LOGGER.info(err_msg)
 
             resp = pr_pb.Response(
@@ -75,103 +169,193 @@ class Handler:
                 message=err_msg
             )
 
-        LOGGER.info('%s Calling chaincode %s(), response status: %s'
-                    % (generate_logging_prefix(msg.channel_id, msg.txid), method, resp.status))
+        LOGGER.debug('%s Calling chaincode %s(), response status: %s', log_prefix, method, resp.status)
+        if started is not None:
+            METRICS.tx_latency.observe(time.perf_counter() - started, method, function)
+            METRICS.tx_responses.inc(method, resp.status)
 
         if resp.status >= ResponseCode.ERROR:
-            err_msg = '%s Calling chaincode %s() returned error response [%s]. Sending COMPLETED message back to peer' \
-                      % (generate_logging_prefix(msg.channel_id, msg.txid), method, resp.message)
-            LOGGER.info(err_msg)
-
-            next_state_msg = ccshim_pb2.ChaincodeMessage(
-                type=ccshim_pb2.ChaincodeMessage.COMPLETED,
-                payload=resp.SerializeToString(),
-                txid=msg.txid,
-                channel_id=msg.channel_id
-            )
+            LOGGER.info('%s Calling chaincode %s() returned error response [%s]. '
+                        'Sending COMPLETED message back to peer', log_prefix, method, resp.message)
         else:
-            LOGGER.info('%s Calling chaincode %s() succeeded. Sending COMPLETED message back to peer'
-                        % (generate_logging_prefix(msg.channel_id, msg.txid), method))
-
-            next_state_msg = ccshim_pb2.ChaincodeMessage(
-                type=ccshim_pb2.ChaincodeMessage.COMPLETED,
-                payload=resp.SerializeToString(),
-                txid=msg.txid,
-                channel_id=msg.channel_id
-            )
+            LOGGER.debug('%s Calling chaincode %s() succeeded. Sending COMPLETED message back to peer',
+                         log_prefix, method)
+
+        next_state_msg = ccshim_pb2.ChaincodeMessage(
+            type=ccshim_pb2.ChaincodeMessage.COMPLETED,
+            payload=resp.SerializeToString(),
+            txid=msg.txid,
+            channel_id=msg.channel_id
+        )
 
-        await self.context.write(next_state_msg)
+        try:
+            if self.context is stream:
+                await self.write_message(next_state_msg)
+            else:
+                LOGGER.warning('%s The peer stream of the transaction closed, its COMPLETED message is dropped',
+                               log_prefix)
+        finally:
+            self.msg_queue_handler.complete_tx(msg.channel_id, msg.txid)
+            if stub is not None:
+                if LOGGER.isEnabledFor(logging.DEBUG):
+                    LOGGER.debug('%s Read cache stats: %s', log_prefix, stub.get_read_cache_stats())
+                stub.read_cache.clear()
+                stub.invoke_cache.clear()
+
+    async def schedule_stub_interaction(self, msg, action):
+        """Hand an INIT/TRANSACTION message to the scheduler (answering it with an error if the handler is draining),
+        then apply flow control"""
+        if self.draining:
+            self.refused += 1
+            err_msg = '%s Chaincode is shutting down, transaction refused' \
+                      % generate_logging_prefix(msg.channel_id, msg.txid)
+            LOGGER.warning(err_msg)
+            self.run_in_background(self._send_error_completed(msg, err_msg))
+            return
+        self.scheduler.submit(msg.channel_id, msg, action)
+        await self.pause_reads()
+
+    async def pause_reads(self):
+        """Stop reading the peer stream while a channel queue of the scheduler is full.
+
+        The peer then stops sending once the HTTP/2 flow control window is used up. Replies share the stream with
+        new transactions, so reads resume as soon as a request of a running transaction is sent: the reply may be
+        queued behind more transactions, which are accepted above `max_pending_tx` meanwhile.
+        """
+        if not self.scheduler.is_saturated() or self.msg_queue_handler.awaiting_replies():
+            return
+        self.read_pauses += 1
+        LOGGER.debug('Transaction queue full, pausing the reads of the peer stream')
+        while self.scheduler.is_saturated() and not self.msg_queue_handler.awaiting_replies():
+            self._flow.clear()
+            await self._flow.wait()
+
+    def flow_changed(self):
+        """Wake a reader paused by pause_reads() so it checks again"""
+        self._flow.set()
+
+    def run_in_background(self, coro):
+        """Run a write (or any coroutine) without making the stream reader wait for it, failures are logged"""
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+
+    def _background_done(self, task):
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            LOGGER.warning('Writing to the peer failed: %s', task.exception())
+
+    async def _send_error_completed(self, msg, err_msg):
+        """Answer an INIT/TRANSACTION message that was not run with an error COMPLETED message"""
+        resp = pr_pb.Response(status=ResponseCode.ERROR, message=err_msg)
+        await self.write_message(ccshim_pb2.ChaincodeMessage(
+            type=ccshim_pb2.ChaincodeMessage.COMPLETED,
+            payload=resp.SerializeToString(),
+            txid=msg.txid,
+            channel_id=msg.channel_id
+        ))
+
+    async def drain(self, timeout: float = DEFAULT_DRAIN_TIMEOUT) -> dict:
+        """Stop accepting transactions and wait (at most `timeout` seconds) for the in-flight ones to complete.
+
+        Transactions received from now on are answered with an error. When the timeout expires the queued
+        transactions are answered with an error and the running ones are cancelled, each still sends its COMPLETED
+        message. Returns counts of what happened to the transactions: in_flight (running or queued when the drain
+        started), finished, aborted, dropped (queued, never run) and refused (received while draining).
+        """
+        started = time.perf_counter()
+        self.draining = True
+        report = {'in_flight': 0, 'finished': 0, 'aborted': 0, 'dropped': 0}
+        scheduler = self.scheduler
+        if scheduler is not None:
+            report['in_flight'] = scheduler.running + scheduler.pending
+            if not await scheduler.wait_idle(timeout):
+                dropped = scheduler.drop_pending()
+                report['dropped'] = len(dropped)
+                for msg, _ in dropped:
+                    try:
+                        await self._send_error_completed(
+                            msg, '%s Chaincode is shutting down, transaction dropped before it ran'
+                                 % generate_logging_prefix(msg.channel_id, msg.txid))
+                    except Exception as e:
+                        LOGGER.warning('Could not answer a dropped transaction: %s', e)
+                self._aborting = True
+                report['aborted'] = scheduler.running
+                for task in list(self._calls):
+                    task.cancel()
+                await scheduler.wait_idle(DRAIN_ABORT_GRACE)
+            report['finished'] = report['in_flight'] - report['aborted'] - report['dropped']
+        report['refused'] = self.refused
+        report['seconds'] = time.perf_counter() - started
+        LOGGER.debug('Drained %(in_flight)d in-flight transactions in %(seconds).2fs: %(finished)d finished, '
+                    '%(aborted)d aborted, %(dropped)d dropped, %(refused)d refused', report)
+        return report
 
     async def handle_message_ready(self, msg):
         """handle_message_ready handles messages received from the peer when the handler is in the "ready" state."""
         if msg.type == ccshim_pb2.ChaincodeMessage.RESPONSE or msg.type == ccshim_pb2.ChaincodeMessage.ERROR:
-            LOGGER.info("+++ ERROR or RESPONSE +++")
-            await self.msg_queue_handler.handle_msg_response(msg)
+            self.msg_queue_handler.handle_msg_response(msg)
         elif msg.type == ccshim_pb2.ChaincodeMessage.INIT:
-            LOGGER.info("+++ call INIT +++")
-            await self.handle_stub_interaction(msg, "Init")
+            await self.schedule_stub_interaction(msg, "Init")
             return
         elif msg.type == ccshim_pb2.ChaincodeMessage.TRANSACTION:
-            LOGGER.info("+++ call INVOKE +++")
-            await self.handle_stub_interaction(msg, "Invoke")
+            await self.schedule_stub_interaction(msg, "Invoke")
             return
         else:
-            self.context.write(new_error_msg(msg, STATE))
+            self.run_in_background(self.write_message(new_error_msg(msg, self.state)))
 
-    def handle_message_established(self, msg):
+    async def handle_message_established(self, msg):
         """
         handle_message_established handles messages received from the peer when the handler is in the "established" state.
         """
-        global STATE
         if msg.type != ccshim_pb2.ChaincodeMessage.READY:
             # context.abort()
-            LOGGER.error(f'Chaincode is in "ready" state, can only process messages of type "established", '
+            LOGGER.error(f'Chaincode is in "established" state, can only process messages of type "ready", '
                          f'but received "{msg.type}"')
-            self.context.write(new_error_msg(msg, STATE))
+            self.run_in_background(self.write_message(new_error_msg(msg, self.state)))
         else:
             LOGGER.info('Successfully established communication with peer node. State transferred to "ready"')
-            STATE = STATES.READY
+            self.state = STATES.READY
 
-    def handle_message_created(self, msg):
+    async def handle_message_created(self, msg):
         """handle_message_created handles messages received from the peer when the handler is in the "created" state."""
-        global STATE
         if msg.type != ccshim_pb2.ChaincodeMessage.REGISTERED:
             # can not process any message other than "registered"
             # from the peer when in "created" state
             # send an error message telling the peer about this
             LOGGER.error(f'Chaincode is in "created" state, can only process messages of type "registered", '
                          f'but received "{msg.type}"')
-            self.context.write(new_error_msg(msg, STATE))
+            self.run_in_background(self.write_message(new_error_msg(msg, self.state)))
         else:
             LOGGER.info('Successfully registered with peer node. State transferred to "established"')
-            STATE = STATES.ESTABLISHED
+            self.peer_params = self._parse_peer_params(msg.payload)
+            self.state = STATES.ESTABLISHED
 
     async def handle_message(self, msg: ccshim_pb2.ChaincodeMessage):
         """handle_message message handles loop for shim side of chaincode/peer stream."""
-        LOGGER.warning('-->> Look out!')
-        global STATE
-
-        # TODO: ?
         if msg.type == ccshim_pb2.ChaincodeMessage.KEEPALIVE:
-            LOGGER.info('-| KEEPALIVE')
-            return self.serial_send_async(msg)
+            LOGGER.debug('Received KEEPALIVE')
+            # echo it, the peer uses the reply to check that the chaincode is alive
+            return self.run_in_background(self.write_message(msg))
 
-        if STATE == STATES.READY:
+        if self.state == STATES.READY:
             await self.handle_message_ready(msg)
-        elif STATE == STATES.ESTABLISHED:
-            self.handle_message_established(msg)
-        elif STATE == STATES.CREATED:
-            self.handle_message_created(msg)
+        elif self.state == STATES.ESTABLISHED:
+            await self.handle_message_established(msg)
+        elif self.state == STATES.CREATED:
+            await self.handle_message_created(msg)
         else:
-            self.context.write(new_error_msg(msg, STATE))
+            self.run_in_background(self.write_message(new_error_msg(msg, self.state)))
 
     async def chat_with_peer(self, stream: AsyncIterable[ccshim_pb2.ChaincodeMessage], context: grpc.aio.ServicerContext):
         """chat stream for peer-chaincode interactions post connection"""
-        global STATE
-        STATE = STATES.CREATED
+        self.state = STATES.CREATED
 
         self.context = context
-        self.msg_queue_handler = MsgQueueHandler(self)
+        if self.scheduler is None:
+            self.msg_queue_handler = MsgQueueHandler(self)
+            self.scheduler = TxScheduler(self.handle_stub_interaction, self.max_concurrent_tx, self.max_pending_tx,
+                                         on_room=self.flow_changed)
 
         # Send the ChaincodeID during register.
         cm = ccshim_pb2.ChaincodeMessage(
@@ -179,22 +363,49 @@ class Handler:
         cm.timestamp.FromDatetime(datetime.datetime.now())
 
         # Register on the stream
-        await self.context.write(cm)
-
-        async for receive_message in stream:
-            LOGGER.info('Received message')
-            if receive_message is None:
-                err_str = "received nil message, ending chaincode stream"
-                LOGGER.error(err_str)
-                return ccshim_pb2.ChaincodeMessage(
-                    type=ccshim_pb2.ChaincodeMessage.ERROR, payload=err_str.encode(encoding='utf-8'))
-            else:
-                asyncio.create_task(self.handle_message(receive_message))
-
-                LOGGER.info(f'->>>>  proposal  {receive_message.proposal}')
-                LOGGER.info(f'->>>>  payload  {receive_message.payload}')
-                LOGGER.info(f'->>>>  channel ID  {receive_message.channel_id}')
-                LOGGER.info(f'->>>>  Tx ID  {receive_message.txid}')
+        await self.write_message(cm)
+
+        METRICS.add_source(self)
+        try:
+            async for receive_message in stream:
+                if receive_message is None:
+                    err_str = "received nil message, ending chaincode stream"
+                    LOGGER.error(err_str)
+                    return ccshim_pb2.ChaincodeMessage(
+                        type=ccshim_pb2.ChaincodeMessage.ERROR, payload=err_str.encode(encoding='utf-8'))
+                else:
+                    if LOGGER.isEnabledFor(logging.DEBUG) and self._log_sampler.sample():
+                        LOGGER.debug('%s Received message type %s, payload %s',
+                                     generate_logging_prefix(receive_message.channel_id, receive_message.txid),
+                                     receive_message.type, Redacted(receive_message.payload))
+
+                    # the reader never writes to the stream: replies resolve the waiting requests, transactions
+                    # are handed to the scheduler, and it only waits when flow control pauses the reads
+                    await self.handle_message(receive_message)
+        finally:
+            # the peer forgets the transactions of a closed stream, nobody is left to answer them: they are
+            # cancelled even when a new stream follows (see ChaincodeClient), the peer would ignore their COMPLETED
+            self.scheduler.cancel_all()
+            METRICS.remove_source(self)
+
+    def collect_metrics(self):
+        """Gauge samples of this peer stream, summed across streams by the metrics registry"""
+        queue_stats = self.msg_queue_handler.stats()
+        return {
+            'running': self.scheduler.running,
+            'pending': self.scheduler.pending,
+            'live': queue_stats['live'],
+            'leaked': queue_stats['leaked'],
+            'requests': queue_stats['pending_requests'],
+        }
+
+    async def write_message(self, msg: ccshim_pb2.ChaincodeMessage):
+        """Write a message to the peer stream, concurrent writers are serialized in call order"""
+        async with self._write_lock:
+            if self.compression_threshold and msg.ByteSize() < self.compression_threshold \
+                    and hasattr(self.context, 'disable_next_message_compression'):
+                self.context.disable_next_message_compression()
+            await self.context.write(msg)
 
     async def handle_get_state(self, collection, key, channel_id, tx_id):
         msg_pb = ccshim_pb2.GetState()
@@ -209,7 +420,88 @@ class Handler:
 
         result = await self.__ask_peer_and_listen(msg, 'GetState')
         return result.payload
-    
+
+    def peer_supports_get_multiple(self) -> bool:
+        return bool(self.peer_params and self.peer_params.use_get_multiple_keys
+                    and hasattr(ccshim_pb2.ChaincodeMessage, 'GET_STATE_MULTIPLE'))
+
+    async def handle_get_state_multiple(self, collection, keys, channel_id, tx_id):
+        """Read several keys with GET_STATE_MULTIPLE messages (chunked by the peer's max_size_get_multiple_keys),
+        the values are returned in the order of `keys`"""
+        values = []
+        max_size = self.peer_params.max_size_get_multiple_keys or len(keys)
+        for start in range(0, len(keys), max_size):
+            msg_pb = ccshim_pb2.GetStateMultiple()
+            msg_pb.keys.extend(keys[start:start + max_size])
+            msg_pb.collection = collection
+            msg = ccshim_pb2.ChaincodeMessage(
+                type=ccshim_pb2.ChaincodeMessage.GET_STATE_MULTIPLE,
+                payload=msg_pb.SerializeToString(),
+                txid=tx_id,
+                channel_id=channel_id
+            )
+            result = await self.__ask_peer_and_listen(msg, 'GetStateMultiple')
+            if result.type == ccshim_pb2.ChaincodeMessage.ERROR:
+                raise Exception('GetStateMultiple failed: %s' % result.payload.decode(errors='replace'))
+            values.extend(ccshim_pb2.GetStateMultipleResult.FromString(result.payload).values)
+        return values
+
+    async def handle_get_state_by_range(self, collection, start_key, end_key, channel_id, tx_id, metadata=None):
+        """Start a range query, returns the first QueryResponse page"""
+        msg_pb = ccshim_pb2.GetStateByRange()
+        msg_pb.startKey = start_key
+        msg_pb.endKey = end_key
+        msg_pb.collection = collection
+        if metadata:
+            msg_pb.metadata = metadata
+        msg = ccshim_pb2.ChaincodeMessage(
+            type=ccshim_pb2.ChaincodeMessage.GET_STATE_BY_RANGE,
+            payload=msg_pb.SerializeToString(),
+            txid=tx_id,
+            channel_id=channel_id
+        )
+        return await self.__ask_peer_for_query_response(msg, 'GetStateByRange')
+
+    async def handle_get_history_for_key(self, key, channel_id, tx_id):
+        """Start a history query, returns the first QueryResponse page"""
+        msg_pb = ccshim_pb2.GetHistoryForKey()
+        msg_pb.key = key
+        msg = ccshim_pb2.ChaincodeMessage(
+            type=ccshim_pb2.ChaincodeMessage.GET_HISTORY_FOR_KEY,
+            payload=msg_pb.SerializeToString(),
+            txid=tx_id,
+            channel_id=channel_id
+        )
+        return await self.__ask_peer_for_query_response(msg, 'GetHistoryForKey')
+
+    async def handle_query_state_next(self, query_id, channel_id, tx_id):
+        msg_pb = ccshim_pb2.QueryStateNext()
+        msg_pb.id = query_id
+        msg = ccshim_pb2.ChaincodeMessage(
+            type=ccshim_pb2.ChaincodeMessage.QUERY_STATE_NEXT,
+            payload=msg_pb.SerializeToString(),
+            txid=tx_id,
+            channel_id=channel_id
+        )
+        return await self.__ask_peer_for_query_response(msg, 'QueryStateNext')
+
+    async def handle_query_state_close(self, query_id, channel_id, tx_id):
+        msg_pb = ccshim_pb2.QueryStateClose()
+        msg_pb.id = query_id
+        msg = ccshim_pb2.ChaincodeMessage(
+            type=ccshim_pb2.ChaincodeMessage.QUERY_STATE_CLOSE,
+            payload=msg_pb.SerializeToString(),
+            txid=tx_id,
+            channel_id=channel_id
+        )
+        return await self.__ask_peer_for_query_response(msg, 'QueryStateClose')
+
+    async def __ask_peer_for_query_response(self, msg, action):
+        result = await self.__ask_peer_and_listen(msg, action)
+        if result.type == ccshim_pb2.ChaincodeMessage.ERROR:
+            raise Exception('%s failed: %s' % (action, result.payload.decode(errors='replace')))
+        return ccshim_pb2.QueryResponse.FromString(result.payload)
+
     async def handle_put_state(self, collection, key, value, channel_id, tx_id):
         msg_pb = ccshim_pb2.PutState()
         msg_pb.key = key
@@ -234,12 +526,205 @@ class Handler:
             channel_id=channel_id
         )
         return await self.__ask_peer_and_listen(msg, 'DeleteState')
+
+    async def handle_purge_private_data(self, collection, key, channel_id, tx_id):
+        if not hasattr(ccshim_pb2.ChaincodeMessage, 'PURGE_PRIVATE_DATA'):
+            raise Exception('purging private data needs fabric-protos with PURGE_PRIVATE_DATA (Fabric 2.5+)')
+        msg_pb = ccshim_pb2.DelState()
+        msg_pb.key = key
+        msg_pb.collection = collection
+        msg = ccshim_pb2.ChaincodeMessage(
+            type=ccshim_pb2.ChaincodeMessage.PURGE_PRIVATE_DATA,
+            payload=msg_pb.SerializeToString(),
+            txid=tx_id,
+            channel_id=channel_id
+        )
+        result = await self.__ask_peer_and_listen(msg, 'PurgePrivateData')
+        self._check_write_result(result, key)
+
+    async def handle_get_private_data_hash(self, collection, key, channel_id, tx_id):
+        """Get the hash of a private data value, the peer answers from its hashed state without the value"""
+        msg_pb = ccshim_pb2.GetState()
+        msg_pb.key = key
+        msg_pb.collection = collection
+        msg = ccshim_pb2.ChaincodeMessage(
+            type=ccshim_pb2.ChaincodeMessage.GET_PRIVATE_DATA_HASH,
+            payload=msg_pb.SerializeToString(),
+            txid=tx_id,
+            channel_id=channel_id
+        )
+        result = await self.__ask_peer_and_listen(msg, 'GetPrivateDataHash')
+        if result.type == ccshim_pb2.ChaincodeMessage.ERROR:
+            raise Exception('GetPrivateDataHash failed: %s' % result.payload.decode(errors='replace'))
+        return result.payload
+
+    async def handle_put_state_metadata(self, collection, key, metakey, value, channel_id, tx_id):
+        msg_pb = ccshim_pb2.PutStateMetadata()
+        msg_pb.key = key
+        msg_pb.collection = collection
+        msg_pb.metadata.metakey = metakey
+        msg_pb.metadata.value = value
+        msg = ccshim_pb2.ChaincodeMessage(
+            type=ccshim_pb2.ChaincodeMessage.PUT_STATE_METADATA,
+            payload=msg_pb.SerializeToString(),
+            txid=tx_id,
+            channel_id=channel_id
+        )
+        result = await self.__ask_peer_and_listen(msg, 'PutStateMetadata')
+        self._check_write_result(result, key)
+
+    async def handle_get_state_metadata(self, collection, key, channel_id, tx_id):
+        """Get the metadata of a key as a {metakey: value} dict"""
+        msg_pb = ccshim_pb2.GetStateMetadata()
+        msg_pb.key = key
+        msg_pb.collection = collection
+        msg = ccshim_pb2.ChaincodeMessage(
+            type=ccshim_pb2.ChaincodeMessage.GET_STATE_METADATA,
+            payload=msg_pb.SerializeToString(),
+            txid=tx_id,
+            channel_id=channel_id
+        )
+        result = await self.__ask_peer_and_listen(msg, 'GetStateMetadata')
+        if result.type == ccshim_pb2.ChaincodeMessage.ERROR:
+            raise Exception('GetStateMetadata failed: %s' % result.payload.decode(errors='replace'))
+        entries = ccshim_pb2.StateMetadataResult.FromString(result.payload).entries
+        return {entry.metakey: entry.value for entry in entries}
+
+    async def handle_get_query_result(self, collection, query, channel_id, tx_id, metadata=None):
+        """Start a rich query, returns the first QueryResponse page"""
+        msg_pb = ccshim_pb2.GetQueryResult()
+        msg_pb.query = query
+        msg_pb.collection = collection
+        if metadata:
+            msg_pb.metadata = metadata
+        msg = ccshim_pb2.ChaincodeMessage(
+            type=ccshim_pb2.ChaincodeMessage.GET_QUERY_RESULT,
+            payload=msg_pb.SerializeToString(),
+            txid=tx_id,
+            channel_id=channel_id
+        )
+        return await self.__ask_peer_for_query_response(msg, 'GetQueryResult')
     
-    async def __ask_peer_and_listen(self, msg, action):
+    async def handle_invoke_chaincode(self, chaincode_name, args, channel_id, tx_id, timeout: float = None):
+        """Invoke another chaincode within the transaction, returns its Response
+
+        `chaincode_name` is "name" or "name/channel". The callee runs in the same transaction simulation, so a call
+        that outlives `timeout` fails the whole transaction (see __ask_peer_and_listen) rather than leaving a callee
+        that may still write.
+        """
+        spec = cc_pb2.ChaincodeSpec()
+        spec.chaincode_id.name = chaincode_name
+        spec.input.args.extend(args)
+        msg = ccshim_pb2.ChaincodeMessage(
+            type=ccshim_pb2.ChaincodeMessage.INVOKE_CHAINCODE,
+            payload=spec.SerializeToString(),
+            txid=tx_id,
+            channel_id=channel_id
+        )
+        result = await self.__ask_peer_and_listen(msg, 'InvokeChaincode', timeout)
+        if result.type == ccshim_pb2.ChaincodeMessage.ERROR:
+            raise Exception('InvokeChaincode %s failed: %s' % (chaincode_name, result.payload.decode(errors='replace')))
+        # the RESPONSE carries the callee's own COMPLETED (or ERROR) message
+        callee_msg = ccshim_pb2.ChaincodeMessage.FromString(result.payload)
+        if callee_msg.type != ccshim_pb2.ChaincodeMessage.COMPLETED:
+            raise Exception('InvokeChaincode %s failed: %s'
+                            % (chaincode_name, callee_msg.payload.decode(errors='replace')))
+        return pr_pb.Response.FromString(callee_msg.payload)
+
+    @staticmethod
+    def _parse_peer_params(payload):
+        """Decode the ChaincodeAdditionalParams sent by peers that support batched state messages
+
+        Peers that predate them (and fabric-protos builds without the message) send an empty REGISTERED payload:
+        peer_params stays None and write batching and GET_STATE_MULTIPLE are inert, every key gets its own message.
+        """
+        params_cls = getattr(cc_pb2, 'ChaincodeAdditionalParams', None)
+        if params_cls is None or not payload:
+            return None
+        try:
+            return params_cls.FromString(payload)
+        except Exception as e:
+            LOGGER.warning('Could not decode the REGISTERED payload, state batching disabled: %s', e)
+            return None
+
+    def peer_supports_write_batch(self) -> bool:
+        return bool(self.peer_params and self.peer_params.use_write_batch
+                    and hasattr(ccshim_pb2.ChaincodeMessage, 'WRITE_BATCH_STATE'))
+
+    async def handle_write_batch(self, records, channel_id, tx_id):
+        """Send a buffered write set as WRITE_BATCH_STATE messages.
+
+        Peers that do not advertise write batching get one PUT_STATE/DEL_STATE message per record instead.
+        `records` is a list of (op, collection, key, value) tuples.
+        """
+        if not self.peer_supports_write_batch():
+            for op, collection, key, value in records:
+                if op == WriteOp.PUT:
+                    result = await self.handle_put_state(collection, key, value, channel_id, tx_id)
+                else:
+                    result = await self.handle_delete_state(collection, key, channel_id, tx_id)
+                self._check_write_result(result, key)
+            return
+
+        max_size = self.peer_params.max_size_write_batch or len(records)
+        for start in range(0, len(records), max_size):
+            batch_pb = ccshim_pb2.WriteBatchState()
+            for op, collection, key, value in records[start:start + max_size]:
+                record = batch_pb.rec.add()
+                record.key = key
+                record.collection = collection
+                if op == WriteOp.PUT:
+                    record.type = ccshim_pb2.WriteRecord.PUT_STATE
+                    record.value = value
+                else:
+                    record.type = ccshim_pb2.WriteRecord.DEL_STATE
+            msg = ccshim_pb2.ChaincodeMessage(
+                type=ccshim_pb2.ChaincodeMessage.WRITE_BATCH_STATE,
+                payload=batch_pb.SerializeToString(),
+                txid=tx_id,
+                channel_id=channel_id
+            )
+            result = await self.__ask_peer_and_listen(msg, 'WriteBatchState')
+            self._check_write_result(result, '%d keys' % len(batch_pb.rec))
+
+    @staticmethod
+    def _check_write_result(result, what):
+        if result.type == ccshim_pb2.ChaincodeMessage.ERROR:
+            raise Exception('peer rejected the write of %s: %s' % (what, result.payload.decode(errors='replace')))
+
+    async def __ask_peer_and_listen(self, msg, action, timeout: float = None):
+        """Send a request of a transaction and wait for the peer's reply, at most `timeout` seconds (the handler's
+        request_timeout by default, 0 to wait forever)
+
+        The deadline starts when the request is written to the stream: the time it waits behind the other requests
+        of the transaction (see MsgQueueHandler) does not count.
+        """
+        timeout = self.request_timeout if timeout is None else timeout or None
         loop = asyncio.get_running_loop()
         fut = loop.create_future()
 
         message = QueueMessage(msg, action, fut)
         await self.msg_queue_handler.queue_msg(message)
 
-        return await fut
+        try:
+            if not message.sent.done():
+                # resolved as well when the request fails before it is sent
+                await asyncio.wait((fut, message.sent), return_when=asyncio.FIRST_COMPLETED)
+            result = await asyncio.wait_for(fut, timeout)
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except asyncio.TimeoutError:
+            if METRICS.enabled:
+                METRICS.peer_errors.inc(action)
+            err = '%s %s got no reply from the peer within %ss' \
+                  % (generate_logging_prefix(msg.channel_id, msg.txid), action, timeout)
+            LOGGER.error(err)
+            # a late reply could be matched to the next request of the transaction, so fail all of them
+            self.msg_queue_handler.fail_tx(msg.channel_id, msg.txid, err)
+            raise Exception(err)
+        if METRICS.enabled and message.sent_at is not None:
+            METRICS.peer_round_trip.observe(time.perf_counter() - message.sent_at, action)
+            if result.type == ccshim_pb2.ChaincodeMessage.ERROR:
+                METRICS.peer_errors.inc(action)
+        return result
@@ -0,0 +1,88 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Streaming aggregations over the history of a key
+#
+# The helpers take the iterator returned by stub.get_history_for_key() and consume it one KeyModification at a time,
+# so their memory does not grow with the length of the history. The peer returns the history newest first: helpers
+# that only need recent entries stop early and close the iterator, sparing the peer the remaining pages.
+#
+# Typical usage example:
+#     history = await stub.get_history_for_key('asset1')
+#     async for window in windowed_counts(history, 3600):
+#         print(window.start, window.count)
+
+from collections import namedtuple
+
+
+Window = namedtuple('Window', ['start', 'count', 'deletes'])
+
+
+def modification_time(modification) -> float:
+    """Timestamp of a KeyModification in seconds since the epoch"""
+    timestamp = modification.timestamp
+    return timestamp.seconds + timestamp.nanos / 1e9
+
+
+async def latest_modifications(history, n: int):
+    """Return the `n` most recent modifications, newest first, without fetching the older pages"""
+    latest = []
+    if n <= 0:
+        await history.close()
+        return latest
+    async for modification in history:
+        latest.append(modification)
+        if len(latest) >= n:
+            break
+    await history.close()
+    return latest
+
+
+async def modifications_since(history, since: float):
+    """Yield the modifications made at or after `since` (seconds since the epoch), newest first"""
+    try:
+        async for modification in history:
+            if modification_time(modification) < since:
+                return
+            yield modification
+    finally:
+        await history.close()
+
+
+async def count_modifications(history, since: float = None) -> int:
+    """Count the modifications of the history, only those made at or after `since` when it is given"""
+    count = 0
+    if since is None:
+        async for _ in history:
+            count += 1
+    else:
+        async for _ in modifications_since(history, since):
+            count += 1
+    return count
+
+
+async def windowed_counts(history, window: float):
+    """Yield a Window(start, count, deletes) per time window of `window` seconds that has modifications
+
+    Windows are aligned on multiples of `window` since the epoch and yielded in the order of the history (newest
+    first). Only the current window is held in memory.
+    """
+    if window <= 0:
+        raise Exception('window must be a positive number of seconds')
+    start = None
+    count = deletes = 0
+    try:
+        async for modification in history:
+            modification_start = modification_time(modification) // window * window
+            if modification_start != start:
+                if start is not None:
+                    yield Window(start, count, deletes)
+                start, count, deletes = modification_start, 0, 0
+            count += 1
+            if modification.is_delete:
+                deletes += 1
+        if start is not None:
+            yield Window(start, count, deletes)
+    finally:
+        await history.close()
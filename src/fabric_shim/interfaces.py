@@ -14,6 +14,15 @@ class ChaincodeStubInterface(ABC):
     def get_function_and_parameters(self):  # Get the chaincode calling method name and parameter list
         pass
 
+    def get_args(self):  # Get the raw (bytes) args of the chaincode calling transaction, the function name first
+        pass
+
+    def get_function(self):  # Get the chaincode calling method name without decoding the parameters
+        pass
+
+    def get_string_args(self):  # Get the args of the chaincode calling transaction decoded as str
+        pass
+
     def get_txid(self):  # Get the ID of the chaincode calling transaction
         pass
 
@@ -39,6 +48,9 @@ class ChaincodeStubInterface(ABC):
             If the key does not exist in the state database, (nil, nil) is returned.
         """
 
+    def get_states(self, keys):  # Get the state of several keys on the ledger in a single call
+        pass
+
     def put_state(self, key: str, value):  # update the state of the specified key on the ledger
         pass
 
@@ -51,69 +63,97 @@ class ChaincodeStubInterface(ABC):
     def get_state_validation_parameter(self):  # Get state validation parameters
         pass
 
-    def get_state_by_range(self):  # Get the state of the keys in the specified range on the ledger
+    # Get the state of the keys in the specified range on the ledger
+    def get_state_by_range(self, start_key: str, end_key: str):
         pass
 
-    def get_state_by_range_with_pagination(
-            self):  # Pagination to get the state of the keys in the specified range on the ledger
+    # Pagination to get the state of the keys in the specified range on the ledger
+    def get_state_by_range_with_pagination(self, start_key: str, end_key: str, page_size: int, bookmark: str = ''):
         pass
 
-    def get_query_result(self):  # Get the node rich query result, which is only valid when couchdb is used
+    # Get the node rich query result, which is only valid when couchdb is used
+    def get_query_result(self, query: str, decode=None):
         pass
 
-    def get_query_result_with_pagination(self):  # Pagination to get node rich query results
+    # Pagination to get node rich query results
+    def get_query_result_with_pagination(self, query: str, page_size: int, bookmark: str = '', decode=None):
         pass
 
-    def get_history_for_key(self):  # Get the update history of the specified key on the ledger
+    def get_history_for_key(self, key: str):  # Get the update history of the specified key on the ledger
         pass
 
-    def invoke_chaincode(self):  # Invoke other chaincodes
+    # Invoke another chaincode in the context of this transaction
+    def invoke_chaincode(self, chaincode_name: str, args, channel: str = ''):
+        pass
+
+    def invoke_chaincodes(self, calls):  # Invoke several other chaincodes, one after the other
         pass
 
     def set_event(self):  # trigger chaincode event
         pass
 
-    def create_composite_key(self):  # Create a composite key
+    def create_composite_key(self, object_type, attributes):  # Create a composite key
         pass
 
     # split composite key, return composite key type and composition attribute value
-    def split_composite_key(self):
+    def split_composite_key(self, composite_key):
         pass
 
-    def get_state_by_partial_composite_key(self):  # Query the ledger state using a partial composite key
+    # Query the ledger state using a partial composite key
+    def get_state_by_partial_composite_key(self, object_type, attributes):
         pass
 
     # Use partial composite key pagination to query ledger state
-    def get_state_by_partial_composite_key_with_pagination(self):
+    def get_state_by_partial_composite_key_with_pagination(self, object_type, attributes, page_size: int,
+                                                           bookmark: str = ''):
+        pass
+
+    # Get the state of the specified key in the specified private dataset
+    def get_private_data(self, collection: str, key: str):
+        pass
+
+    # Get the state of several keys in the specified private dataset in a single call
+    def get_private_data_multiple(self, collection: str, keys):
+        pass
+
+    # Get the state hash of the specified key in the specified private dataset
+    def get_private_data_hash(self, collection: str, key: str):
         pass
 
-    def get_private_data(self):  # Get the status of the specified key in the specified private dataset
+    # Check that the specified key exists in the specified private dataset without reading its value
+    def has_private_data(self, collection: str, key: str):
         pass
 
-    def get_private_data_hash(self):  # Get the state hash of the specified key in the specified private dataset
+    # Update the state of the specified key in the specified private dataset
+    def put_private_data(self, collection: str, key: str, value):
         pass
 
-    def put_private_data(self):  # Update the state of the specified key in the specified private dataset
+    # delete the specified key in the specified private data set
+    def delete_private_data(self, collection: str, key: str):
         pass
 
-    def delete_private_data(self):  # delete the specified key in the specified private data set
+    # delete the specified key in the specified private data set and purge its history
+    def purge_private_data(self, collection: str, key: str):
         pass
 
-    def set_private_data_validation_parameter(self):  # Set validation parameters for private data
+    # Set validation parameters for private data
+    def set_private_data_validation_parameter(self, collection: str, key: str, ep: bytes):
         pass
 
-    def get_private_data_validation_parameter(self):  # Get the validation parameters for private data
+    # Get the validation parameters for private data
+    def get_private_data_validation_parameter(self, collection: str, key: str):
         pass
 
     # Get the status of the keys of the specified range in the specified private dataset
-    def get_private_data_by_range(self):
+    def get_private_data_by_range(self, collection: str, start_key: str, end_key: str):
         pass
 
-    def get_private_data_by_partial_composite_key(self):  # Query a private dataset with a partial composite key
+    # Query a private dataset with a partial composite key
+    def get_private_data_by_partial_composite_key(self, collection: str, object_type, attributes):
         pass
 
     # Get rich query results for private datasets, only valid when couchdb is enabled
-    def get_private_data_query_result(self):
+    def get_private_data_query_result(self, collection: str, query: str, decode=None):
         pass
 
 
@@ -4,31 +4,168 @@
 
 # Status and historical query result iterator implementation class
 import asyncio
+from collections import deque, namedtuple
+
+from fabric_protos_python.ledger.queryresult import kv_query_result_pb2 as kv_pb
+from src.fabric_shim.executor import run_cpu_bound
 
 
-# https://blog.finxter.com/python-__anext__-and-__aiter__-magic-methods/
 class CommonIterator:
-    """ Iterate over an asynchronous source. n Iterations."""
+    """Iterate over the results of a peer query, one page (QueryResponse) at a time.
+
+    Once iteration starts, each page that arrives triggers the request of the next one in the background
+    (QUERY_STATE_NEXT), so the caller does not wait between pages and at most two pages are held in memory. Nothing
+    is requested before the first result is asked for. Results are decoded only when they are yielded.
+
+    The server side iterator is closed (QUERY_STATE_CLOSE) when the results are exhausted, when `close()` is called
+    and when an `async with` block exits. An iterator left open, ex: by leaving an `async for` loop early, is closed
+    by the stub when the chaincode function returns, before the transaction completes.
+
+    Typical usage example:
+        async with await stub.get_state_by_range('asset1', 'asset9') as results:
+            async for kv in results:
+                print(kv.key, kv.value)
+    """
+
+    def __init__(self, handler, channel_id, tx_id, response):
+        self.handler = handler
+        self.channel_id = channel_id
+        self.tx_id = tx_id
+        self.response = response
+        self.closed = False
+        # background fetch of the page that follows self.response, started with the iteration
+        self._next_page = None
+        self._started = False
+        # the QUERY_STATE_CLOSE request, once sent
+        self._closing = None
+
+    def _start(self):
+        """Called when the first result is asked for"""
+        self._started = True
+        self._prefetch()
+
+    def _prefetch(self):
+        if self.response.has_more and not self.closed:
+            self._next_page = asyncio.ensure_future(self._fetch_page(self.response.id))
+
+    async def _fetch_page(self, query_id):
+        return await self.handler.handle_query_state_next(query_id, self.channel_id, self.tx_id)
 
-    def __init__(self, n):
-        self.current = 0
-        self.n = n
+    def _decode(self, result_bytes):
+        """Turn the bytes of one query result into the value yielded to the caller"""
+        return result_bytes
+
+    async def _page_items(self):
+        """The values yielded for the results of the current page"""
+        return (self._decode(result.resultBytes) for result in self.response.results)
 
     def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        if not self._started:
+            self._start()
+        try:
+            while not self.closed:
+                for item in await self._page_items():
+                    yield item
+                if self._next_page is None:
+                    return
+                next_page, self._next_page = self._next_page, None
+                self.response = await next_page
+                self._prefetch()
+        finally:
+            await self.close()
+
+    async def __aenter__(self):
         return self
 
-    async def __anext__(self):
-        await asyncio.sleep(1)
-        print(f"get next element {self.current}")
-        self.current += 1
-        if self.current > self.n:
-            raise StopAsyncIteration
-        return self.current - 1
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def release(self):
+        """Drop the local state without talking to the peer (the peer closes its iterators with the transaction)"""
+        self.closed = True
+        if self._next_page is not None:
+            self._next_page.cancel()
+            self._next_page = None
+
+    async def close(self):
+        """Close the iterator, and the server side iterator if the peer still has results for it
+
+        Every caller waits for the QUERY_STATE_CLOSE reply, also when the close was started by another one (ex: the
+        finalization of the generator of an `async for` loop that was left early).
+        """
+        if self._closing is None:
+            released = self.closed
+            self.release()
+            if released or not self.response.has_more:
+                return
+            self._closing = asyncio.ensure_future(
+                self.handler.handle_query_state_close(self.response.id, self.channel_id, self.tx_id))
+        await self._closing
+
+
+class StateQueryIterator(CommonIterator):
+    """Iterator over the KV results of a range or partial composite key query"""
+
+    def _decode(self, result_bytes):
+        return kv_pb.KV.FromString(result_bytes)
+
+
+# a rich query result whose value went through the `decode` function of the query
+DecodedKV = namedtuple('DecodedKV', ['key', 'value'])
+
+
+def decode_values(decode, values):
+    """Executor entry point: decode the values of one page"""
+    return [decode(value) for value in values]
+
+
+class QueryResultIterator(StateQueryIterator):
+    """Iterator over the results of a rich (CouchDB) query
+
+    With a `decode` function (ex: json.loads or a Model's from_bytes) the values of each page are decoded in the
+    chaincode executor, off the event loop, as soon as the page arrives: once iteration starts, the next page is
+    fetched and decoded while the caller consumes the current one. DecodedKV(key, value) tuples are yielded instead
+    of KVs. The process executor needs a picklable `decode`.
+    """
+
+    def __init__(self, handler, channel_id, tx_id, response, decode=None):
+        self.decode = decode
+        # decoding of the current page and of the prefetched one, in page order
+        self._decoded_pages = deque()
+        super().__init__(handler, channel_id, tx_id, response)
+
+    def _start(self):
+        if self.decode is not None:
+            self._decoded_pages.append(asyncio.ensure_future(self._decode_page(self.response)))
+        super()._start()
+
+    async def _decode_page(self, response):
+        kvs = [kv_pb.KV.FromString(result.resultBytes) for result in response.results]
+        values = await run_cpu_bound(decode_values, self.decode, [kv.value for kv in kvs])
+        return [DecodedKV(kv.key, value) for kv, value in zip(kvs, values)]
+
+    async def _fetch_page(self, query_id):
+        response = await super()._fetch_page(query_id)
+        if self.decode is not None and not self.closed:
+            self._decoded_pages.append(asyncio.ensure_future(self._decode_page(response)))
+        return response
+
+    async def _page_items(self):
+        if self.decode is None:
+            return await super()._page_items()
+        return await self._decoded_pages.popleft()
 
+    def release(self):
+        super().release()
+        while self._decoded_pages:
+            self._decoded_pages.popleft().cancel()
 
-async def main():
-    async for i in CommonIterator(3):
-        print(f"next element {i}")
 
+class HistoryQueryIterator(CommonIterator):
+    """Iterator over the KeyModification entries of a key's history, newest first"""
 
-asyncio.run(main())
+    def _decode(self, result_bytes):
+        return kv_pb.KeyModification.FromString(result_bytes)
@@ -1,13 +1,13 @@
-# logging.py
-
 # Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
 # contributors. All rights reserved.
 # SPDX-License-Identifier: Apache-2.0
 
 import asyncio
+import atexit
 import logging
 import logging.config
 import logging.handlers
+import os
 
 try:
     # Python 3.7 and newer, fast reentrant implementation
@@ -17,7 +17,66 @@ except ImportError:
     from queue import Queue
 from typing import List
 
-LOGGER = logging.getLogger("asyncio")
+# the shim logs to its own logger, the root logger is left to the application
+LOGGER = logging.getLogger("fabric_shim")
+LOG_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+
+
+class LogMode:
+    """
+    DEBUG constant - everything is logged at DEBUG level, payloads are shown truncated to `payload_limit` bytes.
+
+    PRODUCTION constant - WARNING level, payloads are reduced to their size, per message logs are sampled.
+    """
+    DEBUG, PRODUCTION = 'debug', 'production'
+
+
+class LogSettings:
+    mode = LogMode.PRODUCTION
+    # bytes of a payload shown in the logs, 0 shows the size only
+    payload_limit = 0
+    # log one per-message record out of `sample_every`
+    sample_every = 100
+
+
+class Redacted:
+    """Log argument standing for a payload: only formatted (and truncated) if the record is actually emitted"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value) -> None:
+        self.value = value
+
+    def __str__(self):
+        value = self.value
+        if value is None:
+            return 'None'
+        size = len(value)
+        limit = LogSettings.payload_limit
+        if not limit:
+            return '<%d bytes>' % size
+        if size <= limit:
+            return repr(value)
+        return '%r...<%d bytes>' % (value[:limit], size)
+
+    __repr__ = __str__
+
+
+class LogSampler:
+    """Lets one call out of `LogSettings.sample_every` through, for logs written on every message"""
+
+    def __init__(self) -> None:
+        self._count = 0
+
+    def sample(self) -> bool:
+        every = LogSettings.sample_every
+        if every <= 1:
+            return True
+        self._count += 1
+        if self._count >= every:
+            self._count = 0
+            return True
+        return False
 
 
 class LocalQueueHandler(logging.handlers.QueueHandler):
@@ -36,32 +95,86 @@ class LocalQueueHandler(logging.handlers.QueueHandler):
             self.handleError(record)
 
 
-def setup_logging_queue() -> List[logging.Handler]:
-    """Move log handlers to a separate thread.
+_listener = None
+
 
-    Replace handlers on the root logger with a LocalQueueHandler,
-    and start a logging.QueueListener holding the original
-    handlers.
+def setup_logging_queue(handlers: List[logging.Handler] = None) -> List[logging.Handler]:
+    """Move the handlers of the shim logger to a separate thread.
+
+    The shim logger (LOGGER) gets a LocalQueueHandler, and a logging.QueueListener thread runs `handlers` (a stderr
+    StreamHandler by default). The listener runs until the interpreter exits. The shim logger stops propagating to
+    the root logger, whose configuration is left to the application.
 
     """
+    global _listener
     queue = Queue()
-    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s %(message)s')
-
-    handlers: List[logging.Handler] = []
+    if handlers is None:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers = [stream_handler]
 
-    handler = LocalQueueHandler(queue)
-    LOGGER.addHandler(handler)
     for h in LOGGER.handlers[:]:
-        if h is not handler:
+        if isinstance(h, LocalQueueHandler):
             LOGGER.removeHandler(h)
-            handlers.append(h)
+    LOGGER.addHandler(LocalQueueHandler(queue))
+    LOGGER.propagate = False
 
-    listener = logging.handlers.QueueListener(
+    if _listener is not None:
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(
         queue, *handlers, respect_handler_level=True
     )
-    listener.start()
-    listener.stop()
+    _listener.start()
+    return handlers
+
+
+def _restart_listener_in_child():
+    # the listener thread does not survive a fork (worker processes), start one for the child
+    global _listener
+    if _listener is not None:
+        _listener = logging.handlers.QueueListener(_listener.queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def stop_logging_queue():
+    """Flush the queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging(mode: str = None, level=None, payload_limit: int = None, sample_every: int = None):
+    """Select the logging mode, the environment provides the defaults
+
+    mode            LogMode.PRODUCTION (the default) or LogMode.DEBUG (env CHAINCODE_LOG_MODE).
+    level           Level of the shim logger, a name or a number, defaults to the one of the mode
+                    (env CHAINCODE_LOG_LEVEL).
+    payload_limit   Payload bytes shown in the logs (env CHAINCODE_LOG_PAYLOAD_LIMIT).
+    sample_every    Log one per-message record out of this many (env CHAINCODE_LOG_SAMPLE_EVERY).
+    """
+    mode = mode or os.getenv('CHAINCODE_LOG_MODE') or LogMode.PRODUCTION
+    if mode not in (LogMode.DEBUG, LogMode.PRODUCTION):
+        raise ValueError('log mode must be "%s" or "%s", got "%s"' % (LogMode.DEBUG, LogMode.PRODUCTION, mode))
+    production = mode == LogMode.PRODUCTION
+
+    level = level or os.getenv('CHAINCODE_LOG_LEVEL') or (logging.WARNING if production else logging.DEBUG)
+    if payload_limit is None:
+        payload_limit = int(os.getenv('CHAINCODE_LOG_PAYLOAD_LIMIT') or (0 if production else 64))
+    if sample_every is None:
+        sample_every = int(os.getenv('CHAINCODE_LOG_SAMPLE_EVERY') or (100 if production else 1))
+
+    LogSettings.mode = mode
+    LogSettings.payload_limit = payload_limit
+    LogSettings.sample_every = max(1, sample_every)
+    if isinstance(level, str):
+        # a level name ("info") or number ("20")
+        level = int(level) if level.strip().isdigit() else level.strip().upper()
+    LOGGER.setLevel(level)
 
 
 setup_logging_queue()
-# logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s %(message)s')
+configure_logging()
+atexit.register(stop_logging_queue)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listener_in_child)
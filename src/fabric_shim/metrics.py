@@ -0,0 +1,267 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Metrics of the chaincode shim, exported in the Prometheus text format
+#
+# Recording is off until enable() is called (server.start() does it when a metrics address or file is configured),
+# every recording site checks METRICS.enabled first so a disabled registry costs one attribute lookup.
+
+import asyncio
+import bisect
+import os
+import weakref
+
+from src.fabric_shim.logging import LOGGER
+
+# seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# label sets kept per metric, the ones beyond are folded into OVERFLOW_LABEL (function names come from the client)
+MAX_SERIES = 1000
+OVERFLOW_LABEL = '__other__'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, help_text, label_names=()) -> None:
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._series = {}
+
+    def _key(self, labels):
+        if labels in self._series or len(self._series) < MAX_SERIES:
+            return labels
+        return (OVERFLOW_LABEL,) * len(self.label_names)
+
+    def header(self):
+        return ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.kind)]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        for labels, value in self._series.items():
+            lines.append('%s%s %s' % (self.name, _format_labels(self.label_names, labels), value))
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS) -> None:
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            # per bucket counts (the last one is +Inf), sum
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = self.header()
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (self.name, _format_labels(self.label_names, labels, 'le="%s"' % bound),
+                                                 cumulative))
+            label_text = _format_labels(self.label_names, labels)
+            lines.append('%s_sum%s %r' % (self.name, label_text, total))
+            lines.append('%s_count%s %d' % (self.name, label_text, cumulative))
+        return lines
+
+
+class Gauge(_Metric):
+    """Gauge whose samples are collected at export time from the registered sources"""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, label_names=()) -> None:
+        super().__init__(name, help_text, label_names)
+        self.values = {}
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+    def render(self):
+        lines = self.header()
+        for labels, value in self.values.items():
+            lines.append('%s%s %s' % (self.name, _format_labels(self.label_names, labels), value))
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.enabled = False
+        self._metrics = []
+        # objects with a collect_metrics(registry) method, sampled into the gauges at export time
+        self._sources = weakref.WeakSet()
+
+        self.tx_latency = self._add(Histogram(
+            'chaincode_tx_duration_seconds', 'Init/Invoke execution time by chaincode function',
+            ('method', 'function')))
+        self.tx_queue_wait = self._add(Histogram(
+            'chaincode_tx_queue_wait_seconds', 'Time transactions wait for an execution slot'))
+        self.tx_responses = self._add(Counter(
+            'chaincode_tx_responses_total', 'Init/Invoke responses by status', ('method', 'status')))
+        self.peer_round_trip = self._add(Histogram(
+            'chaincode_peer_request_duration_seconds',
+            'Peer request round trip, from the write of the request to the reply, by request', ('request',)))
+        self.peer_queue_wait = self._add(Histogram(
+            'chaincode_peer_request_queue_wait_seconds', 'Time peer requests wait in the transaction message queue',
+            ('request',)))
+        self.peer_errors = self._add(Counter(
+            'chaincode_peer_request_errors_total', 'Peer requests answered with ERROR or timed out', ('request',)))
+        self.callee_latency = self._add(Histogram(
+            'chaincode_invoke_chaincode_duration_seconds', 'Chaincode to chaincode call round trip by callee',
+            ('callee',)))
+        self.callee_errors = self._add(Counter(
+            'chaincode_invoke_chaincode_errors_total',
+            'Chaincode to chaincode calls that failed or answered with an error status, by callee', ('callee',)))
+        self.tx_running = self._add(Gauge('chaincode_tx_running', 'Transactions executing'))
+        self.tx_pending = self._add(Gauge('chaincode_tx_pending', 'Transactions waiting for an execution slot'))
+        self.tx_contexts = self._add(Gauge('chaincode_tx_contexts', 'Live transaction contexts', ('state',)))
+        self.peer_requests_pending = self._add(Gauge(
+            'chaincode_peer_requests_pending', 'Peer requests waiting to be sent or answered'))
+        self.streams = self._add(Gauge('chaincode_peer_streams', 'Open peer streams'))
+        self.executor = self._add(Gauge('chaincode_executor_calls', 'Calls in the CPU executor', ('state',)))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_source(self, source):
+        self._sources.add(source)
+
+    def remove_source(self, source):
+        self._sources.discard(source)
+
+    def _collect(self):
+        for gauge in (self.tx_running, self.tx_pending, self.tx_contexts, self.peer_requests_pending, self.executor):
+            gauge.values.clear()
+        totals = {'running': 0, 'pending': 0, 'live': 0, 'leaked': 0, 'requests': 0}
+        sources = list(self._sources)
+        for source in sources:
+            for name, value in source.collect_metrics().items():
+                totals[name] = totals.get(name, 0) + value
+        self.streams.set(len(sources))
+        self.tx_running.set(totals['running'])
+        self.tx_pending.set(totals['pending'])
+        self.tx_contexts.set(totals['live'], 'live')
+        self.tx_contexts.set(totals['leaked'], 'leaked')
+        self.peer_requests_pending.set(totals['requests'])
+
+        from src.fabric_shim.executor import _executor
+        if _executor is not None:
+            stats = _executor.stats()
+            for state in ('active', 'queued', 'blocked'):
+                self.executor.set(stats[state], state)
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        self._collect()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+
+
+class MetricsExporter:
+    """Serves METRICS over HTTP (GET /metrics) and/or writes them to a file every `interval` seconds
+
+    With several server workers each one exports its own metrics: the port is offset by the worker index and the
+    file name gets the index appended.
+    """
+
+    def __init__(self, address: str = None, path: str = None, interval: float = 15.0) -> None:
+        worker = os.getenv('CHAINCODE_WORKER_INDEX')
+        if worker is not None:
+            if address:
+                host, port = address.rsplit(':', 1)
+                address = '%s:%d' % (host, int(port) + int(worker))
+            if path:
+                path = '%s.%s' % (path, worker)
+        self.address = address
+        self.path = path
+        self.interval = interval
+        self._server = None
+        self._writer = None
+
+    async def start(self):
+        METRICS.enabled = True
+        if self.address:
+            host, port = self.address.rsplit(':', 1)
+            self._server = await asyncio.start_server(self._serve_http, host or None, int(port))
+            LOGGER.info('Metrics are served at http://%s/metrics', self.address)
+        if self.path:
+            self._writer = asyncio.ensure_future(self._write_loop())
+            LOGGER.info('Metrics are written to %s every %ss', self.path, self.interval)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+            self._write_file()
+
+    async def _serve_http(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] in (b'/metrics', b'/'):
+                body = METRICS.render().encode()
+                head = 'HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n'
+            else:
+                body = b'not found\n'
+                head = 'HTTP/1.1 404 Not Found\r\nContent-Type: text/plain\r\n'
+            writer.write(('%sContent-Length: %d\r\nConnection: close\r\n\r\n' % (head, len(body))).encode() + body)
+            await writer.drain()
+        except Exception as e:
+            LOGGER.warning('Metrics request failed: %s', e)
+        finally:
+            writer.close()
+
+    def _write_file(self):
+        # write and rename, so a collector never reads a partial file
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(METRICS.render())
+        os.replace(tmp_path, self.path)
+
+    async def _write_loop(self):
+        while True:
+            try:
+                self._write_file()
+            except OSError as e:
+                LOGGER.warning('Could not write the metrics file %s: %s', self.path, e)
+            await asyncio.sleep(self.interval)
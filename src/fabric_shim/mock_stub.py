@@ -0,0 +1,511 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# In-memory ChaincodeStubInterface to run chaincode without a peer
+#
+# The main API list of MockStub is as follows:
+#
+#      mock_init() / mock_invoke(): run Init/Invoke of the chaincode in a transaction of their own
+#      begin() / commit() / rollback(): drive a transaction by hand
+#      seed(): load committed state, ex: the fixtures of a test
+
+import asyncio
+import bisect
+import hashlib
+import time
+import uuid
+from collections.abc import Sequence
+
+from google.protobuf.timestamp_pb2 import Timestamp
+from fabric_protos_python.ledger.queryresult import kv_query_result_pb2 as kv_pb
+from fabric_protos_python.peer import chaincode_event_pb2 as e_pb
+from fabric_protos_python.peer import chaincode_shim_pb2 as ccshim_pb2
+from fabric_protos_python.peer import proposal_response_pb2 as pr_pb
+
+from src.fabric_shim.interfaces import ChaincodeStubInterface
+from src.fabric_shim.args import ChaincodeArgs
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.utils import encode_composite_key, encode_composite_keys, decode_composite_key, \
+    decode_composite_keys, validate_simple_keys, EMPTY_KEY_SUBSTITUTE, MAX_UNICODE_RUNE_VALUE
+
+VALIDATION_PARAMETER: str = 'VALIDATION_PARAMETER'
+
+
+class SortedKeyStore:
+    """Key/value store keeping its keys sorted, so range scans are two bisections and a slice"""
+
+    def __init__(self) -> None:
+        self._keys = []
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def put(self, key, value):
+        if key not in self._values:
+            bisect.insort(self._keys, key)
+        self._values[key] = value
+
+    def delete(self, key):
+        if self._values.pop(key, None) is not None:
+            del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def range(self, start_key, end_key, limit=None):
+        """(key, value) pairs of the keys in [start_key, end_key), an empty end_key means no upper bound"""
+        lo = bisect.bisect_left(self._keys, start_key)
+        hi = bisect.bisect_left(self._keys, end_key) if end_key else len(self._keys)
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return [(key, self._values[key]) for key in self._keys[lo:hi]]
+
+    def next_key(self, key, end_key):
+        """The first stored key after `key` and below `end_key`, None if there is none"""
+        i = bisect.bisect_right(self._keys, key)
+        if i < len(self._keys) and (not end_key or self._keys[i] < end_key):
+            return self._keys[i]
+        return None
+
+
+class MockQueryIterator:
+    """Iterator over the results of a MockStub query, with the interface of CommonIterator
+
+    The results are a snapshot of the committed state taken when the query ran.
+    """
+
+    def __init__(self, results, decode) -> None:
+        self._results = results
+        self._decode = decode
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for result in self._results:
+            if self.closed:
+                return
+            yield self._decode(result)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def release(self):
+        self.closed = True
+
+    async def close(self):
+        self.release()
+
+
+def _chaincode_args(args):
+    return ChaincodeArgs([arg.encode() if isinstance(arg, str) else arg for arg in args])
+
+
+def _kv(namespace):
+    return lambda item: kv_pb.KV(namespace=namespace, key=item[0], value=item[1])
+
+
+class MockStub(ChaincodeStubInterface):
+    """ChaincodeStubInterface over an in-memory ledger, to test or profile chaincode logic without gRPC or a peer
+
+    Each collection (the public state is the collection '') is a SortedKeyStore. Reads see the committed state only,
+    like on a peer: the writes of a transaction are buffered and applied by commit(), or dropped by rollback().
+    mock_invoke() and mock_init() wrap one Init/Invoke call in such a transaction and commit it when the response
+    status is below ERRORTHRESHOLD.
+
+    `latency` (seconds, or a function returning seconds) is awaited by every call that would be a peer request, to
+    model the round trip to a real peer; with the default 0 the calls do not yield to the event loop at all.
+
+    Typical usage example:
+        stub = MockStub('basic', MyChaincode)
+        stub.seed({'asset1': b'{"color": "blue"}'})
+        response = await stub.mock_invoke([b'ReadAsset', b'asset1'])
+    """
+
+    def __init__(self, name: str, cc=None, channel_id: str = 'mychannel', latency=0.0,
+                 mspid: str = 'Org1MSP', id_bytes: bytes = b'') -> None:
+        self.name = name
+        self.cc = cc
+        self.channel_id = channel_id
+        self.latency = latency
+        self.creator = {'mspid': mspid, 'idBytes': id_bytes}
+        # collection -> SortedKeyStore of the committed state
+        self.collections = {'': SortedKeyStore()}
+        # (collection, key) -> {metadata key: value}
+        self.metadata = {}
+        # (collection, key) -> list of KeyModification, oldest first
+        self.history = {}
+        # other chaincodes reachable with invoke_chaincode, by name
+        self.invokables = {}
+
+        self.tx_id = None
+        self.args = ChaincodeArgs([])
+        self.transient = {}
+        self.tx_timestamp = None
+        # (collection, key) -> value, None for a delete
+        self.write_set = {}
+        self.metadata_writes = {}
+        # ChaincodeEvent set by the current transaction, kept after commit
+        self.event = None
+        # set for read-only (query) transactions, writes are refused
+        self.read_only = False
+        # MockStubs that joined the current transaction through invoke_chaincode, committed or dropped with it
+        self.callees = []
+
+    async def _peer_round_trip(self):
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            await asyncio.sleep(latency)
+
+    def _collection(self, collection):
+        store = self.collections.get(collection)
+        if store is None:
+            store = self.collections[collection] = SortedKeyStore()
+        return store
+
+    # transactions
+
+    def seed(self, items, collection: str = ''):
+        """Load committed state from a mapping of key to value, outside of any transaction"""
+        store = self._collection(collection)
+        for key, value in items.items():
+            store.put(key, value.encode() if isinstance(value, str) else value)
+
+    def begin(self, tx_id: str = None, args=(), transient: dict = None):
+        """Start a transaction with the given args (list of bytes or str)"""
+        if self.tx_id is not None:
+            raise Exception('transaction %s is still in progress' % self.tx_id)
+        self.tx_id = tx_id or uuid.uuid4().hex
+        self.args = _chaincode_args(args)
+        self.transient = dict(transient or {})
+        self.tx_timestamp = Timestamp()
+        self.tx_timestamp.FromNanoseconds(time.time_ns())
+        self.write_set = {}
+        self.metadata_writes = {}
+        self.event = None
+        self.read_only = False
+        self.callees = []
+
+    def commit(self):
+        """Apply the writes of the current transaction to the ledger"""
+        self._check_tx()
+        for (collection, key), value in self.write_set.items():
+            store = self._collection(collection)
+            if value is None:
+                store.delete(key)
+            else:
+                store.put(key, value)
+            self.history.setdefault((collection, key), []).append(kv_pb.KeyModification(
+                tx_id=self.tx_id, value=value or b'', timestamp=self.tx_timestamp, is_delete=value is None))
+        for (collection, key), entries in self.metadata_writes.items():
+            self.metadata.setdefault((collection, key), {}).update(entries)
+        for callee in self.callees:
+            callee.commit()
+        self._end()
+
+    def rollback(self):
+        """Drop the writes of the current transaction"""
+        self._check_tx()
+        for callee in self.callees:
+            callee.rollback()
+        self._end()
+
+    def _end(self):
+        self.tx_id = None
+        self.write_set = {}
+        self.metadata_writes = {}
+        self.callees = []
+
+    def _savepoint(self):
+        """The pending writes of the current transaction, including those of its callees, see _restore()"""
+        return (dict(self.write_set), {k: dict(v) for k, v in self.metadata_writes.items()}, self.event,
+                [(callee, callee._savepoint()) for callee in self.callees])
+
+    def _restore(self, savepoint):
+        """Drop the writes made since `savepoint`, callees that joined after it leave the transaction"""
+        self.write_set, self.metadata_writes, self.event, callees = savepoint
+        for callee in self.callees[len(callees):]:
+            callee.rollback()
+        for callee, callee_savepoint in callees:
+            callee._restore(callee_savepoint)
+        self.callees = [callee for callee, _ in callees]
+
+    def _check_tx(self):
+        if self.tx_id is None:
+            raise Exception('no transaction in progress, call begin() first')
+
+    async def mock_init(self, args, tx_id: str = None, transient: dict = None) -> pr_pb.Response:
+        """Run the chaincode Init in a transaction of its own"""
+        return await self._mock_call(self.cc.init, args, tx_id, transient)
+
+    async def mock_invoke(self, args, tx_id: str = None, transient: dict = None) -> pr_pb.Response:
+        """Run the chaincode Invoke in a transaction of its own"""
+        return await self._mock_call(self.cc.invoke, args, tx_id, transient)
+
+    async def _mock_call(self, method, args, tx_id, transient):
+        self.begin(tx_id, args, transient)
+        try:
+            # chaincode classes are called with the class itself as `self`, as the handler does
+            resp = await method(self.cc, self)
+        except BaseException:
+            self.rollback()
+            raise
+        if resp and resp.status and resp.status < ResponseCode.ERRORTHRESHOLD:
+            self.commit()
+        else:
+            self.rollback()
+        return resp
+
+    # transaction context
+
+    def get_args(self):
+        return self.args
+
+    def get_function(self):
+        return self.args.function
+
+    def get_string_args(self):
+        return self.args.strings()
+
+    def get_function_and_parameters(self):
+        return self.args.function, self.args.strings(1)
+
+    def get_txid(self):
+        return self.tx_id
+
+    def get_channel_id(self):
+        return self.channel_id
+
+    def get_creator(self):
+        return self.creator
+
+    def get_transient(self):
+        return self.transient
+
+    def get_tx_timestamp(self):
+        return self.tx_timestamp
+
+    def set_event(self, name: str, payload: bytes):
+        """Set the event of the transaction, a later call replaces it"""
+        if not name:
+            raise Exception('event name must be a non-empty string')
+        self.event = e_pb.ChaincodeEvent(event_name=name, payload=payload, tx_id=self.tx_id or '')
+
+    # state
+
+    def _write(self, collection, key, value):
+        self._check_tx()
+        if not key:
+            raise Exception('key must not be empty')
+        if self.read_only:
+            raise Exception('transaction %s is read-only, it cannot write key %s' % (self.tx_id, key))
+        if isinstance(value, str):
+            value = value.encode()
+        elif value is not None and not isinstance(value, bytes):
+            value = bytes(value)
+        self.write_set[(collection, key)] = value
+
+    async def get_state(self, key: str):
+        await self._peer_round_trip()
+        return self.collections[''].get(key, b'')
+
+    async def get_states(self, keys):
+        await self._peer_round_trip()
+        store = self.collections['']
+        return [store.get(key, b'') for key in keys]
+
+    async def put_state(self, key: str, value):
+        await self._peer_round_trip()
+        self._write('', key, value)
+
+    async def delete_state(self, key: str):
+        await self._peer_round_trip()
+        self._write('', key, None)
+
+    async def set_state_validation_parameter(self, key: str, ep: bytes):
+        await self._peer_round_trip()
+        self._check_tx()
+        self.metadata_writes.setdefault(('', key), {})[VALIDATION_PARAMETER] = ep
+
+    async def get_state_validation_parameter(self, key: str):
+        await self._peer_round_trip()
+        return self.metadata.get(('', key), {}).get(VALIDATION_PARAMETER, b'')
+
+    def _range(self, collection, start_key, end_key, page_size=None, bookmark=''):
+        store = self._collection(collection)
+        if bookmark and bookmark > start_key:
+            start_key = bookmark
+        results = store.range(start_key, end_key, page_size)
+        metadata = None
+        if page_size is not None:
+            next_key = store.next_key(results[-1][0], end_key) if results else None
+            metadata = ccshim_pb2.QueryResponseMetadata(fetched_records_count=len(results),
+                                                        bookmark=next_key or '')
+        return MockQueryIterator(results, _kv(self.name)), metadata
+
+    async def get_state_by_range(self, start_key: str, end_key: str):
+        await self._peer_round_trip()
+        validate_simple_keys((start_key, end_key))
+        iterator, _ = self._range('', start_key or EMPTY_KEY_SUBSTITUTE, end_key)
+        return iterator
+
+    async def get_state_by_range_with_pagination(self, start_key: str, end_key: str, page_size: int,
+                                                 bookmark: str = ''):
+        await self._peer_round_trip()
+        validate_simple_keys((start_key, end_key))
+        return self._range('', start_key or EMPTY_KEY_SUBSTITUTE, end_key, page_size, bookmark)
+
+    async def get_query_result(self, query: str, decode=None):
+        raise Exception('rich queries need CouchDB, MockStub does not support them')
+
+    async def get_query_result_with_pagination(self, query: str, page_size: int, bookmark: str = '',
+                                               decode=None):
+        raise Exception('rich queries need CouchDB, MockStub does not support them')
+
+    async def get_history_for_key(self, key: str):
+        await self._peer_round_trip()
+        # newest first, like the peer
+        return MockQueryIterator(self.history.get(('', key), [])[::-1], lambda modification: modification)
+
+    async def invoke_chaincode(self, chaincode_name: str, args, channel: str = '', timeout: float = None,
+                               cache: bool = False):
+        """Invoke a MockStub registered in `invokables` under `chaincode_name`, in this transaction
+
+        Like on a peer the callee's writes join the caller's transaction: they are pending until the caller commits
+        and are dropped with it. A call answering with an error status leaves no writes behind.
+        """
+        await self._peer_round_trip()
+        self._check_tx()
+        other = self.invokables.get(chaincode_name)
+        if other is None:
+            raise Exception('chaincode %s is not registered with this MockStub' % chaincode_name)
+        savepoint = self._savepoint()
+        if other not in self.callees:
+            other.begin(self.tx_id, args, self.transient)
+            other.read_only = self.read_only
+            self.callees.append(other)
+        else:
+            # called again in the same transaction, on top of the writes of the previous calls
+            other.args = _chaincode_args(args)
+        try:
+            resp = await other.cc.invoke(other.cc, other)
+        except BaseException:
+            self._restore(savepoint)
+            raise
+        if not (resp and resp.status and resp.status < ResponseCode.ERRORTHRESHOLD):
+            self._restore(savepoint)
+        return resp
+
+    async def invoke_chaincodes(self, calls, timeout: float = None, cache: bool = False):
+        """Invoke registered MockStubs one after the other, all in this transaction"""
+        return [await self.invoke_chaincode(*call) for call in calls]
+
+    # composite keys
+
+    def create_composite_key(self, object_type, attributes):
+        if not isinstance(attributes, Sequence):
+            raise Exception('attributes must be an array')
+        return encode_composite_key(object_type, attributes)
+
+    def create_composite_keys(self, object_type, attributes_list):
+        return encode_composite_keys(object_type, attributes_list)
+
+    def split_composite_key(self, composite_key):
+        return decode_composite_key(composite_key)
+
+    def split_composite_keys(self, composite_keys):
+        return decode_composite_keys(composite_keys)
+
+    async def get_state_by_partial_composite_key(self, object_type, attributes):
+        await self._peer_round_trip()
+        start_key = self.create_composite_key(object_type, attributes)
+        iterator, _ = self._range('', start_key, start_key + MAX_UNICODE_RUNE_VALUE)
+        return iterator
+
+    async def get_state_by_partial_composite_key_with_pagination(self, object_type, attributes, page_size: int,
+                                                                 bookmark: str = ''):
+        await self._peer_round_trip()
+        start_key = self.create_composite_key(object_type, attributes)
+        return self._range('', start_key, start_key + MAX_UNICODE_RUNE_VALUE, page_size, bookmark)
+
+    # private data
+
+    @staticmethod
+    def _check_collection(collection):
+        if not collection:
+            raise Exception('collection must be a non-empty string')
+
+    async def get_private_data(self, collection: str, key: str):
+        await self._peer_round_trip()
+        self._check_collection(collection)
+        return self._collection(collection).get(key, b'')
+
+    async def get_private_data_multiple(self, collection: str, keys):
+        await self._peer_round_trip()
+        self._check_collection(collection)
+        store = self._collection(collection)
+        return [store.get(key, b'') for key in keys]
+
+    async def has_private_data(self, collection: str, key: str) -> bool:
+        await self._peer_round_trip()
+        self._check_collection(collection)
+        return key in self._collection(collection)
+
+    async def get_private_data_hash(self, collection: str, key: str):
+        await self._peer_round_trip()
+        self._check_collection(collection)
+        value = self._collection(collection).get(key)
+        return hashlib.sha256(value).digest() if value is not None else b''
+
+    async def put_private_data(self, collection: str, key: str, value):
+        await self._peer_round_trip()
+        self._check_collection(collection)
+        self._write(collection, key, value)
+
+    async def delete_private_data(self, collection: str, key: str):
+        await self._peer_round_trip()
+        self._check_collection(collection)
+        self._write(collection, key, None)
+
+    async def purge_private_data(self, collection: str, key: str):
+        """Same as delete_private_data, MockStub has no peer private state to purge"""
+        await self._peer_round_trip()
+        self._check_collection(collection)
+        self._write(collection, key, None)
+
+    async def set_private_data_validation_parameter(self, collection: str, key: str, ep: bytes):
+        await self._peer_round_trip()
+        self._check_collection(collection)
+        self._check_tx()
+        self.metadata_writes.setdefault((collection, key), {})[VALIDATION_PARAMETER] = ep
+
+    async def get_private_data_validation_parameter(self, collection: str, key: str):
+        await self._peer_round_trip()
+        self._check_collection(collection)
+        return self.metadata.get((collection, key), {}).get(VALIDATION_PARAMETER, b'')
+
+    async def get_private_data_by_range(self, collection: str, start_key: str, end_key: str):
+        await self._peer_round_trip()
+        self._check_collection(collection)
+        validate_simple_keys((start_key, end_key))
+        iterator, _ = self._range(collection, start_key or EMPTY_KEY_SUBSTITUTE, end_key)
+        return iterator
+
+    async def get_private_data_by_partial_composite_key(self, collection: str, object_type, attributes):
+        await self._peer_round_trip()
+        self._check_collection(collection)
+        start_key = self.create_composite_key(object_type, attributes)
+        iterator, _ = self._range(collection, start_key, start_key + MAX_UNICODE_RUNE_VALUE)
+        return iterator
+
+    async def get_private_data_query_result(self, collection: str, query: str, decode=None):
+        raise Exception('rich queries need CouchDB, MockStub does not support them')
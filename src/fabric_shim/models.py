@@ -0,0 +1,320 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Typed ledger values: __slots__ records and the codecs turning them into state bytes
+#
+# The main API list of the model layer is as follows:
+#
+#      Model: base class of the records, fields are declared with annotations
+#      register_codec() / get_codec(): the codec registry ('json', 'struct' and 'protobuf' built in)
+#      get_model() / get_models() / put_model(): get_state/get_states/put_state returning and taking records
+#
+# Typical usage example:
+#
+#     class Asset(Model):
+#         __codec__ = 'struct'
+#         id: str
+#         color: str = ''
+#         size: int = 0
+#
+#     await put_model(stub, 'asset1', Asset('asset1', 'blue', 5))
+#     asset = await get_model(stub, Asset, 'asset1')
+
+import json
+import struct
+import typing
+
+from src.fabric_shim.interfaces import ChaincodeStubInterface
+
+
+class ModelMeta(type):
+    """Turns the annotated fields of a Model subclass into __slots__ and generates its __init__"""
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        annotations = namespace.get('__annotations__')
+        if annotations is None and '__annotate__' in namespace:
+            annotations = namespace['__annotate__'](1)
+        own_fields = [field for field in (annotations or {}) if not field.startswith('_')]
+        inherited = [field for base in bases for field in getattr(base, '_fields', ())]
+        # defaults are class attributes, they would clash with the slots
+        own_defaults = {field: namespace.pop(field) for field in own_fields if field in namespace}
+        namespace['__slots__'] = tuple(field for field in own_fields if field not in inherited)
+        cls = super().__new__(mcs, name, bases, namespace, **kwargs)
+
+        cls._fields = tuple(inherited + [field for field in own_fields if field not in inherited])
+        defaults = {}
+        for base in bases:
+            defaults.update(getattr(base, '_defaults', {}))
+        defaults.update(own_defaults)
+        cls._defaults = defaults
+        cls._types = {}
+        cls._compiled_codecs = {}
+        if cls._fields:
+            cls.__init__ = _make_init(cls._fields, defaults)
+        return cls
+
+    def field_types(cls):
+        """Field name -> annotation, resolved on first use"""
+        if not cls._types and cls._fields:
+            hints = typing.get_type_hints(cls)
+            cls._types = {field: hints.get(field, typing.Any) for field in cls._fields}
+        return cls._types
+
+
+def _make_init(fields, defaults):
+    """Generate __init__(self, field1, field2=default, ...) once per model, as dataclasses do"""
+    params = []
+    for field in fields:
+        params.append('%s=_d[%r]' % (field, field) if field in defaults else field)
+    # a field without default after one with default gets None
+    seen_default = False
+    for i, field in enumerate(fields):
+        if field in defaults:
+            seen_default = True
+        elif seen_default:
+            params[i] = '%s=None' % field
+    body = ''.join('\n    self.%s = %s' % (field, field) for field in fields)
+    return _compile('def __init__(self, %s):%s' % (', '.join(params), body), {'_d': defaults})
+
+
+class Model(metaclass=ModelMeta):
+    """Record with a fixed set of fields stored in __slots__ (no per-instance dict)
+
+    Fields are declared as annotations, optionally with a default. `__codec__` names the codec used by
+    to_bytes()/from_bytes() and by the state helpers ('json' by default). Fields are not type checked on creation.
+    """
+
+    __slots__ = ()
+    __codec__ = 'json'
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self._fields}
+
+    @classmethod
+    def from_dict(cls, values: dict):
+        """Build a record from a mapping, keys that are not fields are ignored"""
+        return cls(**{field: values[field] for field in cls._fields if field in values})
+
+    def to_bytes(self, codec: str = None) -> bytes:
+        return _compiled(type(self), codec)[0](self)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, codec: str = None):
+        return _compiled(cls, codec)[1](data)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self._fields)
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__,
+                           ', '.join('%s=%r' % (field, getattr(self, field)) for field in self._fields))
+
+
+class Codec:
+    """Turns records of a Model class into bytes and back
+
+    compile() is called once per model class and returns the pair (encode(record) -> bytes, decode(bytes) -> record).
+    """
+
+    name = ''
+
+    def compile(self, model_cls):
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    """JSON object keyed by field name, readable by any client and by rich (CouchDB) queries
+
+    The bytes are those of json.dumps() with its default separators, so values written by chaincode that stored
+    json.dumps(obj.__dict__) keep the same encoding once obj is a Model.
+    """
+
+    name = 'json'
+
+    def compile(self, model_cls):
+        fields = model_cls._fields
+        defaults = model_cls._defaults
+        scope = {'_dumps': json.JSONEncoder().encode, '_loads': json.loads, '_cls': model_cls, '_d': defaults}
+        encode = _compile('def encode(r):\n    return _dumps({%s}).encode()'
+                          % ', '.join('%r: r.%s' % (field, field) for field in fields), scope)
+        decode = _compile('def decode(data):\n    d = _loads(data)\n    return _cls(%s)'
+                          % ', '.join("d.get(%r, %s)" % (field, '_d[%r]' % field if field in defaults else 'None')
+                                      for field in fields), scope)
+        return encode, decode
+
+
+class StructCodec(Codec):
+    """Binary layout: a version byte, the fixed size fields and the lengths of the str/bytes fields packed with
+    struct, then the str/bytes contents. Fields must be int, float, bool, str or bytes and not None.
+
+    The layout follows the field order, so fields may only be appended to a model whose values use this codec, and
+    only by bumping `version`.
+    """
+
+    name = 'struct'
+    FORMATS = {int: 'q', float: 'd', bool: '?'}
+
+    def __init__(self, version: int = 1) -> None:
+        self.version = version
+
+    def compile(self, model_cls):
+        fixed, variable, fmt = [], [], '<B'
+        for field, annotation in model_cls.field_types().items():
+            annotation = _unwrap_optional(annotation)
+            if annotation in self.FORMATS:
+                fixed.append(field)
+                fmt += self.FORMATS[annotation]
+            elif annotation in (str, bytes):
+                variable.append((field, annotation is str))
+            else:
+                raise TypeError('%s.%s: the struct codec supports int, float, bool, str and bytes fields, not %r'
+                                % (model_cls.__name__, field, annotation))
+        header = struct.Struct(fmt + 'I' * len(variable))
+        scope = {'_pack': header.pack, '_unpack': header.unpack_from, '_size': header.size, '_cls': model_cls,
+                 '_version': self.version, '_name': model_cls.__name__}
+        # encode(r): str fields are encoded to locals, then packed with the fixed fields and the lengths
+        lines = ['def encode(r):']
+        contents = []
+        for i, (field, is_str) in enumerate(variable):
+            lines.append('    v%d = r.%s%s' % (i, field, '.encode()' if is_str else ''))
+            contents.append('v%d' % i)
+        lines.append('    return _pack(%s)%s' % (', '.join(['_version'] + ['r.%s' % field for field in fixed]
+                                                          + ['len(%s)' % name for name in contents]),
+                                                 ''.join(' + ' + name for name in contents)))
+        encode = _compile('\n'.join(lines), scope)
+
+        names = ['f_%s' % field for field in fixed] + ['n%d' % i for i in range(len(variable))]
+        lines = ['def decode(data):',
+                 '    version%s = _unpack(data)' % ''.join(', ' + name for name in names),
+                 '    if version != _version:',
+                 "        raise ValueError('%s: struct codec version %d cannot decode version %d'"
+                 ' % (_name, _version, version))',
+                 '    o = _size']
+        for i, (field, is_str) in enumerate(variable):
+            lines.append("    f_%s = %s(data[o:o + n%d]%s)" % (field, 'str' if is_str else 'bytes', i,
+                                                            ", 'utf-8'" if is_str else ''))
+            lines.append('    o += n%d' % i)
+        lines.append('    return _cls(%s)' % ', '.join('f_%s' % field for field in model_cls._fields))
+        decode = _compile('\n'.join(lines), scope)
+        return encode, decode
+
+
+class ProtobufCodec(Codec):
+    """Protocol buffers encoding
+
+    The message class is `__proto__` of the model when it declares one (fields matched by name), otherwise a
+    message is generated from the fields (int -> int64, float -> double, bool, str -> string, bytes), numbered in
+    declaration order: as with any proto, fields may be appended but never reordered or removed. Proto3 has no null,
+    unset fields decode as 0 / '' / b''.
+    """
+
+    name = 'protobuf'
+
+    def compile(self, model_cls):
+        message_cls = getattr(model_cls, '__proto__', None) or _generate_message(model_cls)
+        fields = model_cls._fields
+
+        def encode(record):
+            return message_cls(**{field: value for field in fields
+                                  if (value := getattr(record, field)) is not None}).SerializeToString()
+
+        def decode(data):
+            message = message_cls.FromString(bytes(data))
+            return model_cls(*[getattr(message, field) for field in fields])
+
+        return encode, decode
+
+
+def _compile(source, scope):
+    """Define the function in `source` with the globals `scope` and return it"""
+    namespace = {}
+    exec(source, scope, namespace)
+    return next(iter(namespace.values()))
+
+
+def _unwrap_optional(annotation):
+    if typing.get_origin(annotation) is typing.Union:
+        options = [option for option in typing.get_args(annotation) if option is not type(None)]
+        if len(options) == 1:
+            return options[0]
+    return annotation
+
+
+def _generate_message(model_cls):
+    from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+
+    types = {
+        int: descriptor_pb2.FieldDescriptorProto.TYPE_INT64,
+        float: descriptor_pb2.FieldDescriptorProto.TYPE_DOUBLE,
+        bool: descriptor_pb2.FieldDescriptorProto.TYPE_BOOL,
+        str: descriptor_pb2.FieldDescriptorProto.TYPE_STRING,
+        bytes: descriptor_pb2.FieldDescriptorProto.TYPE_BYTES,
+    }
+    package = 'fabric_shim.models'
+    file_proto = descriptor_pb2.FileDescriptorProto(
+        name='%s/%s.proto' % (model_cls.__module__.replace('.', '/'), model_cls.__qualname__),
+        package=package, syntax='proto3')
+    message_proto = file_proto.message_type.add(name=model_cls.__name__)
+    for number, (field, annotation) in enumerate(model_cls.field_types().items(), 1):
+        field_type = types.get(_unwrap_optional(annotation))
+        if field_type is None:
+            raise TypeError('%s.%s: no protobuf type for %r, declare __proto__ on the model'
+                            % (model_cls.__name__, field, annotation))
+        message_proto.field.add(name=field, number=number, type=field_type,
+                                label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL)
+    # a pool of its own, so models of the same name in different modules do not clash
+    pool = descriptor_pool.DescriptorPool()
+    pool.AddSerializedFile(file_proto.SerializeToString())
+    descriptor = pool.FindMessageTypeByName('%s.%s' % (package, model_cls.__name__))
+    if hasattr(message_factory, 'GetMessageClass'):
+        return message_factory.GetMessageClass(descriptor)
+    return message_factory.MessageFactory(pool).GetPrototype(descriptor)
+
+
+_CODECS = {}
+
+
+def register_codec(codec: Codec):
+    """Make `codec` available to the models under codec.name, replacing a codec of the same name"""
+    _CODECS[codec.name] = codec
+
+
+def get_codec(name: str) -> Codec:
+    codec = _CODECS.get(name)
+    if codec is None:
+        raise KeyError('unknown codec %r, registered: %s' % (name, ', '.join(sorted(_CODECS))))
+    return codec
+
+
+for _codec in (JsonCodec(), StructCodec(), ProtobufCodec()):
+    register_codec(_codec)
+
+
+def _compiled(model_cls, codec_name=None):
+    name = codec_name or model_cls.__codec__
+    pair = model_cls._compiled_codecs.get(name)
+    if pair is None:
+        pair = model_cls._compiled_codecs[name] = get_codec(name).compile(model_cls)
+    return pair
+
+
+async def get_model(stub: ChaincodeStubInterface, model_cls, key: str, codec: str = None):
+    """get_state decoded into a `model_cls` record, None when the key does not exist"""
+    data = await stub.get_state(key)
+    if not data:
+        return None
+    return _compiled(model_cls, codec)[1](data)
+
+
+async def get_models(stub: ChaincodeStubInterface, model_cls, keys, codec: str = None):
+    """get_states decoded into `model_cls` records, None for the keys that do not exist"""
+    decode = _compiled(model_cls, codec)[1]
+    return [decode(data) if data else None for data in await stub.get_states(keys)]
+
+
+async def put_model(stub: ChaincodeStubInterface, key: str, record: Model, codec: str = None):
+    """put_state of a record encoded with its model's codec (or `codec`)"""
+    await stub.put_state(key, _compiled(type(record), codec)[0](record))
@@ -1,5 +1,10 @@
 import asyncio
 import json
+import time
+from collections import deque
+
+from src.fabric_shim.logging import LOGGER
+from src.fabric_shim.metrics import METRICS
 
 
 class QueueMessage:
@@ -7,6 +12,11 @@ class QueueMessage:
         self.msg = msg
         self.method = method
         self.future = future
+        # perf_counter() when the message was queued, and when it was written to the stream
+        self.queued = time.perf_counter()
+        self.sent_at = None
+        # resolved once the message is written to the stream
+        self.sent = asyncio.get_running_loop().create_future()
 
     def get_msg(self):
         return self.msg
@@ -18,69 +28,195 @@ class QueueMessage:
         return self.method
 
     def success(self, response):
-        self.future.set_result(response)
+        if not self.future.done():
+            self.future.set_result(response)
 
     def fail(self, err):
-        self.future.set_exception(Exception(err))
+        if not self.future.done():
+            self.future.set_exception(Exception(err))
+
+    def cancel(self):
+        self.future.cancel()
+
+
+class TxContext:
+    """State of one transaction context (channel + txid) while the chaincode runs it"""
+
+    def __init__(self, tx_context_id, created: float, deadline: float = None) -> None:
+        self.tx_context_id = tx_context_id
+        self.created = created
+        # loop time after which the transaction counts as leaked, None for no deadline
+        self.deadline = deadline
+        # messages waiting to be sent, and sent but not answered yet (oldest first)
+        self.waiting = deque()
+        self.in_flight = deque()
+        # set once a request of the transaction timed out: replies can no longer be matched to requests
+        self.error = None
+
+    def pending(self):
+        return len(self.waiting) + len(self.in_flight)
 
 
 class MsgQueueHandler:
-    """This class handles queuing messages to be sent to the peer based on transaction id"""
-    
+    """This class handles queuing messages to be sent to the peer based on transaction id
+
+    Every transaction gets a TxContext in a registry when it starts (open_tx) and loses it when its COMPLETED
+    message is sent (complete_tx), which cancels whatever requests it left behind.
+
+    One message per transaction context is in flight: the next one is sent when the peer answers the current one.
+    Replies only carry the channel and transaction id, and stock Fabric peers handle each request on its own
+    goroutine, so a reply can only be matched to its request while a single one is outstanding.
+    """
+
+    # seconds between two scans of the registry for contexts past their deadline
+    REAP_INTERVAL = 5.0
+
     def __init__(self, handler) -> None:
         self.handler = handler
-        self.tx_queues = {}
+        self.tx_contexts = {}
         self.context = handler.context
+        self.created = 0
+        self.completed = 0
+        self.failed = 0
+        self.reaped = 0
+        self._next_reap = 0.0
+
+    def open_tx(self, channel_id, tx_id, timeout: float = None) -> TxContext:
+        """Register the context of a transaction that starts executing"""
+        tx_context_id = channel_id + tx_id
+        tx_context = self.tx_contexts.get(tx_context_id)
+        if tx_context is None:
+            now = asyncio.get_running_loop().time()
+            tx_context = TxContext(tx_context_id, now, now + timeout if timeout else None)
+            self.tx_contexts[tx_context_id] = tx_context
+            self.created += 1
+        self._reap_expired()
+        return tx_context
+
+    def complete_tx(self, channel_id, tx_id):
+        """Drop the context of a transaction once its COMPLETED message is sent"""
+        tx_context = self.tx_contexts.pop(channel_id + tx_id, None)
+        if tx_context is None:
+            return
+        self.completed += 1
+        self._cancel_pending(tx_context)
+
+    def fail_tx(self, channel_id, tx_id, err):
+        """Fail every request of a transaction, and the requests it makes from now on, with `err`"""
+        tx_context = self.tx_contexts.get(channel_id + tx_id)
+        if tx_context is not None:
+            self._fail(tx_context, err)
+
+    def _fail(self, tx_context: TxContext, err):
+        if tx_context.error is not None:
+            return
+        self.failed += 1
+        tx_context.error = err
+        for msg in tx_context.in_flight:
+            msg.fail(err)
+        for msg in tx_context.waiting:
+            msg.fail(err)
+        tx_context.in_flight.clear()
+        tx_context.waiting.clear()
+
+    @staticmethod
+    def _cancel_pending(tx_context: TxContext):
+        if not tx_context.pending():
+            return
+        LOGGER.warning('Transaction context %s ended with %d peer requests outstanding, cancelling them'
+                       % (tx_context.tx_context_id, tx_context.pending()))
+        for msg in tx_context.in_flight:
+            msg.cancel()
+        for msg in tx_context.waiting:
+            msg.cancel()
+        tx_context.in_flight.clear()
+        tx_context.waiting.clear()
+
+    def _reap_expired(self):
+        """Drop the contexts past their deadline (their transaction never sent COMPLETED)"""
+        now = asyncio.get_running_loop().time()
+        if now < self._next_reap:
+            return
+        self._next_reap = now + self.REAP_INTERVAL
+        for tx_context_id, tx_context in list(self.tx_contexts.items()):
+            if tx_context.deadline is not None and tx_context.deadline < now:
+                LOGGER.warning('Reaping transaction context %s, %.1fs past its deadline'
+                               % (tx_context_id, now - tx_context.deadline))
+                del self.tx_contexts[tx_context_id]
+                self.reaped += 1
+                self._cancel_pending(tx_context)
+
+    def stats(self):
+        """Counters of the registry: live contexts, those past their deadline (leaked) and lifetime totals"""
+        now = asyncio.get_running_loop().time()
+        leaked = sum(1 for tx_context in self.tx_contexts.values()
+                     if tx_context.deadline is not None and tx_context.deadline < now)
+        return {
+            'live': len(self.tx_contexts),
+            'leaked': leaked,
+            'pending_requests': sum(tx_context.pending() for tx_context in self.tx_contexts.values()),
+            'created': self.created,
+            'completed': self.completed,
+            'failed': self.failed,
+            'reaped': self.reaped,
+        }
 
     async def queue_msg(self, msg: QueueMessage):
         """Queue a message to be sent to the peer"""
-        tx_context_id = msg.get_msg_txContextId()
-        try:
-            self.tx_queues[tx_context_id]
-        except KeyError:
-            self.tx_queues[tx_context_id] = []
-
-        msg_queue = self.tx_queues[tx_context_id]
-        msg_queue.append(msg)
-        if len(msg_queue) == 1:
-            await self.__send_msg(tx_context_id)
-
-    async def __send_msg(self, tx_context_id):
-        """send the current message to the peer"""
-        msg: QueueMessage = self.__get_current_msg(tx_context_id)
-        if msg:
+        tx_context = self.tx_contexts.get(msg.get_msg_txContextId())
+        if tx_context is None:
+            tx_context = self.open_tx(msg.msg.channel_id, msg.msg.txid)
+        if tx_context.error is not None:
+            msg.fail(tx_context.error)
+            return
+
+        tx_context.waiting.append(msg)
+        await self.__send_msgs(tx_context)
+
+    async def __send_msgs(self, tx_context: TxContext):
+        """send the next waiting message to the peer once the previous one is answered"""
+        while tx_context.waiting and not tx_context.in_flight:
+            msg: QueueMessage = tx_context.waiting.popleft()
+            if msg.future.cancelled():
+                # the caller gave up before the request was sent (ex: the prefetch of a closed iterator)
+                continue
+            tx_context.in_flight.append(msg)
+            # a reader paused by flow control has to resume to read the reply
+            self.handler.flow_changed()
+            if METRICS.enabled:
+                METRICS.peer_queue_wait.observe(time.perf_counter() - msg.queued, msg.method)
             try:
-                await self.context.write(msg.get_msg())
+                await self.handler.write_message(msg.get_msg())
             except Exception as e:
+                if msg in tx_context.in_flight:
+                    tx_context.in_flight.remove(msg)
                 msg.fail(e)
-
-    async def handle_msg_response(self, response):
+                continue
+            msg.sent_at = time.perf_counter()
+            if not msg.sent.done():
+                msg.sent.set_result(None)
+
+    def awaiting_replies(self) -> bool:
+        """True while a request of some transaction was sent and not answered yet"""
+        return any(tx_context.in_flight for tx_context in self.tx_contexts.values())
+
+    def handle_msg_response(self, response):
+        """Hand a peer reply to the request waiting for it, the next waiting request of the transaction is sent in
+        the background so the stream reader never writes"""
         tx_id = response.txid
         channel_id = response.channel_id
         tx_context_id = channel_id + tx_id
-        msg: QueueMessage = self.__get_current_msg(tx_context_id)
+        tx_context = self.tx_contexts.get(tx_context_id)
 
-        if msg:
-            try:
-                # parsed_response = parse_response(self.handler, response, msg.get_method())
-                msg.success(response)
-            except Exception as e:
-                msg.fail(e)
-            await self.__remove_current_and_send_next(tx_context_id)
-
-    def __get_current_msg(self, tx_context_id):
-        """returns the message at the top of the queue for the particular transaction"""
-        msg_queue = self.tx_queues[tx_context_id]
-        if msg_queue:
-            return msg_queue[0]
-        
-        print('Failed to find a message for transaction context id %s' % tx_context_id)
-
-    async def __remove_current_and_send_next(self, tx_context_id):
-        """Remove the current message and send the next message in the queue if there is one"""
-        msg_queue = self.tx_queues[tx_context_id]
-        if msg_queue and len(msg_queue) > 0:
-            msg_queue.pop(0)
-            if len(msg_queue) != 0:
-                await self.__send_msg(tx_context_id)
-                
\ No newline at end of file
+        if not tx_context or not tx_context.in_flight:
+            LOGGER.warning('Failed to find a message for transaction context id %s' % tx_context_id)
+            return
+
+        msg: QueueMessage = tx_context.in_flight.popleft()
+        try:
+            # parsed_response = parse_response(self.handler, response, msg.get_method())
+            msg.success(response)
+        except Exception as e:
+            msg.fail(e)
+        if tx_context.waiting:
+            self.handler.run_in_background(self.__send_msgs(tx_context))
@@ -0,0 +1,159 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Bounded scheduler of the INIT/TRANSACTION messages received on a peer stream
+import asyncio
+from collections import OrderedDict, deque
+
+from src.fabric_shim.logging import LOGGER
+from src.fabric_shim.metrics import METRICS
+
+DEFAULT_MAX_CONCURRENT_TX = 100
+DEFAULT_MAX_PENDING_TX = 1000
+
+
+class TimeStats:
+    """Count, total and max of a duration in seconds"""
+
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self):
+        return {'count': self.count, 'avg': self.total / self.count if self.count else 0.0, 'max': self.max}
+
+
+class TxScheduler:
+    """Runs transactions with at most `max_concurrent` executing at once.
+
+    Transactions waiting for a slot are queued per channel ID and slots are handed out round robin across the
+    channels, so a burst on one channel cannot starve the others. submit() always queues: once a channel has
+    `max_pending` transactions queued the scheduler is saturated (is_saturated()) and the stream reader stops
+    reading new messages, see Handler.pause_reads(). `on_room` is called whenever queued transactions leave the
+    queues, so a paused reader can resume.
+
+    Every task the scheduler spawns is kept until it finishes. Time spent queued and time spent executing are
+    reported separately by stats().
+    """
+
+    def __init__(self, run, max_concurrent: int = DEFAULT_MAX_CONCURRENT_TX,
+                 max_pending: int = DEFAULT_MAX_PENDING_TX, on_room=None) -> None:
+        # coroutine function executing one queued item: run(*args)
+        self._run = run
+        self._on_room = on_room
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_pending = max(0, max_pending)
+        # channel_id -> deque of (args, enqueue time), in round robin order
+        self._queues = OrderedDict()
+        self._tasks = set()
+        self.pending = 0
+        self.running = 0
+        self.wait_time = TimeStats()
+        self.exec_time = TimeStats()
+        # set while nothing is running or queued, see wait_idle()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def submit(self, channel_id, *args):
+        """Queue run(*args) for `channel_id`, it starts as soon as a slot is free"""
+        now = asyncio.get_running_loop().time()
+        if not self.pending and self.running < self.max_concurrent:
+            # nothing is waiting for a slot
+            self._start(args, now)
+            return
+        queue = self._queues.get(channel_id)
+        if queue is None:
+            queue = self._queues[channel_id] = deque()
+        queue.append((args, now))
+        self.pending += 1
+        self._dispatch()
+
+    def is_saturated(self) -> bool:
+        """True while a channel has `max_pending` transactions or more queued"""
+        return any(len(queue) >= self.max_pending for queue in self._queues.values())
+
+    def _dispatch(self):
+        if not self.pending or self.running >= self.max_concurrent:
+            return
+        while self.pending and self.running < self.max_concurrent:
+            channel_id, queue = next(iter(self._queues.items()))
+            args, enqueued = queue.popleft()
+            self.pending -= 1
+            if queue:
+                self._queues.move_to_end(channel_id)
+            else:
+                del self._queues[channel_id]
+            self._start(args, enqueued)
+        if self._on_room is not None:
+            self._on_room()
+
+    def _start(self, args, enqueued):
+        self.running += 1
+        self._idle.clear()
+        task = asyncio.ensure_future(self._execute(args, enqueued))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, args, enqueued):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self.wait_time.add(started - enqueued)
+        if METRICS.enabled:
+            METRICS.tx_queue_wait.observe(started - enqueued)
+        try:
+            await self._run(*args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            LOGGER.error('Scheduled transaction failed: %s' % e)
+        finally:
+            self.exec_time.add(loop.time() - started)
+            self.running -= 1
+            self._dispatch()
+            if not self.running and not self.pending:
+                self._idle.set()
+
+    async def wait_idle(self, timeout: float = None) -> bool:
+        """Wait (at most `timeout` seconds) until no transaction is running or queued, returns False on timeout"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def drop_pending(self):
+        """Remove the queued transactions, returns their args in queue order per channel"""
+        dropped = [args for queue in self._queues.values() for args, _ in queue]
+        self._queues.clear()
+        self.pending = 0
+        if not self.running:
+            self._idle.set()
+        if self._on_room is not None:
+            self._on_room()
+        return dropped
+
+    def cancel_all(self):
+        """Drop the queued transactions and cancel the running ones"""
+        self.drop_pending()
+        for task in list(self._tasks):
+            task.cancel()
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'pending': self.pending,
+            'pending_by_channel': {channel_id: len(queue) for channel_id, queue in self._queues.items()},
+            'tasks': len(self._tasks),
+            'queue_wait': self.wait_time.as_dict(),
+            'execution': self.exec_time.as_dict(),
+        }
@@ -2,17 +2,25 @@
 # contributors. All rights reserved.
 # SPDX-License-Identifier: Apache-2.0
 import asyncio
-import logging
 import os
+import signal
 
 from typing import AsyncIterable, Iterable, Type
 
 import grpc
 import queue
 
-from src.fabric_shim.handler import Handler
+from src.fabric_shim.handler import Handler, DEFAULT_REQUEST_TIMEOUT, DEFAULT_TX_TIMEOUT, DEFAULT_DRAIN_TIMEOUT, \
+    DRAIN_ABORT_GRACE
 from src.fabric_shim.interfaces import Chaincode
+from src.fabric_shim.scheduler import DEFAULT_MAX_CONCURRENT_TX, DEFAULT_MAX_PENDING_TX
 from src.fabric_shim.logging import LOGGER
+from src.fabric_shim.utils import env_flag, env_int, env_float
+from src.fabric_shim.workers import WorkerSupervisor, WORKER_STOP_TIMEOUT
+from src.fabric_shim.executor import ExecutorKind, configure_executor, shutdown_executor
+from src.fabric_shim.metrics import MetricsExporter
+from src.fabric_shim.client import ChaincodeClient, load_client_tls_config
+from src.fabric_shim.transport import TransportConfig
 from fabric_protos_python.peer import chaincode_shim_pb2_grpc as ccshim_grpc_pb2
 from fabric_protos_python.peer import chaincode_shim_pb2 as ccshim_pb2
 
@@ -27,18 +35,40 @@ class ChaincodeService(ccshim_grpc_pb2.ChaincodeServicer):
     Currently only supports a stream connection.
     """
 
-    def __init__(self, chaincode_id: str, chaincode: Chaincode):
+    def __init__(self, chaincode_id: str, chaincode: Chaincode, **handler_options):
         self._ccid = chaincode_id
         self._cc = chaincode
+        self._handler_options = handler_options
+        # handlers of the open peer streams -> task serving the stream
+        self._handlers = {}
+        # set by drain(), streams opened from then on refuse their transactions
+        self.draining = False
 
     async def Connect(self, request_iterator: AsyncIterable[ccshim_pb2.ChaincodeMessage],
                     context: grpc.aio.ServicerContext) -> None: # Iterable[ccshim_pb2.ChaincodeMessage]:
+        handler = Handler(self._ccid, self._cc, **self._handler_options)
+        handler.draining = self.draining
+        self._handlers[handler] = asyncio.current_task()
         try:
-            handler = Handler(self._ccid, self._cc)
             await handler.chat_with_peer(request_iterator, context)
         except asyncio.CancelledError:
-            LOGGER.info("Cancelling RPC due to exhausted resources.")
+            if self.draining:
+                LOGGER.info("Closing the peer stream, the chaincode is shutting down.")
+            else:
+                LOGGER.info("Cancelling RPC due to exhausted resources.")
             # context.abort()
+        finally:
+            self._handlers.pop(handler, None)
+
+    async def drain(self, timeout: float = DEFAULT_DRAIN_TIMEOUT):
+        """Drain every open peer stream (see Handler.drain), returns their reports"""
+        self.draining = True
+        return await asyncio.gather(*(handler.drain(timeout) for handler in list(self._handlers)))
+
+    def close_streams(self):
+        """End the open peer streams, the peer then dials another chaincode instance"""
+        for task in list(self._handlers.values()):
+            task.cancel()
 
 
 def load_tls_config(key: bytes = None, cert: bytes = None, client_ca_certs: bytes = None) -> grpc.ServerCredentials:
@@ -54,7 +84,14 @@ def load_tls_config(key: bytes = None, cert: bytes = None, client_ca_certs: byte
 
 
 def _internal_server(**kwargs) -> grpc.aio.Server:
-    server = grpc.aio.server()
+    return _build_server(**kwargs)[0]
+
+
+def _build_server(**kwargs):
+    """Create the chaincode server, returns it with its ChaincodeService"""
+    transport = kwargs.pop("transport", None) or TransportConfig()
+    options = transport.server_options() + list(kwargs.pop("options", None) or [])
+    server = grpc.aio.server(options=options, compression=transport.grpc_compression())
 
     key = kwargs.pop("key", os.getenv('CORE_TLS_CLIENT_KEY_PATH'))
     cert = kwargs.pop("cert", os.getenv('CORE_TLS_CLIENT_CERT_PATH'))
@@ -71,23 +108,141 @@ def _internal_server(**kwargs) -> grpc.aio.Server:
     ccid = kwargs.get("ccid")
     cc = kwargs.pop("cc")
 
-    ccshim_grpc_pb2.add_ChaincodeServicer_to_server(ChaincodeService(ccid, cc), server)
-    logging.info('Server is listening at port :%d', port)
-    return server
+    write_batch = kwargs.pop("write_batch", False)
+    request_timeout = kwargs.pop("request_timeout", DEFAULT_REQUEST_TIMEOUT)
+    tx_timeout = kwargs.pop("tx_timeout", DEFAULT_TX_TIMEOUT)
+    max_concurrent_tx = kwargs.pop("max_concurrent_tx", DEFAULT_MAX_CONCURRENT_TX)
+    max_pending_tx = kwargs.pop("max_pending_tx", DEFAULT_MAX_PENDING_TX)
+    compression_threshold = transport.compression_threshold if transport.compresses() else None
+
+    service = ChaincodeService(ccid, cc, write_batch=write_batch,
+                               request_timeout=request_timeout, tx_timeout=tx_timeout,
+                               max_concurrent_tx=max_concurrent_tx, max_pending_tx=max_pending_tx,
+                               compression_threshold=compression_threshold)
+    ccshim_grpc_pb2.add_ChaincodeServicer_to_server(service, server)
+    LOGGER.info('Server is listening at port :%d', port)
+    return server, service
 
 
-async def _internal_start(server: grpc.aio.Server) -> None:
+async def _graceful_shutdown(server: grpc.aio.Server, service: ChaincodeService, drain_timeout: float) -> dict:
+    # The transactions in flight get drain_timeout seconds to complete and send their COMPLETED message (the peer
+    # answers their requests on the open streams), the ones arriving meanwhile are answered with an error. The
+    # drained streams are then closed, so the peer dials another chaincode instance, and the server stops: the grace
+    # period only covers RPCs that do not end when cancelled. Returns the drain reports of the streams, summed up.
+    reports = await service.drain(drain_timeout)
+    total = {key: sum(report[key] for report in reports)
+             for key in ('in_flight', 'finished', 'aborted', 'dropped', 'refused')}
+    total['streams'] = len(reports)
+    total['seconds'] = max((report['seconds'] for report in reports), default=0.0)
+    LOGGER.info('Drained %(streams)d peer streams in %(seconds).2fs: %(in_flight)d in-flight transactions, '
+                '%(finished)d finished, %(aborted)d aborted, %(dropped)d dropped, %(refused)d refused', total)
+    service.close_streams()
+    await server.stop(drain_timeout)
+    return total
+
+
+async def _internal_start(server: grpc.aio.Server, exporter: MetricsExporter = None,
+                          service: ChaincodeService = None, drain_timeout: float = DEFAULT_DRAIN_TIMEOUT) -> None:
     await server.start()
+    if exporter is not None:
+        await exporter.start()
+
+    shutdown = []
+
+    def graceful_shutdown():
+        # SIGTERM and the loop cleanup share the same shutdown
+        if not shutdown:
+            if service is None:
+                shutdown.append(asyncio.ensure_future(server.stop(3)))
+            else:
+                shutdown.append(asyncio.ensure_future(_graceful_shutdown(server, service, drain_timeout)))
+        return shutdown[0]
 
     async def server_graceful_shutdown():
-        logging.info("Starting graceful shutdown...")
-        # Shuts down the server with 3 seconds of grace period. During the
-        # grace period, the server won't accept new connections and allow
-        # existing RPCs to continue within the grace period.
-        await server.stop(3)
+        LOGGER.info("Starting graceful shutdown...")
+        await graceful_shutdown()
 
     _cleanup_coroutines.append(server_graceful_shutdown())
-    await server.wait_for_termination()
+
+    # SIGTERM (container stop, rolling restart, worker supervisor) drains the server too
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, graceful_shutdown)
+    except (NotImplementedError, RuntimeError):
+        pass
+    try:
+        await server.wait_for_termination()
+    finally:
+        if exporter is not None:
+            await exporter.stop()
+
+
+def _serve(server_kwargs) -> None:
+    """Run a chaincode server on a new event loop until it terminates"""
+    server_kwargs = dict(server_kwargs)
+    metrics_address = server_kwargs.pop("metrics_address", None)
+    metrics_file = server_kwargs.pop("metrics_file", None)
+    metrics_interval = server_kwargs.pop("metrics_interval", 15.0)
+    drain_timeout = server_kwargs.pop("drain_timeout", DEFAULT_DRAIN_TIMEOUT)
+    # grpc.aio binds the server to the current event loop when it is created
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server, service = _build_server(**server_kwargs)
+    exporter = None
+    if metrics_address or metrics_file:
+        exporter = MetricsExporter(metrics_address, metrics_file, metrics_interval)
+    try:
+        loop.run_until_complete(_internal_start(server, exporter, service, drain_timeout))
+    finally:
+        loop.run_until_complete(_run_cleanup())
+        loop.close()
+        shutdown_executor()
+
+
+async def _run_cleanup():
+    while _cleanup_coroutines:
+        await _cleanup_coroutines.pop(0)
+
+
+async def _internal_connect(client: ChaincodeClient, exporter: MetricsExporter = None,
+                            drain_timeout: float = DEFAULT_DRAIN_TIMEOUT) -> None:
+    if exporter is not None:
+        await exporter.start()
+    # SIGTERM stops the client once the transactions in flight are drained: the stream is then closed and no
+    # reconnection is attempted
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM,
+                                                      lambda: asyncio.ensure_future(client.stop(drain_timeout)))
+    except (NotImplementedError, RuntimeError):
+        pass
+    try:
+        await client.run()
+    finally:
+        if exporter is not None:
+            await exporter.stop()
+
+
+def _connect(client_kwargs) -> None:
+    """Run a chaincode as a client of the peer on a new event loop until it is stopped"""
+    client_kwargs = dict(client_kwargs)
+    metrics_address = client_kwargs.pop("metrics_address", None)
+    metrics_file = client_kwargs.pop("metrics_file", None)
+    metrics_interval = client_kwargs.pop("metrics_interval", 15.0)
+    drain_timeout = client_kwargs.pop("drain_timeout", DEFAULT_DRAIN_TIMEOUT)
+    root_certs = client_kwargs.pop("client_ca_certs", None) or os.getenv('CORE_PEER_TLS_ROOTCERT_FILE')
+    key = client_kwargs.pop("key", None) or os.getenv('CORE_TLS_CLIENT_KEY_PATH')
+    cert = client_kwargs.pop("cert", None) or os.getenv('CORE_TLS_CLIENT_CERT_PATH')
+    credentials = load_client_tls_config(root_certs, key, cert) if root_certs else None
+    exporter = None
+    if metrics_address or metrics_file:
+        exporter = MetricsExporter(metrics_address, metrics_file, metrics_interval)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        client = ChaincodeClient(credentials=credentials, **client_kwargs)
+        loop.run_until_complete(_internal_connect(client, exporter, drain_timeout))
+    finally:
+        loop.close()
+        shutdown_executor()
 
 
 def start(cc: Type[Chaincode],
@@ -95,7 +250,22 @@ def start(cc: Type[Chaincode],
           address: str = None,
           key: bytes = None,
           cert: bytes = None,
-          client_ca_certs: bytes = None):
+          client_ca_certs: bytes = None,
+          write_batch: bool = False,
+          request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+          tx_timeout: float = DEFAULT_TX_TIMEOUT,
+          max_concurrent_tx: int = DEFAULT_MAX_CONCURRENT_TX,
+          max_pending_tx: int = DEFAULT_MAX_PENDING_TX,
+          workers: int = 1,
+          executor: str = ExecutorKind.THREAD,
+          executor_workers: int = None,
+          executor_queue: int = None,
+          metrics_address: str = None,
+          metrics_file: str = None,
+          metrics_interval: float = 15.0,
+          peer_address: str = None,
+          transport: TransportConfig = None,
+          drain_timeout: float = DEFAULT_DRAIN_TIMEOUT):
     """
     start the server
 
@@ -105,21 +275,94 @@ def start(cc: Type[Chaincode],
             that this argument is compatible with 'key' - if some
             are missing, 'TLS disabled'.
     client_ca_certs   Set if connecting peer should be verified.
+    write_batch   Buffer put_state/delete_state and send the write set once per
+            transaction (env CHAINCODE_WRITE_BATCH).
+    request_timeout   Seconds to wait for the peer to answer a request, 0 to
+            wait forever (env CHAINCODE_REQUEST_TIMEOUT).
+    tx_timeout   Seconds a transaction may run before it is answered with an
+            error response, 0 for no limit (env CHAINCODE_TX_TIMEOUT).
+    max_concurrent_tx   Transactions executing at once on a peer stream
+            (env CHAINCODE_MAX_CONCURRENT_TX).
+    max_pending_tx   Transactions queued per channel waiting for a slot.
+            Once a channel queue is full the chaincode stops reading the
+            peer stream until it has room (env CHAINCODE_MAX_PENDING_TX).
+    workers   Number of server processes sharing the listen address through
+            SO_REUSEPORT, each with its own event loop (env CHAINCODE_WORKERS).
+            Crashed workers are restarted.
+    executor   Pool running the @cpu_bound chaincode functions, "thread" or
+            "process" (env CHAINCODE_EXECUTOR).
+    executor_workers   Size of that pool (env CHAINCODE_EXECUTOR_WORKERS).
+    executor_queue   Calls allowed to wait inside the pool, the ones beyond
+            wait on the event loop (env CHAINCODE_EXECUTOR_QUEUE).
+    metrics_address   host:port serving the metrics in the Prometheus text
+            format at /metrics (env CHAINCODE_METRICS_ADDRESS). With several
+            workers, worker i listens on port + i.
+    metrics_file   File the metrics are written to every metrics_interval
+            seconds, for a textfile collector (env CHAINCODE_METRICS_FILE and
+            CHAINCODE_METRICS_INTERVAL). Metrics are only recorded when one of
+            these is set.
+    peer_address   host:port of the peer's chaincode listener. When set the
+            chaincode dials the peer (ChaincodeSupport.Register) instead of
+            listening on `address`, reconnecting with backoff when the stream
+            is lost (env CORE_PEER_ADDRESS). client_ca_certs then holds the
+            peer's TLS root certificates and key/cert the client certificate.
+    transport   gRPC settings of the peer stream (TransportConfig):
+            compression, message size limits, keepalive and flow control. Its
+            fields are overridden by the CHAINCODE_GRPC_* env variables, ex:
+            CHAINCODE_GRPC_COMPRESSION=gzip, CHAINCODE_GRPC_MAX_MESSAGE_SIZE.
+    drain_timeout   Seconds the transactions in flight get to complete after
+            SIGTERM, before they are aborted (env CHAINCODE_DRAIN_TIMEOUT).
+            Meanwhile new transactions are answered with an error, then the
+            peer streams are closed. Keep it below the time the orchestrator
+            waits before killing the process (terminationGracePeriodSeconds).
     """
     cc_id = os.getenv('CHAINCODE_ID', cc_id)
     address = os.getenv('CHAINCODE_SERVER_ADDRESS', address)
+    write_batch = env_flag('CHAINCODE_WRITE_BATCH', write_batch)
+    request_timeout = env_float('CHAINCODE_REQUEST_TIMEOUT', request_timeout)
+    tx_timeout = env_float('CHAINCODE_TX_TIMEOUT', tx_timeout)
+    max_concurrent_tx = env_int('CHAINCODE_MAX_CONCURRENT_TX', max_concurrent_tx)
+    max_pending_tx = env_int('CHAINCODE_MAX_PENDING_TX', max_pending_tx)
+    workers = env_int('CHAINCODE_WORKERS', workers)
+    executor = os.getenv('CHAINCODE_EXECUTOR', executor)
+    executor_workers = env_int('CHAINCODE_EXECUTOR_WORKERS', executor_workers)
+    executor_queue = env_int('CHAINCODE_EXECUTOR_QUEUE', executor_queue)
+    metrics_address = os.getenv('CHAINCODE_METRICS_ADDRESS', metrics_address)
+    metrics_file = os.getenv('CHAINCODE_METRICS_FILE', metrics_file)
+    metrics_interval = env_float('CHAINCODE_METRICS_INTERVAL', metrics_interval)
+    peer_address = os.getenv('CORE_PEER_ADDRESS', peer_address)
+    transport = TransportConfig.from_env(transport)
+    drain_timeout = env_float('CHAINCODE_DRAIN_TIMEOUT', drain_timeout)
     if cc_id is None or cc_id == "":
         raise Exception("cc_id must be specified")
-    elif address is None or address == "":
+    elif not peer_address and (address is None or address == ""):
         raise Exception("address must be specified")
     # TODO: valid
     elif isinstance(cc, Chaincode):
         raise Exception("chaincode must be specified")
 
-    server = _internal_server(ccid=cc_id, address=address, cc=cc, key=key, cert=cert, client_ca_certs=client_ca_certs)
-    loop = asyncio.get_event_loop()
-    try:
-        loop.run_until_complete(_internal_start(server))
-    finally:
-        loop.run_until_complete(*_cleanup_coroutines)
-        loop.close()
+    configure_executor(executor, executor_workers, executor_queue)
+    if peer_address:
+        if workers and workers > 1:
+            # the peer accepts one registration per chaincode id
+            raise Exception("workers must be 1 when the chaincode connects to the peer")
+        _connect(dict(peer_address=peer_address, cc_id=cc_id, cc=cc, key=key, cert=cert,
+                      client_ca_certs=client_ca_certs, write_batch=write_batch,
+                      request_timeout=request_timeout, tx_timeout=tx_timeout,
+                      max_concurrent_tx=max_concurrent_tx, max_pending_tx=max_pending_tx,
+                      metrics_address=metrics_address, metrics_file=metrics_file,
+                      metrics_interval=metrics_interval, transport=transport, drain_timeout=drain_timeout))
+        return
+    server_kwargs = dict(ccid=cc_id, address=address, cc=cc, key=key, cert=cert, client_ca_certs=client_ca_certs,
+                         write_batch=write_batch,
+                         request_timeout=request_timeout, tx_timeout=tx_timeout,
+                         max_concurrent_tx=max_concurrent_tx, max_pending_tx=max_pending_tx,
+                         metrics_address=metrics_address, metrics_file=metrics_file,
+                         metrics_interval=metrics_interval, transport=transport, drain_timeout=drain_timeout)
+    if workers and workers > 1:
+        server_kwargs["options"] = [("grpc.so_reuseport", 1)]
+        # the workers are killed if they are still draining or stopping (see _graceful_shutdown) past this
+        stop_timeout = max(WORKER_STOP_TIMEOUT, 2 * drain_timeout + DRAIN_ABORT_GRACE + 5)
+        WorkerSupervisor(workers, _serve, (server_kwargs,), stop_timeout=stop_timeout).run()
+    else:
+        _serve(server_kwargs)
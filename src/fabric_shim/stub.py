@@ -9,7 +9,15 @@ from fabric_protos_python.peer import proposal_pb2 as pr_pb
 from fabric_protos_python.msp import identities_pb2 as id_pb
 from fabric_protos_python.peer import chaincode_event_pb2 as e_pb
 from collections.abc import Sequence
-from src.fabric_shim.logging import LOGGER
+import asyncio
+import time
+from src.fabric_shim.logging import LOGGER, Redacted
+from src.fabric_shim.metrics import METRICS
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.cache import TxCache
+from src.fabric_shim.write_batch import WriteBatch
+from src.fabric_shim.iterators import StateQueryIterator, QueryResultIterator, HistoryQueryIterator
+from src.fabric_shim.args import ChaincodeArgs
 
 VALIDATION_PARAMETER: str = 'VALIDATION_PARAMETER'
 
@@ -22,57 +30,112 @@ class ChaincodeStub(ChaincodeStubInterface):
         self.channel_id = channel_id
         self.tx_id = tx_id
         self.cc_input = cc_input
+        self.args = ChaincodeArgs(cc_input.args)
         self.signed_proposal_pb = signed_proposal_pb
         self.validationParameterMetakey = VALIDATION_PARAMETER
+        # committed values read during this transaction, dropped when the COMPLETED message is sent
+        self.read_cache = TxCache()
+        # responses of the chaincode to chaincode calls made during this transaction
+        self.invoke_cache = TxCache()
+        # buffered write set, sent to the peer by flush_writes() before the COMPLETED message
+        self.write_batch = WriteBatch() if getattr(client, 'write_batch', False) else None
+        # query iterators opened by this transaction, closed when it completes
+        self._iterators = []
+        # set for read-only (query) transactions, writes are refused
+        self.read_only = False
+        # parts of the SignedProposal, decoded on first access (see below)
+        self._proposal = None
+        self._header = None
+        self._signature_header = None
+        self._creator = None
+        self._channel_header = None
+        self._proposal_payload = None
 
-        if self.signed_proposal_pb:
-            decoded_sp = {
-                'signature': self.signed_proposal_pb.signature
-            }
+    # The SignedProposal is decoded lazily: each part below is decoded on first access and kept in its `_name`
+    # attribute, so a transaction that never looks at its creator, timestamp or proposal payload does not pay for
+    # decoding them. Plain attributes rather than functools.cached_property, whose lookup (and lock, up to Python
+    # 3.11) costs more than the decoding it saves on the creator + timestamp path.
+
+    @property
+    def proposal(self):
+        if self._proposal is None and self.signed_proposal_pb is not None:
             proposal = pr_pb.Proposal.FromString(self.signed_proposal_pb.proposal_bytes)
-            decoded_sp['proposal'] = {}
-            self.proposal = proposal
 
             if not proposal.header or len(proposal.header) == 0:
                 raise Exception('Proposal header is empty')
 
             if not proposal.payload or len(proposal.payload) == 0:
                 raise Exception('Proposal payload is empty')
+            self._proposal = proposal
+        return self._proposal
 
+    @property
+    def header(self):
+        if self._header is None:
+            proposal = self.proposal
+            if proposal is None:
+                return None
             try:
-                header = cm_pb.Header.FromString(proposal.header)
-                decoded_sp['proposal']['header'] = {}
+                self._header = cm_pb.Header.FromString(proposal.header)
             except Exception as e:
                 raise Exception('Could not extract the header from the proposal: ' + str(e))
+        return self._header
 
+    @property
+    def signature_header(self):
+        if self._signature_header is None:
+            header = self.header
+            if header is None:
+                return None
             try:
-                signature_header = cm_pb.SignatureHeader.FromString(header.signature_header)
-                decoded_sp['proposal']['header']['signatureHeader'] = \
-                    {'nonce': signature_header.nonce, 'creator_u8': signature_header.creator}
+                self._signature_header = cm_pb.SignatureHeader.FromString(header.signature_header)
             except Exception as e:
                 raise Exception('Decoding SignatureHeader failed: ' + str(e))
+        return self._signature_header
 
+    @property
+    def creator(self):
+        if self._creator is None:
+            signature_header = self.signature_header
+            if signature_header is None:
+                return None
             try:
                 creator = id_pb.SerializedIdentity.FromString(signature_header.creator)
-                decoded_sp['proposal']['header']['signatureHeader']['creator'] = creator
-                self.creator = {'mspid': creator.mspid, 'idBytes': creator.id_bytes}
             except Exception as e:
                 raise Exception('Decoding SerializedIdentity failed: ' + str(e))
+            self._creator = {'mspid': creator.mspid, 'idBytes': creator.id_bytes}
+        return self._creator
 
+    @property
+    def channel_header(self):
+        if self._channel_header is None:
+            header = self.header
+            if header is None:
+                return None
             try:
-                channel_header = cm_pb.ChannelHeader.FromString(header.channel_header)
-                decoded_sp['proposal']['header']['channelHeader'] = channel_header
-                self.tx_timestamp = channel_header.timestamp
+                self._channel_header = cm_pb.ChannelHeader.FromString(header.channel_header)
             except Exception as e:
                 raise Exception('Decoding ChannelHeader failed: ' + str(e))
+        return self._channel_header
+
+    @property
+    def tx_timestamp(self):
+        channel_header = self.channel_header
+        if channel_header is None:
+            return None
+        return channel_header.timestamp
 
+    @property
+    def proposal_payload(self):
+        if self._proposal_payload is None:
+            proposal = self.proposal
+            if proposal is None:
+                return None
             try:
-                ccpp = pr_pb.ChaincodeProposalPayload.FromString(proposal.payload)
-                decoded_sp['proposal']['payload'] = ccpp
+                self._proposal_payload = pr_pb.ChaincodeProposalPayload.FromString(proposal.payload)
             except Exception as e:
-                raise Exception('Decoding ChaincodeProposalPayload failed: %s' + str(e))
-
-            self.signed_proposal_pb = decoded_sp
+                raise Exception('Decoding ChaincodeProposalPayload failed: ' + str(e))
+        return self._proposal_payload
 
     def get_channel_id(self):
         """Get the channel ID of the chaincode calling transaction"""
@@ -80,68 +143,405 @@ class ChaincodeStub(ChaincodeStubInterface):
 
     def get_tx_timestamp(self):
         """Get the timestamp of the chaincode calling transaction"""
-        self.tx_timestamp
+        return self.tx_timestamp
 
     def get_creator(self):
         """Get the user ID of the chaincode calling transaction"""
-        self.creator
+        return self.creator
+
+    def get_transient(self):
+        """Get the transient map of the chaincode calling transaction"""
+        if self.proposal_payload is None:
+            return {}
+        return dict(self.proposal_payload.TransientMap)
 
     def get_txid(self):
         """Get the ID of the chaincode calling transaction"""
         return self.tx_id
 
+    def get_args(self):
+        """Get the args of the chaincode calling transaction (function name first) as a ChaincodeArgs: indexing
+        gives the raw bytes, string(i) and view(i) decode or wrap one arg on demand"""
+        return self.args
+
+    def get_function(self):
+        """Get the function name of the chaincode calling transaction, without decoding the other args"""
+        return self.args.function
+
+    def get_string_args(self):
+        """Get all the args of the chaincode calling transaction decoded as str, the function name first"""
+        return self.args.strings()
+
     def get_function_and_parameters(self):
         """Get function name and parameters of the chaincode calling transaction"""
-        args = [arg.decode() for arg in self.cc_input.args]
-        function: str = args[0]
-        params = args[1:]
-
-        return function, params
+        return self.args.function, self.args.strings(1)
 
     async def get_state(self, key: str): #-> bytearray:
-        """Get asset state from ledger"""
-        LOGGER.info('get_state called with key:%s' % key)
+        """Get asset state from ledger
+
+        Repeated reads of a key within the transaction are served from the read cache. The peer never returns values
+        written by this transaction (put_state/delete_state), so the cache holds committed values only and writes
+        do not touch it.
+        """
+        LOGGER.debug('get_state called with key:%s', key)
         # Access public data by setting the collection to empty string
-        collection = ''
-        return await self.client.handle_get_state(collection, key, self.channel_id, self.tx_id)
+        return await self._get_state('', key)
+
+    async def _get_state(self, collection, key):
+        return await self.read_cache.get_or_load(
+            (collection, key),
+            lambda: self.client.handle_get_state(collection, key, self.channel_id, self.tx_id))
+
+    async def get_states(self, keys):
+        """Get the state of several keys, returned in the order of `keys`
+
+        Each key is read once per transaction: keys in the read cache, or repeated in `keys`, are not requested
+        again. When the peer advertises GET_STATE_MULTIPLE the missing keys cost one round trip per
+        max_size_get_multiple_keys keys. Otherwise each gets a GET_STATE request, and since the requests of a
+        transaction reach the peer one at a time (see MsgQueueHandler) that is one round trip per key.
+        """
+        return await self._get_states('', keys)
+
+    async def _get_states(self, collection, keys):
+        if not self.client.peer_supports_get_multiple():
+            return list(await asyncio.gather(*(self._get_state(collection, key) for key in keys)))
+
+        async def load(missing):
+            return await self.client.handle_get_state_multiple(
+                collection, [key for _, key in missing], self.channel_id, self.tx_id)
+
+        return await self.read_cache.get_or_load_many([(collection, key) for key in keys], load)
+
+    def get_read_cache_stats(self):
+        """Get the hit/miss counters of the transaction read cache"""
+        return self.read_cache.stats()
 
     async def put_state(self, key: str, value):
         """Put asset state to ledger"""
-        LOGGER.info('put_state called with key:%s and value:%s' % (key, value))
+        LOGGER.debug('put_state called with key:%s and value:%s', key, Redacted(value))
         # Access public data by setting the collection to empty string
-        collection = ''
+        return await self._put_state('', key, value)
+
+    async def _put_state(self, collection, key, value):
+        self._check_writable(key)
         if isinstance(value, str):
-            value = bytes(value.encode())
+            value = value.encode()
+        elif not isinstance(value, bytes):
+            # memoryview/bytearray, protobuf takes bytes only
+            value = bytes(value)
+        if self.write_batch is not None:
+            self.write_batch.put(collection, key, value)
+            return
         return await self.client.handle_put_state(collection, key, value, self.channel_id, self.tx_id)
 
     async def delete_state(self, key: str):
         """Delete asset state from ledger"""
-        LOGGER.info('delete_state called with key:%s' % key)
+        LOGGER.debug('delete_state called with key:%s', key)
         # Access public data by setting the collection to empty string
-        collection = ''
+        return await self._delete_state('', key)
+
+    async def _delete_state(self, collection, key):
+        self._check_writable(key)
+        if self.write_batch is not None:
+            self.write_batch.delete(collection, key)
+            return
         return await self.client.handle_delete_state(collection, key, self.channel_id, self.tx_id)
 
+    def _check_writable(self, key):
+        if self.read_only:
+            raise Exception('transaction %s is read-only, it cannot write key %s' % (self.tx_id, key))
+
+    async def flush_writes(self):
+        """Send the buffered write set to the peer. No-op when write batching is disabled"""
+        if not self.write_batch:
+            return
+        records = list(self.write_batch.records())
+        self.write_batch.clear()
+        await self.client.handle_write_batch(records, self.channel_id, self.tx_id)
+
+    async def get_state_by_range(self, start_key: str, end_key: str):
+        """Get an async iterator over the KV pairs of the keys in the range [start_key, end_key)
+
+        An empty start_key or end_key means an unbounded start or end of the range.
+        """
+        LOGGER.debug('get_state_by_range called with startKey:%s and endKey:%s', start_key, end_key)
+        validate_simple_keys((start_key, end_key))
+        iterator, _ = await self._get_state_by_range('', start_key or EMPTY_KEY_SUBSTITUTE, end_key)
+        return iterator
+
+    async def get_state_by_range_with_pagination(self, start_key: str, end_key: str, page_size: int,
+                                                 bookmark: str = ''):
+        """Get a page of at most `page_size` KV pairs of the keys in the range [start_key, end_key)
+
+        Returns the iterator and the QueryResponseMetadata (fetched_records_count and the bookmark where the next
+        page starts).
+        """
+        LOGGER.debug('get_state_by_range_with_pagination called with startKey:%s, endKey:%s and pageSize:%s',
+                     start_key, end_key, page_size)
+        validate_simple_keys((start_key, end_key))
+        return await self._get_state_by_range('', start_key or EMPTY_KEY_SUBSTITUTE, end_key,
+                                              pagination_metadata(page_size, bookmark))
+
+    async def _get_state_by_range(self, collection, start_key, end_key, metadata=None):
+        response = await self.client.handle_get_state_by_range(
+            collection, start_key, end_key, self.channel_id, self.tx_id, metadata)
+        return self._track_iterator(StateQueryIterator(self.client, self.channel_id, self.tx_id, response)), \
+            decode_query_response_metadata(response)
+
+    def _track_iterator(self, iterator):
+        self._iterators.append(iterator)
+        return iterator
+
+    async def close_iterators(self):
+        """Close the query iterators the transaction left open (ex: by leaving an `async for` loop early), so the
+        peer gets their QUERY_STATE_CLOSE before the transaction completes"""
+        iterators, self._iterators = self._iterators, []
+        for iterator in iterators:
+            try:
+                await iterator.close()
+            except Exception as e:
+                LOGGER.warning('Closing a query iterator of transaction %s failed: %s', self.tx_id, e)
+
+    def release_iterators(self):
+        """Release the query iterators left open by the transaction, without telling the peer"""
+        for iterator in self._iterators:
+            iterator.release()
+        self._iterators = []
+
+    async def get_query_result(self, query: str, decode=None):
+        """Get an async iterator over the KV results of a rich query (CouchDB only)
+
+        With a `decode` function (ex: json.loads) the values are decoded page by page in the chaincode executor and
+        DecodedKV(key, value) tuples are yielded, see QueryResultIterator.
+        """
+        LOGGER.debug('get_query_result called with query:%s', query)
+        iterator, _ = await self._get_query_result('', query, decode)
+        return iterator
+
+    async def get_query_result_with_pagination(self, query: str, page_size: int, bookmark: str = '', decode=None):
+        """Get a page of at most `page_size` results of a rich query (CouchDB only)
+
+        Returns the iterator and the QueryResponseMetadata (fetched_records_count and the bookmark where the next
+        page starts). A large query can be split across transactions by passing the bookmark to the next one.
+        """
+        LOGGER.debug('get_query_result_with_pagination called with query:%s and pageSize:%s', query, page_size)
+        return await self._get_query_result('', query, decode, pagination_metadata(page_size, bookmark))
+
+    async def _get_query_result(self, collection, query, decode, metadata=None):
+        response = await self.client.handle_get_query_result(collection, query, self.channel_id, self.tx_id, metadata)
+        return self._track_iterator(QueryResultIterator(self.client, self.channel_id, self.tx_id, response, decode)), \
+            decode_query_response_metadata(response)
+
+    async def get_history_for_key(self, key: str):
+        """Get an async iterator over the modifications (KeyModification) of `key`, newest first
+
+        Pages are fetched in the background and each entry is decoded when it is yielded, so walking a long history
+        holds at most two pages in memory. See src.fabric_shim.history for streaming aggregations over it.
+        """
+        LOGGER.debug('get_history_for_key called with key:%s', key)
+        response = await self.client.handle_get_history_for_key(key, self.channel_id, self.tx_id)
+        return self._track_iterator(HistoryQueryIterator(self.client, self.channel_id, self.tx_id, response))
+
     def create_composite_key(self, object_type, attributes):
         """Creates a composite key by combining the objectType string
         and the given `attributes` to form a composite key"""
-        validate_composite_key_attribute(object_type)
         if not isinstance(attributes, Sequence):
             raise Exception('attributes must be an array')
+        return encode_composite_key(object_type, attributes)
 
-        composite_key = COMPOSITEKEY_NS + object_type + MIN_UNICODE_RUNE_VALUE
-        for attribute in attributes:
-            validate_composite_key_attribute(attribute)
-            composite_key = composite_key + attribute + MIN_UNICODE_RUNE_VALUE
-        return composite_key
+    def create_composite_keys(self, object_type, attributes_list):
+        """Creates the composite keys of many `attributes` lists sharing the same objectType"""
+        return encode_composite_keys(object_type, attributes_list)
 
     def split_composite_key(self, composite_key):
-        object_type = None
-        attributes = []
-        if composite_key and len(composite_key) > 1 and composite_key[0] == COMPOSITEKEY_NS:
-            split_key = composite_key[1:].split(MIN_UNICODE_RUNE_VALUE)
-            object_type = split_key[0]
-            split_key.pop()
-            if len(split_key) > 1:
-                split_key.pop(0)
-                attributes = split_key
-        return object_type, attributes
+        """Split a composite key into its objectType and attributes"""
+        return decode_composite_key(composite_key)
+
+    def split_composite_keys(self, composite_keys):
+        """Split many composite keys, ex: the keys returned by a partial composite key query"""
+        return decode_composite_keys(composite_keys)
+
+    async def get_state_by_partial_composite_key(self, object_type, attributes):
+        """Get an async iterator over the KV pairs whose composite key starts with objectType and `attributes`"""
+        LOGGER.debug('get_state_by_partial_composite_key called with objectType:%s', object_type)
+        start_key = self.create_composite_key(object_type, attributes)
+        iterator, _ = await self._get_state_by_range('', start_key, start_key + MAX_UNICODE_RUNE_VALUE)
+        return iterator
+
+    async def get_state_by_partial_composite_key_with_pagination(self, object_type, attributes, page_size: int,
+                                                                 bookmark: str = ''):
+        """Get a page of at most `page_size` KV pairs whose composite key starts with objectType and `attributes`
+
+        Returns the iterator and the QueryResponseMetadata, pass its bookmark to resume with the next page.
+        """
+        LOGGER.debug('get_state_by_partial_composite_key_with_pagination called with objectType:%s and pageSize:%s',
+                     object_type, page_size)
+        start_key = self.create_composite_key(object_type, attributes)
+        return await self._get_state_by_range('', start_key, start_key + MAX_UNICODE_RUNE_VALUE,
+                                              pagination_metadata(page_size, bookmark))
+
+    # Private data. The collection names a private data collection of the chaincode definition, reads and writes go
+    # through the same read cache and write batch as the public state, keyed by (collection, key).
+
+    @staticmethod
+    def _check_collection(collection):
+        if not collection or not isinstance(collection, str):
+            raise Exception('collection must be a non-empty string')
+
+    async def get_private_data(self, collection: str, key: str):
+        """Get the value of `key` in the private data `collection`, b'' if it does not exist"""
+        LOGGER.debug('get_private_data called with collection:%s and key:%s', collection, key)
+        self._check_collection(collection)
+        return await self._get_state(collection, key)
+
+    async def get_private_data_multiple(self, collection: str, keys):
+        """Get the values of several keys of the private data `collection`, returned in the order of `keys`
+
+        Like get_states(), only the keys missing from the read cache are requested, with GET_STATE_MULTIPLE when the
+        peer supports it.
+        """
+        self._check_collection(collection)
+        return await self._get_states(collection, keys)
+
+    async def get_private_data_hash(self, collection: str, key: str):
+        """Get the hash of the value of `key` in the private data `collection`, b'' if it does not exist
+
+        Unlike get_private_data() it works on peers that are not members of the collection, and the value itself
+        is never sent to the chaincode.
+        """
+        LOGGER.debug('get_private_data_hash called with collection:%s and key:%s', collection, key)
+        self._check_collection(collection)
+        return await self.read_cache.get_or_load(
+            (collection, key, 'hash'),
+            lambda: self.client.handle_get_private_data_hash(collection, key, self.channel_id, self.tx_id))
+
+    async def has_private_data(self, collection: str, key: str) -> bool:
+        """Tell whether `key` exists in the private data `collection`, without transferring its value
+
+        A value already read by this transaction answers without a peer request, otherwise its hash is asked for.
+        """
+        self._check_collection(collection)
+        if (collection, key) in self.read_cache:
+            return bool(await self._get_state(collection, key))
+        return bool(await self.get_private_data_hash(collection, key))
+
+    async def put_private_data(self, collection: str, key: str, value):
+        """Put the value of `key` in the private data `collection`"""
+        LOGGER.debug('put_private_data called with collection:%s, key:%s and value:%s',
+                     collection, key, Redacted(value))
+        self._check_collection(collection)
+        if not key:
+            raise Exception('key must not be empty')
+        return await self._put_state(collection, key, value)
+
+    async def delete_private_data(self, collection: str, key: str):
+        """Delete `key` from the private data `collection`"""
+        LOGGER.debug('delete_private_data called with collection:%s and key:%s', collection, key)
+        self._check_collection(collection)
+        return await self._delete_state(collection, key)
+
+    async def purge_private_data(self, collection: str, key: str):
+        """Delete `key` from the private data `collection` and purge its history from the private state of the peers
+
+        The purge is not buffered, the writes buffered before it are flushed first so the peer sees them in order.
+        """
+        LOGGER.debug('purge_private_data called with collection:%s and key:%s', collection, key)
+        self._check_collection(collection)
+        self._check_writable(key)
+        await self.flush_writes()
+        await self.client.handle_purge_private_data(collection, key, self.channel_id, self.tx_id)
+
+    async def set_private_data_validation_parameter(self, collection: str, key: str, ep: bytes):
+        """Set the key-level endorsement policy of `key` in the private data `collection`
+
+        Like purge_private_data(), the metadata write is not buffered and the buffered writes are flushed first.
+        """
+        self._check_collection(collection)
+        self._check_writable(key)
+        await self.flush_writes()
+        await self.client.handle_put_state_metadata(collection, key, self.validationParameterMetakey, ep,
+                                                    self.channel_id, self.tx_id)
+
+    async def get_private_data_validation_parameter(self, collection: str, key: str):
+        """Get the key-level endorsement policy of `key` in the private data `collection`, b'' if it has none"""
+        self._check_collection(collection)
+        metadata = await self.client.handle_get_state_metadata(collection, key, self.channel_id, self.tx_id)
+        return metadata.get(self.validationParameterMetakey, b'')
+
+    async def get_private_data_by_range(self, collection: str, start_key: str, end_key: str):
+        """Get an async iterator over the KV pairs of the private data `collection` in the range [start_key, end_key)
+
+        Pages are streamed like get_state_by_range(); the peer does not paginate private data queries.
+        """
+        LOGGER.debug('get_private_data_by_range called with collection:%s, startKey:%s and endKey:%s',
+                     collection, start_key, end_key)
+        self._check_collection(collection)
+        validate_simple_keys((start_key, end_key))
+        iterator, _ = await self._get_state_by_range(collection, start_key or EMPTY_KEY_SUBSTITUTE, end_key)
+        return iterator
+
+    async def get_private_data_by_partial_composite_key(self, collection: str, object_type, attributes):
+        """Get an async iterator over the KV pairs of the private data `collection` whose composite key starts with
+        objectType and `attributes`"""
+        LOGGER.debug('get_private_data_by_partial_composite_key called with collection:%s and objectType:%s',
+                     collection, object_type)
+        self._check_collection(collection)
+        start_key = self.create_composite_key(object_type, attributes)
+        iterator, _ = await self._get_state_by_range(collection, start_key, start_key + MAX_UNICODE_RUNE_VALUE)
+        return iterator
+
+    async def get_private_data_query_result(self, collection: str, query: str, decode=None):
+        """Get an async iterator over the results of a rich query on the private data `collection` (CouchDB only)
+
+        See get_query_result() for `decode`.
+        """
+        LOGGER.debug('get_private_data_query_result called with collection:%s and query:%s', collection, query)
+        self._check_collection(collection)
+        iterator, _ = await self._get_query_result(collection, query, decode)
+        return iterator
+
+    async def invoke_chaincode(self, chaincode_name: str, args, channel: str = '', timeout: float = None,
+                               cache: bool = False):
+        """Invoke another chaincode in the context of this transaction and return its Response
+
+        The callee reads and writes through the same transaction simulation. `channel` defaults to the channel of
+        this transaction. `timeout` bounds this call (the handler's request timeout by default); a call past it fails
+        the transaction, since the callee may still be running.
+
+        Every call reaches the callee, which may write. For a read-only callee, cache=True makes identical calls
+        (same chaincode, channel and args) within the transaction once and reuses their Response.
+        """
+        if channel:
+            chaincode_name = '%s/%s' % (chaincode_name, channel)
+        args = [arg.encode() if isinstance(arg, str) else bytes(arg) for arg in args]
+        LOGGER.debug('invoke_chaincode called with chaincode:%s', chaincode_name)
+        if not cache:
+            return await self._invoke_chaincode(chaincode_name, args, timeout)
+        return await self.invoke_cache.get_or_load(
+            (chaincode_name, tuple(args)), lambda: self._invoke_chaincode(chaincode_name, args, timeout))
+
+    async def invoke_chaincodes(self, calls, timeout: float = None, cache: bool = False):
+        """Make several chaincode to chaincode calls one after the other, returns their Responses in order
+
+        `calls` are (chaincode_name, args) or (chaincode_name, args, channel) tuples, `timeout` and `cache` apply to
+        each call as in invoke_chaincode(). The first call that raises stops the sequence.
+
+        The peer takes one request per transaction at a time (see MsgQueueHandler), so the calls cannot overlap: this
+        is the same as awaiting invoke_chaincode() for each in turn.
+        """
+        return [await self.invoke_chaincode(*call, timeout=timeout, cache=cache) for call in calls]
+
+    async def _invoke_chaincode(self, chaincode_name, args, timeout):
+        started = time.perf_counter() if METRICS.enabled else None
+        try:
+            response = await self.client.handle_invoke_chaincode(chaincode_name, args, self.channel_id, self.tx_id,
+                                                                 timeout)
+        except Exception:
+            if started is not None:
+                METRICS.callee_errors.inc(chaincode_name)
+            raise
+        if started is not None:
+            METRICS.callee_latency.observe(time.perf_counter() - started, chaincode_name)
+            if response.status >= ResponseCode.ERRORTHRESHOLD:
+                METRICS.callee_errors.inc(chaincode_name)
+        return response
@@ -0,0 +1,109 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# gRPC transport settings of the peer stream: compression, message size limits, HTTP/2 keepalive and flow control
+#
+# A TransportConfig is turned into grpc.aio.server() options (chaincode as a server) or channel options (chaincode
+# as a client, see ChaincodeClient). Every field can be set from the environment with TransportConfig.from_env().
+
+import os
+
+import grpc
+
+from src.fabric_shim.utils import env_flag, env_int, env_float
+
+# The peer accepts chaincode messages of up to 100 MiB (the default message size limits of Fabric's comm package),
+# gRPC's own 4 MiB receive limit would reject large write sets and query pages well before that.
+DEFAULT_MAX_MESSAGE_SIZE = 100 * 1024 * 1024
+# Messages smaller than this are sent uncompressed even when compression is on: gzip headers and CPU time are not
+# worth it for the typical GET_STATE request
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+
+COMPRESSION = {
+    'none': grpc.Compression.NoCompression,
+    'gzip': grpc.Compression.Gzip,
+    'deflate': grpc.Compression.Deflate,
+}
+
+
+class TransportConfig:
+    """gRPC settings of the connection between the chaincode and the peer
+
+    compression   "none", "gzip" or "deflate". The chaincode compresses the messages it sends of at least
+            `compression_threshold` bytes (as a server; as a client every message of the stream is compressed, gRPC
+            has no per-message switch on the client side). Replies of the peer are decompressed whatever it uses.
+    max_message_size   Largest message sent or received, in bytes.
+    keepalive_time, keepalive_timeout   Seconds between HTTP/2 pings on an idle connection, and seconds to wait for
+            the ping ack before the connection is considered dead. None leaves gRPC's defaults.
+    min_ping_interval   Seconds between the pings the chaincode server accepts from the peer, more frequent pings
+            close the connection. Must not exceed the peer's keepalive interval (peer.keepalive.client.interval).
+    initial_window_size   Initial HTTP/2 flow control window (bytes, grpc.http2.lookahead_bytes). None leaves it to
+            gRPC, which grows it with BDP probing unless `bdp_probe` is False.
+    options   Extra (name, value) gRPC channel arguments, applied last.
+    """
+
+    def __init__(self, compression: str = 'none', compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+                 max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE, keepalive_time: float = 60.0,
+                 keepalive_timeout: float = 20.0, min_ping_interval: float = 10.0, initial_window_size: int = None,
+                 bdp_probe: bool = True, options=()) -> None:
+        if compression not in COMPRESSION:
+            raise ValueError('compression must be one of %s, got "%s"' % (', '.join(COMPRESSION), compression))
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.max_message_size = max_message_size
+        self.keepalive_time = keepalive_time
+        self.keepalive_timeout = keepalive_timeout
+        self.min_ping_interval = min_ping_interval
+        self.initial_window_size = initial_window_size
+        self.bdp_probe = bdp_probe
+        self.options = list(options)
+
+    @classmethod
+    def from_env(cls, config: 'TransportConfig' = None) -> 'TransportConfig':
+        """Override the fields of `config` (the defaults when None) with the CHAINCODE_GRPC_* environment variables"""
+        config = config or cls()
+        return cls(
+            compression=os.getenv('CHAINCODE_GRPC_COMPRESSION') or config.compression,
+            compression_threshold=env_int('CHAINCODE_GRPC_COMPRESSION_THRESHOLD', config.compression_threshold),
+            max_message_size=env_int('CHAINCODE_GRPC_MAX_MESSAGE_SIZE', config.max_message_size),
+            keepalive_time=env_float('CHAINCODE_GRPC_KEEPALIVE_TIME', config.keepalive_time),
+            keepalive_timeout=env_float('CHAINCODE_GRPC_KEEPALIVE_TIMEOUT', config.keepalive_timeout),
+            min_ping_interval=env_float('CHAINCODE_GRPC_MIN_PING_INTERVAL', config.min_ping_interval),
+            initial_window_size=env_int('CHAINCODE_GRPC_INITIAL_WINDOW_SIZE', config.initial_window_size),
+            bdp_probe=env_flag('CHAINCODE_GRPC_BDP_PROBE', config.bdp_probe),
+            options=config.options,
+        )
+
+    def grpc_compression(self) -> grpc.Compression:
+        return COMPRESSION[self.compression]
+
+    def compresses(self) -> bool:
+        return self.compression != 'none'
+
+    def _common_options(self):
+        options = [
+            ('grpc.max_send_message_length', self.max_message_size),
+            ('grpc.max_receive_message_length', self.max_message_size),
+            ('grpc.http2.bdp_probe', int(self.bdp_probe)),
+        ]
+        if self.keepalive_time:
+            options += [('grpc.keepalive_time_ms', int(self.keepalive_time * 1000)),
+                        ('grpc.keepalive_permit_without_calls', 1),
+                        ('grpc.http2.max_pings_without_data', 0)]
+        if self.keepalive_timeout:
+            options.append(('grpc.keepalive_timeout_ms', int(self.keepalive_timeout * 1000)))
+        if self.initial_window_size:
+            options.append(('grpc.http2.lookahead_bytes', self.initial_window_size))
+        return options
+
+    def server_options(self):
+        """Options of the chaincode server (grpc.aio.server)"""
+        options = self._common_options()
+        if self.min_ping_interval:
+            options.append(('grpc.http2.min_recv_ping_interval_without_data_ms', int(self.min_ping_interval * 1000)))
+        return options + self.options
+
+    def channel_options(self):
+        """Options of the channel to the peer (chaincode as a client)"""
+        return self._common_options() + self.options
@@ -1,4 +1,6 @@
 # Auxiliary tools
+import os
+
 from fabric_protos_python.peer import chaincode_shim_pb2 as ccshim_pb2
 
 
@@ -24,7 +26,9 @@ def enum_type(*sequential, **named) -> type:
 
 
 MIN_UNICODE_RUNE_VALUE = '\u0000'
+MAX_UNICODE_RUNE_VALUE = '\U0010FFFF'  # U+10FFFF - maximum (and unallocated) code point
 COMPOSITEKEY_NS = '\x00'
+EMPTY_KEY_SUBSTITUTE = '\x01'
 
 
 def validate_composite_key_attribute(attr):
@@ -32,6 +36,54 @@ def validate_composite_key_attribute(attr):
         raise Exception('object type or attribute not a non-zero length string')
 
 
+def encode_composite_key(object_type, attributes):
+    """Build the composite key ``\\x00objectType\\x00attr1\\x00...attrN\\x00``"""
+    validate_composite_key_attribute(object_type)
+    for attribute in attributes:
+        validate_composite_key_attribute(attribute)
+    if not attributes:
+        return COMPOSITEKEY_NS + object_type + MIN_UNICODE_RUNE_VALUE
+    sep = MIN_UNICODE_RUNE_VALUE
+    return COMPOSITEKEY_NS + object_type + sep + sep.join(attributes) + sep
+
+
+def encode_composite_keys(object_type, attributes_list):
+    """Build the composite keys of many attribute lists sharing the same object type"""
+    validate_composite_key_attribute(object_type)
+    prefix = COMPOSITEKEY_NS + object_type + MIN_UNICODE_RUNE_VALUE
+    sep = MIN_UNICODE_RUNE_VALUE
+    keys = []
+    for attributes in attributes_list:
+        for attribute in attributes:
+            if not attribute or not isinstance(attribute, str):
+                validate_composite_key_attribute(attribute)
+        keys.append(prefix + sep.join(attributes) + sep if attributes else prefix)
+    return keys
+
+
+def decode_composite_key(composite_key):
+    """Split a composite key into (object_type, attributes), (None, []) if it is not a composite key"""
+    if not composite_key or len(composite_key) < 2 or composite_key[0] != COMPOSITEKEY_NS:
+        return None, []
+    parts = composite_key[1:].split(MIN_UNICODE_RUNE_VALUE)
+    # the last part is whatever follows the final separator (empty for well formed keys)
+    return parts[0], parts[1:-1]
+
+
+def decode_composite_keys(composite_keys):
+    """Split many composite keys, see decode_composite_key"""
+    ns, sep = COMPOSITEKEY_NS, MIN_UNICODE_RUNE_VALUE
+    decoded = []
+    append = decoded.append
+    for key in composite_keys:
+        if key and len(key) > 1 and key[0] == ns:
+            parts = key[1:].split(sep)
+            append((parts[0], parts[1:-1]))
+        else:
+            append((None, []))
+    return decoded
+
+
 def validate_simple_keys(keys):
     for key in keys:
         if key and isinstance(key, str) and key[0] == COMPOSITEKEY_NS:
@@ -40,3 +92,41 @@ def validate_simple_keys(keys):
 
 def generate_logging_prefix(channel_id, tx_id):
     return '[%s-%s]' % (channel_id, tx_id)
+
+
+def env_flag(name, default=False):
+    """Read a boolean setting from the environment ("1", "true", "yes" and "on" are true)"""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(name, default=None):
+    """Read an integer setting from the environment"""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+
+def env_float(name, default=None):
+    """Read a float setting from the environment"""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return float(value)
+
+
+def pagination_metadata(page_size, bookmark=''):
+    """Serialize the QueryMetadata of a paginated query"""
+    if page_size is None or page_size <= 0:
+        raise Exception('page_size must be a positive integer')
+    return ccshim_pb2.QueryMetadata(pageSize=page_size, bookmark=bookmark or '').SerializeToString()
+
+
+def decode_query_response_metadata(response):
+    """Decode the QueryResponseMetadata of a paginated query response, None for unpaginated ones"""
+    if not response.metadata:
+        return None
+    return ccshim_pb2.QueryResponseMetadata.FromString(response.metadata)
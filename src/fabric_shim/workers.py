@@ -0,0 +1,117 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Supervisor of the chaincode server worker processes
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import time
+
+from src.fabric_shim.logging import LOGGER
+
+# a worker living less than this many seconds counts as a crash loop and is restarted with a growing delay
+MIN_WORKER_UPTIME = 10.0
+MAX_RESTART_DELAY = 30.0
+# default seconds the workers get to drain after SIGTERM before they are killed
+WORKER_STOP_TIMEOUT = 10.0
+
+
+def _worker_main(index, target, args):
+    # the fork copied the supervisor's SIGTERM handler, which would only set the stop flag of the supervisor's copy
+    # here: restore the default (the server installs its own), then let in a SIGTERM held back by _spawn
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+    # Ctrl-C reaches the whole process group, the supervisor decides when the workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # lets per worker resources (e.g. the metrics port) tell the workers apart
+    os.environ['CHAINCODE_WORKER_INDEX'] = str(index)
+    LOGGER.info('Chaincode worker %d started' % index)
+    target(*args)
+
+
+class WorkerSupervisor:
+    """Runs `target(*args)` in `workers` forked processes and keeps them running.
+
+    Crashed workers are restarted, with an exponential delay when they keep crashing right after starting. SIGTERM
+    and SIGINT stop the supervisor: the workers get SIGTERM (graceful server stop) and are killed if they are still
+    alive after `stop_timeout` seconds.
+
+    The workers are forked before any gRPC object exists in the supervisor, each one creates its own server and event
+    loop. They share the listen address through SO_REUSEPORT, the kernel spreads the peer connections across them.
+    """
+
+    def __init__(self, workers: int, target, args=(), stop_timeout: float = WORKER_STOP_TIMEOUT) -> None:
+        self.workers = workers
+        self.stop_timeout = stop_timeout
+        self.target = target
+        self.args = args
+        self._mp = multiprocessing.get_context('fork')
+        self._procs = {}
+        self._started = {}
+        self._restart_delay = {}
+        self._stopping = False
+        self.restarts = 0
+
+    def _spawn(self, index):
+        proc = self._mp.Process(target=_worker_main, args=(index, self.target, self.args),
+                                name='chaincode-worker-%d' % index)
+        # SIGTERM stays blocked in the child until _worker_main has reset its handler
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+        try:
+            proc.start()
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+        self._procs[index] = proc
+        self._started[index] = time.monotonic()
+
+    def _request_stop(self, signum, frame):
+        LOGGER.info('Supervisor received signal %d, stopping the workers' % signum)
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        for index in range(self.workers):
+            self._spawn(index)
+        LOGGER.info('Started %d chaincode workers' % self.workers)
+
+        restart_at = {}
+        try:
+            while not self._stopping:
+                multiprocessing.connection.wait([proc.sentinel for proc in self._procs.values()], timeout=1.0)
+                now = time.monotonic()
+                for index, proc in list(self._procs.items()):
+                    if proc.is_alive() or index in restart_at or self._stopping:
+                        continue
+                    uptime = now - self._started[index]
+                    if uptime < MIN_WORKER_UPTIME:
+                        delay = min(self._restart_delay.get(index, 0.5) * 2, MAX_RESTART_DELAY)
+                    else:
+                        delay = 0.0
+                    self._restart_delay[index] = delay or 0.5
+                    LOGGER.warning('Chaincode worker %d (pid %s) exited with code %s after %.1fs, restarting in %.1fs'
+                                   % (index, proc.pid, proc.exitcode, uptime, delay))
+                    restart_at[index] = now + delay
+                for index, when in list(restart_at.items()):
+                    if when <= now and not self._stopping:
+                        del restart_at[index]
+                        self.restarts += 1
+                        self._spawn(index)
+        finally:
+            self.stop()
+
+    def stop(self):
+        """SIGTERM every worker and wait for them, killing the ones that do not exit in time"""
+        for proc in self._procs.values():
+            if proc.is_alive():
+                proc.terminate()
+        deadline = time.monotonic() + self.stop_timeout
+        for index, proc in self._procs.items():
+            proc.join(max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                LOGGER.warning('Chaincode worker %d did not stop in time, killing it' % index)
+                proc.kill()
+                proc.join()
+        LOGGER.info('All chaincode workers stopped, %d restarts' % self.restarts)
@@ -0,0 +1,37 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Transaction write set buffer
+
+
+class WriteOp:
+    PUT, DELETE = 'put', 'delete'
+
+
+class WriteBatch:
+    """Collects the write set of one transaction so it can be sent to the peer in a single flush.
+
+    Writes are keyed by ``(collection, key)``: a later put_state/delete_state of the same key replaces the earlier
+    one, only the last write reaches the peer. Records keep the order in which each key was first written.
+    """
+
+    def __init__(self) -> None:
+        self._records = {}
+
+    def __len__(self):
+        return len(self._records)
+
+    def put(self, collection: str, key: str, value: bytes):
+        self._records[(collection, key)] = (WriteOp.PUT, value)
+
+    def delete(self, collection: str, key: str):
+        self._records[(collection, key)] = (WriteOp.DELETE, None)
+
+    def records(self):
+        """Yield the buffered writes as (op, collection, key, value) tuples"""
+        for (collection, key), (op, value) in self._records.items():
+            yield op, collection, key, value
+
+    def clear(self):
+        self._records.clear()
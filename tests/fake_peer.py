@@ -0,0 +1,374 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# In-process stand-in for a Fabric peer, shared by the tests and the benchmarks
+#
+# FakePeerConnection dials a chaincode server (ChaincodeService.Connect); FakePeer listens for chaincodes that dial
+# the peer (ChaincodeSupport.Register, see ChaincodeClient). Either way the fake peer answers the REGISTER message
+# with REGISTERED/READY, sends TRANSACTION messages and answers the chaincode state requests
+# (GET_STATE/PUT_STATE/DEL_STATE, and GET_STATE_MULTIPLE/WRITE_BATCH_STATE once advertised) from an in-memory dict,
+# along with range and rich queries (paginated or not), private data hashes and purges, and key metadata.
+# INVOKE_CHAINCODE is answered for a callee that returns its first arg.
+
+import asyncio
+import collections
+import datetime
+import hashlib
+import json
+import uuid
+
+import grpc
+
+from fabric_protos_python.common import common_pb2 as cm_pb
+from fabric_protos_python.ledger.queryresult import kv_query_result_pb2 as kv_pb
+from fabric_protos_python.msp import identities_pb2 as id_pb
+from fabric_protos_python.peer import chaincode_pb2 as cc_pb2
+from fabric_protos_python.peer import chaincode_shim_pb2 as ccshim_pb2
+from fabric_protos_python.peer import chaincode_shim_pb2_grpc as ccshim_grpc_pb2
+from fabric_protos_python.peer import proposal_pb2 as pr_pb
+from fabric_protos_python.peer import proposal_response_pb2 as resp_pb
+from src.fabric_shim.transport import DEFAULT_MAX_MESSAGE_SIZE
+
+ChaincodeMessage = ccshim_pb2.ChaincodeMessage
+
+
+def make_signed_proposal(channel_id: str, tx_id: str, args, mspid: str = 'Org1MSP') -> pr_pb.SignedProposal:
+    """Build the minimal SignedProposal a peer attaches to INIT/TRANSACTION messages (not actually signed)"""
+    channel_header = cm_pb.ChannelHeader(type=cm_pb.ENDORSER_TRANSACTION, channel_id=channel_id, tx_id=tx_id)
+    channel_header.timestamp.FromDatetime(datetime.datetime.utcnow())
+    creator = id_pb.SerializedIdentity(mspid=mspid, id_bytes=b'-----BEGIN CERTIFICATE-----fake')
+    signature_header = cm_pb.SignatureHeader(creator=creator.SerializeToString(), nonce=uuid.uuid4().bytes)
+    header = cm_pb.Header(channel_header=channel_header.SerializeToString(),
+                          signature_header=signature_header.SerializeToString())
+    spec = cc_pb2.ChaincodeInvocationSpec(chaincode_spec=cc_pb2.ChaincodeSpec(input=cc_pb2.ChaincodeInput(args=args)))
+    payload = pr_pb.ChaincodeProposalPayload(input=spec.SerializeToString())
+    proposal = pr_pb.Proposal(header=header.SerializeToString(), payload=payload.SerializeToString())
+    return pr_pb.SignedProposal(proposal_bytes=proposal.SerializeToString(), signature=b'fake')
+
+
+class FakePeerStream:
+    """Peer side of one chaincode stream.
+
+    `store` maps (collection, key) to the committed value, it can be shared by several streams. Writes are applied
+    as soon as the chaincode sends them (there is no endorsement/commit split). `delay` (seconds) holds back every
+    answer to a state request, to model the round trip to a real peer. Queries are answered `page_size` results at
+    a time, unless they are paginated. Rich queries take a selector of fields that must be equal.
+
+    `peer_params` (a ChaincodeAdditionalParams), when set before the handshake, is sent in the REGISTERED message
+    to advertise the batched state messages. `received` counts the messages of the chaincode by type name, and
+    `recorded`, when set to a list, gets every one of them.
+    """
+
+    def __init__(self, store: dict = None, channel_id: str = 'mychannel', delay: float = 0.0) -> None:
+        self.store = {} if store is None else store
+        self.channel_id = channel_id
+        self.delay = delay
+        self._outbox = asyncio.Queue()
+        self._completions = {}
+        self._ready = asyncio.get_running_loop().create_future()
+        self._reader = None
+        # the messages received from the chaincode
+        self._call = None
+        # why the stream ended, transactions can no longer be sent on it
+        self.error = None
+        # txids of the COMPLETED messages received for transactions not sent on this stream, a real peer ignores them
+        self.stray_completions = []
+        self.peer_params = None
+        self.received = collections.Counter()
+        self.recorded = None
+        self.page_size = 2
+        # (collection, key) -> {metakey: value}
+        self.metadata = {}
+        # results not sent yet of the open range queries, by query id
+        self._queries = {}
+
+    async def _requests(self):
+        while True:
+            msg = await self._outbox.get()
+            if msg is None:
+                return
+            yield msg
+
+    def send(self, msg: ChaincodeMessage):
+        self._outbox.put_nowait(msg)
+
+    async def wait_ready(self):
+        """Wait for the REGISTER/REGISTERED/READY handshake"""
+        await self._ready
+
+    async def invoke(self, args, msg_type=ChaincodeMessage.TRANSACTION) -> resp_pb.Response:
+        """Run one transaction with the given args (list of bytes) and return the chaincode Response"""
+        if self.error is not None:
+            raise self.error
+        tx_id = uuid.uuid4().hex
+        fut = asyncio.get_running_loop().create_future()
+        self._completions[tx_id] = fut
+        self.send(ChaincodeMessage(
+            type=msg_type,
+            payload=cc_pb2.ChaincodeInput(args=args).SerializeToString(),
+            txid=tx_id,
+            channel_id=self.channel_id,
+            proposal=make_signed_proposal(self.channel_id, tx_id, args)
+        ))
+        try:
+            return await fut
+        finally:
+            self._completions.pop(tx_id, None)
+
+    def _reply(self, msg, payload=b'', msg_type=ChaincodeMessage.RESPONSE):
+        reply = ChaincodeMessage(type=msg_type, payload=payload, txid=msg.txid, channel_id=msg.channel_id)
+        if self.delay and msg_type in (ChaincodeMessage.RESPONSE, ChaincodeMessage.ERROR):
+            asyncio.get_running_loop().call_later(self.delay, self.send, reply)
+        else:
+            self.send(reply)
+
+    def handle_request(self, msg: ChaincodeMessage) -> bool:
+        """Answer a chaincode state request, returns False for the message types the fake peer does not serve"""
+        if msg.type == ChaincodeMessage.GET_STATE:
+            request = ccshim_pb2.GetState.FromString(msg.payload)
+            self._reply(msg, self.store.get((request.collection, request.key), b''))
+        elif msg.type == ChaincodeMessage.PUT_STATE:
+            request = ccshim_pb2.PutState.FromString(msg.payload)
+            self.store[(request.collection, request.key)] = request.value
+            self._reply(msg)
+        elif msg.type == ChaincodeMessage.DEL_STATE:
+            request = ccshim_pb2.DelState.FromString(msg.payload)
+            self.store.pop((request.collection, request.key), None)
+            self._reply(msg)
+        elif msg.type == ChaincodeMessage.INVOKE_CHAINCODE:
+            # the callee answers with its first arg as payload
+            spec = cc_pb2.ChaincodeSpec.FromString(msg.payload)
+            response = resp_pb.Response(status=200, payload=spec.input.args[0] if spec.input.args else b'')
+            completed = ChaincodeMessage(type=ChaincodeMessage.COMPLETED, payload=response.SerializeToString(),
+                                         txid=msg.txid, channel_id=msg.channel_id)
+            self._reply(msg, completed.SerializeToString())
+        elif msg.type == ChaincodeMessage.GET_STATE_MULTIPLE:
+            request = ccshim_pb2.GetStateMultiple.FromString(msg.payload)
+            result = ccshim_pb2.GetStateMultipleResult(
+                values=[self.store.get((request.collection, key), b'') for key in request.keys])
+            self._reply(msg, result.SerializeToString())
+        elif msg.type == ChaincodeMessage.WRITE_BATCH_STATE:
+            for record in ccshim_pb2.WriteBatchState.FromString(msg.payload).rec:
+                if record.type == ccshim_pb2.WriteRecord.PUT_STATE:
+                    self.store[(record.collection, record.key)] = record.value
+                elif record.type == ccshim_pb2.WriteRecord.DEL_STATE:
+                    self.store.pop((record.collection, record.key), None)
+            self._reply(msg)
+        elif msg.type == ChaincodeMessage.GET_PRIVATE_DATA_HASH:
+            request = ccshim_pb2.GetState.FromString(msg.payload)
+            value = self.store.get((request.collection, request.key))
+            self._reply(msg, hashlib.sha256(value).digest() if value else b'')
+        elif msg.type == ChaincodeMessage.PURGE_PRIVATE_DATA:
+            request = ccshim_pb2.DelState.FromString(msg.payload)
+            self.store.pop((request.collection, request.key), None)
+            self.metadata.pop((request.collection, request.key), None)
+            self._reply(msg)
+        elif msg.type == ChaincodeMessage.PUT_STATE_METADATA:
+            request = ccshim_pb2.PutStateMetadata.FromString(msg.payload)
+            entries = self.metadata.setdefault((request.collection, request.key), {})
+            entries[request.metadata.metakey] = request.metadata.value
+            self._reply(msg)
+        elif msg.type == ChaincodeMessage.GET_STATE_METADATA:
+            request = ccshim_pb2.GetStateMetadata.FromString(msg.payload)
+            entries = self.metadata.get((request.collection, request.key), {})
+            result = ccshim_pb2.StateMetadataResult(
+                entries=[ccshim_pb2.StateMetadata(metakey=metakey, value=value) for metakey, value in entries.items()])
+            self._reply(msg, result.SerializeToString())
+        elif msg.type == ChaincodeMessage.GET_STATE_BY_RANGE:
+            request = ccshim_pb2.GetStateByRange.FromString(msg.payload)
+            results = [kv_pb.KV(key=key, value=value) for (collection, key), value in sorted(self.store.items())
+                       if collection == request.collection and request.startKey <= key
+                       and (not request.endKey or key < request.endKey)]
+            self._reply(msg, self._start_query(results, request.metadata).SerializeToString())
+        elif msg.type == ChaincodeMessage.GET_QUERY_RESULT:
+            # the query is a CouchDB selector of fields that must be equal
+            request = ccshim_pb2.GetQueryResult.FromString(msg.payload)
+            selector = json.loads(request.query)['selector']
+            results = [kv_pb.KV(key=key, value=value) for (collection, key), value in sorted(self.store.items())
+                       if collection == request.collection
+                       and all(json.loads(value).get(field) == expected for field, expected in selector.items())]
+            self._reply(msg, self._start_query(results, request.metadata).SerializeToString())
+        elif msg.type == ChaincodeMessage.QUERY_STATE_NEXT:
+            request = ccshim_pb2.QueryStateNext.FromString(msg.payload)
+            self._reply(msg, self._query_page(request.id).SerializeToString())
+        elif msg.type == ChaincodeMessage.QUERY_STATE_CLOSE:
+            request = ccshim_pb2.QueryStateClose.FromString(msg.payload)
+            self._queries.pop(request.id, None)
+            self._reply(msg, ccshim_pb2.QueryResponse(id=request.id).SerializeToString())
+        else:
+            return False
+        return True
+
+    def _start_query(self, results, metadata: bytes) -> ccshim_pb2.QueryResponse:
+        """The first page of a query. A paginated query (QueryMetadata) gets its page of results at once, with the
+        key of the next result as bookmark"""
+        if not metadata:
+            query_id = uuid.uuid4().hex
+            self._queries[query_id] = results
+            return self._query_page(query_id)
+        metadata = ccshim_pb2.QueryMetadata.FromString(metadata)
+        if metadata.bookmark:
+            results = [kv for kv in results if kv.key >= metadata.bookmark]
+        page, rest = results[:metadata.pageSize], results[metadata.pageSize:]
+        response_metadata = ccshim_pb2.QueryResponseMetadata(fetched_records_count=len(page),
+                                                             bookmark=rest[0].key if rest else '')
+        return ccshim_pb2.QueryResponse(
+            results=[ccshim_pb2.QueryResultBytes(resultBytes=kv.SerializeToString()) for kv in page],
+            has_more=False, metadata=response_metadata.SerializeToString())
+
+    def _query_page(self, query_id) -> ccshim_pb2.QueryResponse:
+        results = self._queries.get(query_id, [])
+        page, results[:] = results[:self.page_size], results[self.page_size:]
+        if not results:
+            self._queries.pop(query_id, None)
+        return ccshim_pb2.QueryResponse(
+            results=[ccshim_pb2.QueryResultBytes(resultBytes=kv.SerializeToString()) for kv in page],
+            has_more=bool(results), id=query_id)
+
+    async def _read_loop(self):
+        try:
+            async for msg in self._call:
+                self.received[ChaincodeMessage.Type.Name(msg.type)] += 1
+                if self.recorded is not None:
+                    self.recorded.append(msg)
+                if msg.type == ChaincodeMessage.REGISTER:
+                    params = self.peer_params.SerializeToString() if self.peer_params is not None else b''
+                    self._reply(msg, params, msg_type=ChaincodeMessage.REGISTERED)
+                    self._reply(msg, msg_type=ChaincodeMessage.READY)
+                    self._ready.set_result(None)
+                elif msg.type == ChaincodeMessage.COMPLETED:
+                    fut = self._completions.get(msg.txid)
+                    if fut is None:
+                        self.stray_completions.append(msg.txid)
+                    elif not fut.done():
+                        fut.set_result(resp_pb.Response.FromString(msg.payload))
+                elif msg.type == ChaincodeMessage.KEEPALIVE:
+                    pass
+                elif not self.handle_request(msg):
+                    self._reply(msg, ('fake peer does not serve message type %d' % msg.type).encode(),
+                                ChaincodeMessage.ERROR)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail(e)
+        else:
+            self._fail(Exception('the chaincode closed the stream'))
+
+    def _fail(self, err):
+        self.error = self.error or err
+        if not self._ready.done():
+            self._ready.set_exception(err)
+            # nobody may be waiting for the handshake
+            self._ready.exception()
+        for fut in self._completions.values():
+            if not fut.done():
+                fut.set_exception(err)
+
+
+class FakePeerConnection(FakePeerStream):
+    """One Connect stream to a chaincode server, with its own HTTP/2 connection
+
+    `compression` (a grpc.Compression) compresses the messages the fake peer sends.
+    """
+
+    def __init__(self, address: str, store: dict = None, channel_id: str = 'mychannel', delay: float = 0.0,
+                 compression: grpc.Compression = None) -> None:
+        super().__init__(store, channel_id, delay)
+        self.address = address
+        # a local subchannel pool keeps every connection on its own socket, so SO_REUSEPORT can spread them
+        self._channel = grpc.aio.insecure_channel(address, options=[
+            ('grpc.use_local_subchannel_pool', 1),
+            ('grpc.max_send_message_length', DEFAULT_MAX_MESSAGE_SIZE),
+            ('grpc.max_receive_message_length', DEFAULT_MAX_MESSAGE_SIZE),
+        ], compression=compression)
+
+    async def connect(self):
+        """Open the stream and run the REGISTER/REGISTERED/READY handshake, replacing the previous stream if any"""
+        if self._call is not None:
+            self._reader.cancel()
+            self._call.cancel()
+        self._outbox = asyncio.Queue()
+        self._ready = asyncio.get_running_loop().create_future()
+        self.error = None
+        # wait_for_ready: a chaincode server that is still starting is waited for instead of failing the call
+        self._call = ccshim_grpc_pb2.ChaincodeStub(self._channel).Connect(self._requests(), wait_for_ready=True)
+        self._reader = asyncio.ensure_future(self._read_loop())
+        await self.wait_ready()
+
+    async def close(self):
+        self._outbox.put_nowait(None)
+        if self._reader:
+            self._reader.cancel()
+        await self._channel.close()
+
+
+class FakePeer(ccshim_grpc_pb2.ChaincodeSupportServicer):
+    """A peer listening for chaincodes that connect as clients (ChaincodeSupport.Register)
+
+    Each Register call gets a FakePeerStream sharing `store`; the latest one is `stream`. drop() ends the current
+    stream from the peer side, to exercise the chaincode's reconnection.
+
+    Typical usage example:
+        peer = FakePeer('127.0.0.1:7052')
+        await peer.start()
+        client = ChaincodeClient('127.0.0.1:7052', 'basic_1.0:fake', MyChaincode)
+        asyncio.ensure_future(client.run())
+        response = await (await peer.wait_registered()).invoke([b'ReadAsset', b'asset1'])
+    """
+
+    def __init__(self, address: str, store: dict = None, channel_id: str = 'mychannel', delay: float = 0.0) -> None:
+        self.address = address
+        self.store = {} if store is None else store
+        self.channel_id = channel_id
+        self.delay = delay
+        self.stream = None
+        # Register calls received
+        self.registrations = 0
+        self._registered = asyncio.Event()
+        self._server = None
+
+    async def start(self):
+        self._server = grpc.aio.server(options=[('grpc.max_send_message_length', DEFAULT_MAX_MESSAGE_SIZE),
+                                                ('grpc.max_receive_message_length', DEFAULT_MAX_MESSAGE_SIZE)])
+        ccshim_grpc_pb2.add_ChaincodeSupportServicer_to_server(self, self._server)
+        self._server.add_insecure_port(self.address)
+        await self._server.start()
+
+    async def stop(self):
+        if self.stream is not None:
+            self.stream.send(None)
+        await self._server.stop(0)
+
+    async def Register(self, request_iterator, context):
+        stream = FakePeerStream(self.store, self.channel_id, self.delay)
+        stream._call = request_iterator
+        stream._reader = asyncio.ensure_future(stream._read_loop())
+        self.stream = stream
+        self.registrations += 1
+        asyncio.ensure_future(self._signal_ready(stream))
+        try:
+            async for msg in stream._requests():
+                yield msg
+        finally:
+            stream._reader.cancel()
+            stream._fail(Exception('the peer closed the stream'))
+
+    async def _signal_ready(self, stream):
+        try:
+            await stream.wait_ready()
+        except Exception:
+            return
+        if stream is self.stream:
+            self._registered.set()
+
+    async def wait_registered(self) -> FakePeerStream:
+        """Wait until a chaincode stream is READY, returns it"""
+        await self._registered.wait()
+        return self.stream
+
+    def drop(self):
+        """End the current stream, the chaincode sees the peer close it"""
+        self._registered.clear()
+        if self.stream is not None:
+            self.stream.send(None)
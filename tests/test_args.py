@@ -0,0 +1,57 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Lazy access to the transaction args
+
+from fabric_protos_python.peer import chaincode_pb2 as cc_pb2
+from src.fabric_shim.args import ChaincodeArgs
+from src.fabric_shim.stub import ChaincodeStub
+
+from tests.fake_peer import make_signed_proposal
+
+
+class CountingArgs(list):
+    """Sequence of bytes counting the accesses to its elements"""
+
+    def __init__(self, values):
+        super().__init__(values)
+        self.reads = []
+
+    def __getitem__(self, index):
+        self.reads.append(index)
+        return super().__getitem__(index)
+
+
+def test_args_are_fetched_once_and_on_demand():
+    source = CountingArgs([b'Store', b'asset1', b'\xff\x00binary'])
+    args = ChaincodeArgs(source)
+
+    assert len(args) == 3 and source.reads == []
+    assert args.function == 'Store'
+    assert args[2] == b'\xff\x00binary' and args[2] is args[2]
+    assert bytes(args.view(2)[:2]) == b'\xff\x00'
+    # the binary arg is never decoded
+    assert args.string(1) == 'asset1' and args.string(1) is args.string(1)
+    assert source.reads == [0, 2, 1]
+
+
+def test_slices_and_strings():
+    args = ChaincodeArgs([b'Transfer', b'asset1', b'Tomoko'])
+
+    assert args[1:] == [b'asset1', b'Tomoko']
+    assert args[-1] == b'Tomoko'
+    assert args.strings() == ['Transfer', 'asset1', 'Tomoko']
+    assert args.strings(1) == ['asset1', 'Tomoko']
+    assert list(args) == [b'Transfer', b'asset1', b'Tomoko']
+    assert ChaincodeArgs([]).function == ''
+
+
+def test_stub_accessors_over_the_protobuf_args():
+    cc_input = cc_pb2.ChaincodeInput(args=[b'CreateAsset', b'asset1', b'5'])
+    stub = ChaincodeStub(None, 'mychannel', 'tx1', cc_input, make_signed_proposal('mychannel', 'tx1', cc_input.args))
+
+    assert stub.get_function() == 'CreateAsset'
+    assert stub.get_args()[2] == b'5'
+    assert stub.get_string_args() == ['CreateAsset', 'asset1', '5']
+    assert stub.get_function_and_parameters() == ('CreateAsset', ['asset1', '5'])
@@ -0,0 +1,127 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Transaction read cache, alone and behind get_state against a fake peer
+
+import asyncio
+
+import pytest
+from fabric_protos_python.peer import proposal_response_pb2 as pb
+from src.fabric_shim.cache import TxCache
+from src.fabric_shim.interfaces import Chaincode, ChaincodeStubInterface
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.server import _internal_server
+
+from tests.fake_peer import FakePeerConnection
+
+
+class Loader:
+    """Counts its calls, answers `value:key` after a loop iteration"""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def of(self, key):
+        async def load():
+            self.calls.append(key)
+            await asyncio.sleep(0)
+            if self.fail:
+                raise ValueError('peer error')
+            return 'value:%s' % key
+        return load
+
+    async def many(self, keys):
+        self.calls.append(keys)
+        return ['value:%s' % key for key in keys]
+
+
+def test_concurrent_lookups_share_one_load():
+    async def scenario():
+        cache, loader = TxCache(), Loader()
+        values = await asyncio.gather(*(cache.get_or_load('k', loader.of('k')) for _ in range(3)))
+        values.append(await cache.get_or_load('k', loader.of('k')))
+        return values, loader.calls, cache.stats()
+
+    values, calls, stats = asyncio.run(scenario())
+    assert values == ['value:k'] * 4
+    assert calls == ['k']
+    assert stats == {'hits': 3, 'misses': 1, 'size': 1}
+
+
+def test_failed_loads_are_not_cached():
+    async def scenario():
+        cache, failing = TxCache(), Loader(fail=True)
+        with pytest.raises(ValueError):
+            await cache.get_or_load('k', failing.of('k'))
+        assert 'k' not in cache
+        return await cache.get_or_load('k', Loader().of('k'))
+
+    assert asyncio.run(scenario()) == 'value:k'
+
+
+def test_get_or_load_many_loads_the_misses_once():
+    async def scenario():
+        cache, loader = TxCache(), Loader()
+        await cache.get_or_load('a', loader.of('a'))
+        values = await cache.get_or_load_many(['a', 'b', 'c', 'b'], loader.many)
+        return values, loader.calls
+
+    values, calls = asyncio.run(scenario())
+    assert values == ['value:a', 'value:b', 'value:c', 'value:b']
+    # a was cached, b is asked for once
+    assert calls == ['a', ['b', 'c']]
+
+
+def test_invalidate_and_clear():
+    async def scenario():
+        cache, loader = TxCache(), Loader()
+        await cache.get_or_load_many(['a', 'b'], loader.many)
+        cache.invalidate('a')
+        await cache.get_or_load('a', loader.of('a'))
+        pending = asyncio.ensure_future(cache.get_or_load('c', loader.of('c')))
+        await asyncio.sleep(0)
+        cache.clear()
+        size = len(cache)
+        await pending
+        return loader.calls, size
+
+    calls, size = asyncio.run(scenario())
+    assert calls == [['a', 'b'], 'a', 'c']
+    assert size == 0
+
+
+class RereadChaincode(Chaincode):
+    """Reads its parameters one after the other, returns the values joined with commas"""
+
+    async def init(self, stub: ChaincodeStubInterface) -> pb.Response:
+        return pb.Response(status=ResponseCode.OK)
+
+    async def invoke(self, stub: ChaincodeStubInterface) -> pb.Response:
+        _, params = stub.get_function_and_parameters()
+        values = [await stub.get_state(key) for key in params]
+        stats = stub.get_read_cache_stats()
+        return pb.Response(status=ResponseCode.OK, message='%(hits)d/%(misses)d' % stats, payload=b','.join(values))
+
+
+def test_a_key_is_read_from_the_peer_once_per_transaction():
+    async def scenario():
+        address = '127.0.0.1:19131'
+        server = _internal_server(ccid='test_1.0:cache', cc=RereadChaincode, address=address, key=None, cert=None)
+        await server.start()
+        peer = FakePeerConnection(address, {('', 'a'): b'1', ('', 'b'): b'2'})
+        try:
+            await peer.connect()
+            first = await peer.invoke([b'Read', b'a', b'b', b'a', b'a'])
+            second = await peer.invoke([b'Read', b'a'])
+            return first, second, peer.received
+        finally:
+            await peer.close()
+            await server.stop(0)
+
+    first, second, received = asyncio.run(scenario())
+    assert first.payload == b'1,2,1,1' and first.message == '2/2'
+    # the cache does not outlive its transaction
+    assert second.payload == b'1' and second.message == '0/1'
+    assert received['GET_STATE'] == 3
@@ -0,0 +1,49 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Chaincode as a client (ChaincodeClient) against an in-process fake peer
+
+import asyncio
+
+from src.fabric_shim.client import Backoff, ChaincodeClient
+from src.fabric_shim.response import ResponseCode
+
+from tests.fake_peer import FakePeer
+from tests.test_server import CC_ID, StoreChaincode
+
+
+def test_transactions_of_a_dropped_stream_are_not_completed_on_the_next():
+    address = '127.0.0.1:19081'
+
+    async def scenario():
+        store = {}
+        peer = FakePeer(address, store)
+        await peer.start()
+        client = ChaincodeClient(address, CC_ID, StoreChaincode, backoff=Backoff(initial=0.05, maximum=0.1))
+        client_task = asyncio.ensure_future(client.run())
+        try:
+            first = await asyncio.wait_for(peer.wait_registered(), 10)
+            lost = asyncio.ensure_future(first.invoke([b'Set', b'lost', b'v', b'0.3']))
+            await asyncio.sleep(0.1)
+            peer.drop()
+            second = await asyncio.wait_for(peer.wait_registered(), 10)
+            assert second is not first
+            # outlive the transaction of the dropped stream
+            await asyncio.sleep(0.5)
+            response = await second.invoke([b'Set', b'after', b'v'])
+            await asyncio.sleep(0.1)
+            return lost, second, response, store, client.handler.scheduler.stats()
+        finally:
+            await client.stop()
+            await client_task
+            await peer.stop()
+
+    lost, second, response, store, stats = asyncio.run(scenario())
+
+    assert lost.exception() is not None
+    # the transaction was cancelled with its stream: no write, no COMPLETED on the new stream
+    assert second.stray_completions == []
+    assert ('', 'lost') not in store
+    assert response.status == ResponseCode.OK and response.payload == b'v'
+    assert stats['running'] == 0 and stats['pending'] == 0
@@ -0,0 +1,110 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Composite key encoding, and partial composite key queries on a MockStub and against a fake peer
+
+import asyncio
+
+import pytest
+from fabric_protos_python.peer import chaincode_shim_pb2 as ccshim_pb2
+from fabric_protos_python.peer import proposal_response_pb2 as pb
+from src.fabric_shim.interfaces import Chaincode, ChaincodeStubInterface
+from src.fabric_shim.mock_stub import MockStub
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.server import _internal_server
+from src.fabric_shim.utils import MAX_UNICODE_RUNE_VALUE, decode_composite_key, decode_composite_keys, \
+    encode_composite_key, encode_composite_keys, validate_simple_keys
+
+from tests.fake_peer import FakePeerConnection
+
+ChaincodeMessage = ccshim_pb2.ChaincodeMessage
+# attributes above U+FFFF and above the '\x10' the range end used to be cut at
+ATTRIBUTES = [['blue', 'asset1'], ['blue', 'asset2'], ['red', '\U0001F600'], ['\U0010FFFE']]
+
+
+def test_encode_and_decode():
+    key = encode_composite_key('color~name', ['blue', 'asset1'])
+    assert key == '\x00color~name\x00blue\x00asset1\x00'
+    assert decode_composite_key(key) == ('color~name', ['blue', 'asset1'])
+    assert encode_composite_key('color~name', []) == '\x00color~name\x00'
+    assert decode_composite_key('\x00color~name\x00') == ('color~name', [])
+    # a simple key is not a composite key
+    assert decode_composite_key('asset1') == (None, [])
+
+
+def test_batch_codec_matches_the_single_key_one():
+    keys = encode_composite_keys('color~name', ATTRIBUTES)
+    assert keys == [encode_composite_key('color~name', attributes) for attributes in ATTRIBUTES]
+    assert decode_composite_keys(keys + ['asset1']) == \
+        [decode_composite_key(key) for key in keys] + [(None, [])]
+
+
+def test_invalid_keys_are_refused():
+    with pytest.raises(Exception):
+        encode_composite_key('', ['blue'])
+    with pytest.raises(Exception):
+        encode_composite_keys('color~name', [['blue', '']])
+    with pytest.raises(Exception):
+        validate_simple_keys(['asset1', encode_composite_key('color~name', ['blue'])])
+
+
+def test_range_end_is_the_highest_code_point():
+    assert MAX_UNICODE_RUNE_VALUE == chr(0x10FFFF)
+
+
+def _seeded_stub():
+    stub = MockStub('composite')
+    stub.seed({key: b'v' for key in encode_composite_keys('color~name', ATTRIBUTES)})
+    stub.seed({encode_composite_key('color~size', ['blue', '5']): b'v', 'asset1': b'v'})
+    return stub
+
+
+def test_partial_composite_key_query_on_a_mock_stub():
+    async def scenario():
+        stub = _seeded_stub()
+        return [[stub.split_composite_key(kv.key)[1]
+                 async for kv in await stub.get_state_by_partial_composite_key('color~name', attributes)]
+                for attributes in ([], ['blue'], ['red'])]
+
+    every, blue, red = asyncio.run(scenario())
+    assert every == ATTRIBUTES
+    assert blue == ATTRIBUTES[:2]
+    assert red == [ATTRIBUTES[2]]
+
+
+class PartialKeyChaincode(Chaincode):
+    """Lists the keys of an object type, optionally restricted by the attributes given as parameters"""
+
+    async def init(self, stub: ChaincodeStubInterface) -> pb.Response:
+        return pb.Response(status=ResponseCode.OK)
+
+    async def invoke(self, stub: ChaincodeStubInterface) -> pb.Response:
+        _, params = stub.get_function_and_parameters()
+        keys = [kv.key async for kv in await stub.get_state_by_partial_composite_key(params[0], params[1:])]
+        return pb.Response(status=ResponseCode.OK, payload='|'.join(
+            '/'.join(attributes) for _, attributes in stub.split_composite_keys(keys)).encode())
+
+
+def test_partial_composite_key_query_against_a_peer():
+    async def scenario():
+        address = '127.0.0.1:19141'
+        server = _internal_server(ccid='test_1.0:composite', cc=PartialKeyChaincode, address=address, key=None,
+                                  cert=None)
+        await server.start()
+        store = {('', key): value for key, value in _seeded_stub().collections[''].range('', '')}
+        peer = FakePeerConnection(address, store)
+        peer.recorded = []
+        try:
+            await peer.connect()
+            return await peer.invoke([b'List', b'color~name']), peer.recorded
+        finally:
+            await peer.close()
+            await server.stop(0)
+
+    response, recorded = asyncio.run(scenario())
+    assert response.status == ResponseCode.OK, response.message
+    assert response.payload.decode() == '|'.join('/'.join(attributes) for attributes in ATTRIBUTES)
+    [query] = [ccshim_pb2.GetStateByRange.FromString(msg.payload) for msg in recorded
+               if msg.type == ChaincodeMessage.GET_STATE_BY_RANGE]
+    assert query.endKey == '\x00color~name\x00' + MAX_UNICODE_RUNE_VALUE
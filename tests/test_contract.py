@@ -0,0 +1,131 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Contract dispatch and the argument binding of TransactionSpec, on a MockStub
+
+import asyncio
+import json
+import typing
+
+import pytest
+from src.fabric_shim.contract import METADATA_FUNCTION, Contract, TransactionSpec, transaction
+from src.fabric_shim.mock_stub import MockStub
+from src.fabric_shim.models import Model
+from src.fabric_shim.response import ResponseCode
+
+
+class Asset(Model):
+    id: str = ''
+    size: int = 0
+
+
+class AssetContract(Contract):
+    def __init__(self):
+        self.calls = 0
+
+    @transaction
+    async def create_asset(self, stub, asset_id: str, size: int, public: bool = True):
+        self.calls += 1
+        await stub.put_state(asset_id, json.dumps({'size': size, 'public': public}))
+
+    @transaction(name='ReadAsset', read_only=True)
+    async def read_asset(self, stub, asset_id: str) -> bytes:
+        return await stub.get_state(asset_id)
+
+    @transaction(read_only=True)
+    async def write_in_query(self, stub, asset_id):
+        await stub.put_state(asset_id, b'x')
+
+    @transaction
+    async def tags(self, stub, tags: typing.List[str], extra: typing.Optional[int] = None):
+        return {'tags': tags, 'extra': extra}
+
+    @transaction
+    async def resize(self, stub, asset: Asset, size: int) -> Asset:
+        return Asset(asset.id, size)
+
+    @transaction
+    async def fail(self, stub):
+        raise Exception('not today')
+
+    async def helper(self, stub):
+        return b'not a transaction'
+
+
+class ExtendedContract(AssetContract):
+    @transaction
+    async def count(self, stub) -> int:
+        return self.calls
+
+
+def _invoke(contract, *calls, seed=None):
+    async def scenario():
+        stub = MockStub('assets', contract)
+        stub.seed(seed or {})
+        return [await stub.mock_invoke(list(args)) for args in calls], stub
+
+    return asyncio.run(scenario())
+
+
+def test_dispatch_binds_the_arguments_by_annotation():
+    [created, read], stub = _invoke(AssetContract, [b'create_asset', b'asset1', b'5', b'false'],
+                                    [b'ReadAsset', b'asset1'])
+    assert created.status == ResponseCode.OK, created.message
+    assert json.loads(read.payload) == {'size': 5, 'public': False}
+
+
+def test_return_values_become_the_payload():
+    [tags, resized], _ = _invoke(AssetContract, [b'tags', b'["a", "b"]', b'3'],
+                                 [b'resize', Asset('asset1', 5).to_bytes(), b'7'])
+    assert json.loads(tags.payload) == {'tags': ['a', 'b'], 'extra': 3}
+    assert Asset.from_bytes(resized.payload) == Asset('asset1', 7)
+
+
+def test_binding_errors_answer_with_an_error():
+    responses, _ = _invoke(AssetContract, [b'create_asset', b'asset1'], [b'create_asset', b'asset1', b'five'],
+                           [b'create_asset', b'asset1', b'5', b'maybe'])
+    assert [response.status for response in responses] == [ResponseCode.ERROR] * 3
+    assert responses[0].message == 'transaction create_asset expects 2 to 3 arguments, got 1'
+    assert responses[1].message.startswith('transaction create_asset: invalid arguments:')
+
+
+def test_unknown_functions_failures_and_read_only_transactions():
+    [unknown, helper, failed, query], stub = _invoke(AssetContract, [b'nope'], [b'helper'], [b'fail'],
+                                                     [b'write_in_query', b'asset1'])
+    assert unknown.status == ResponseCode.ERROR
+    assert unknown.message == 'function nope is not a transaction of AssetContract'
+    # only decorated methods are transactions
+    assert helper.status == ResponseCode.ERROR
+    assert failed.status == ResponseCode.ERROR and failed.message == 'not today'
+    assert query.status == ResponseCode.ERROR and 'read-only' in query.message
+    assert 'asset1' not in stub.collections['']
+
+
+def test_subclasses_inherit_the_transactions_and_share_one_instance():
+    [_, _, count], _ = _invoke(ExtendedContract, [b'create_asset', b'a', b'1'], [b'create_asset', b'b', b'2'],
+                               [b'count'])
+    assert count.payload == b'2'
+    assert set(ExtendedContract.get_transactions()) == set(AssetContract.get_transactions()) | {'count'}
+
+
+def test_metadata_lists_the_transactions():
+    [response], _ = _invoke(AssetContract, [METADATA_FUNCTION.encode()])
+    transactions = {tx['name']: tx for tx in json.loads(response.payload)['contracts']['AssetContract']['transactions']}
+    assert transactions['ReadAsset'] == {'name': 'ReadAsset', 'tags': ['EVALUATE'],
+                                         'parameters': [{'name': 'asset_id', 'schema': 'str'}]}
+    assert transactions['create_asset']['tags'] == ['SUBMIT']
+    assert [param['schema'] for param in transactions['create_asset']['parameters']] == ['str', 'int', 'bool']
+
+
+def test_transaction_spec_refuses_unsupported_signatures():
+    async def star_args(self, stub, *args):
+        pass
+
+    async def unknown_type(self, stub, value: complex):
+        pass
+
+    with pytest.raises(TypeError):
+        TransactionSpec(star_args, 'star_args', False, False).compile()
+    with pytest.raises(TypeError):
+        TransactionSpec(unknown_type, 'unknown_type', False, False).compile()
@@ -0,0 +1,76 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# get_states() bulk reads against a fake peer, with and without GET_STATE_MULTIPLE
+
+import asyncio
+
+from fabric_protos_python.peer import chaincode_pb2 as cc_pb2
+from fabric_protos_python.peer import proposal_response_pb2 as pb
+from src.fabric_shim.interfaces import Chaincode, ChaincodeStubInterface
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.server import _internal_server
+
+from tests.fake_peer import FakePeerConnection
+
+CC_ID = 'test_1.0:get_states'
+KEYS = ['k%d' % i for i in range(5)]
+
+
+class ReadManyChaincode(Chaincode):
+    """Reads k0 alone, then k0..k4 and k1 again with get_states, returns the values joined with commas"""
+
+    async def init(self, stub: ChaincodeStubInterface) -> pb.Response:
+        return pb.Response(status=ResponseCode.OK)
+
+    async def invoke(self, stub: ChaincodeStubInterface) -> pb.Response:
+        await stub.get_state('k0')
+        values = await stub.get_states(KEYS + ['k1'])
+        return pb.Response(status=ResponseCode.OK, payload=b','.join(values))
+
+
+def _run(address, peer_params=None):
+    async def scenario():
+        server = _internal_server(ccid=CC_ID, cc=ReadManyChaincode, address=address, key=None, cert=None)
+        await server.start()
+        peer = FakePeerConnection(address, {('', key): key.encode() for key in KEYS[:4]})
+        peer.peer_params = peer_params
+        try:
+            await peer.connect()
+            return await peer.invoke([b'Read']), peer.received
+        finally:
+            await peer.close()
+            await server.stop(0)
+
+    return asyncio.run(scenario())
+
+
+EXPECTED = b'k0,k1,k2,k3,,k1'
+
+
+def test_get_states_reads_the_missing_keys_in_one_request():
+    params = cc_pb2.ChaincodeAdditionalParams(use_get_multiple_keys=True, max_size_get_multiple_keys=100)
+    response, received = _run('127.0.0.1:19101', params)
+
+    assert response.status == ResponseCode.OK and response.payload == EXPECTED
+    # k0 was read before, k1 is asked for once
+    assert received['GET_STATE'] == 1
+    assert received['GET_STATE_MULTIPLE'] == 1
+
+
+def test_get_states_is_split_at_the_peer_limit():
+    params = cc_pb2.ChaincodeAdditionalParams(use_get_multiple_keys=True, max_size_get_multiple_keys=3)
+    response, received = _run('127.0.0.1:19102', params)
+
+    assert response.status == ResponseCode.OK and response.payload == EXPECTED
+    # 4 missing keys
+    assert received['GET_STATE_MULTIPLE'] == 2
+
+
+def test_get_states_falls_back_to_one_request_per_key():
+    response, received = _run('127.0.0.1:19103')
+
+    assert response.status == ResponseCode.OK and response.payload == EXPECTED
+    assert received['GET_STATE_MULTIPLE'] == 0
+    assert received['GET_STATE'] == len(KEYS)
@@ -0,0 +1,100 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# History helpers over a paged HistoryQueryIterator and over a MockStub
+
+import asyncio
+
+from fabric_protos_python.ledger.queryresult import kv_query_result_pb2 as kv_pb
+from fabric_protos_python.peer import chaincode_shim_pb2 as ccshim_pb2
+from google.protobuf.timestamp_pb2 import Timestamp
+from src.fabric_shim.history import Window, count_modifications, latest_modifications, modifications_since, \
+    windowed_counts
+from src.fabric_shim.iterators import HistoryQueryIterator
+from src.fabric_shim.mock_stub import MockStub
+
+# (seconds, is_delete) of the modifications, newest first, two per page
+MODIFICATIONS = [(7300, False), (7200, True), (3700, False), (3600, False), (100, False)]
+
+
+def _page(entries, has_more):
+    return ccshim_pb2.QueryResponse(
+        results=[ccshim_pb2.QueryResultBytes(resultBytes=kv_pb.KeyModification(
+            tx_id='tx%d' % seconds, timestamp=Timestamp(seconds=seconds), is_delete=is_delete).SerializeToString())
+            for seconds, is_delete in entries],
+        has_more=has_more, id='history1')
+
+
+class HistoryHandler:
+    """Serves MODIFICATIONS two at a time and records the query requests"""
+
+    def __init__(self):
+        self.pages = [_page(MODIFICATIONS[i:i + 2], i + 2 < len(MODIFICATIONS))
+                      for i in range(2, len(MODIFICATIONS), 2)]
+        self.requests = []
+
+    async def handle_query_state_next(self, query_id, channel_id, tx_id):
+        self.requests.append('next')
+        return self.pages.pop(0)
+
+    async def handle_query_state_close(self, query_id, channel_id, tx_id):
+        self.requests.append('close')
+
+
+def _history():
+    handler = HistoryHandler()
+    return HistoryQueryIterator(handler, 'mychannel', 'tx1', _page(MODIFICATIONS[:2], True)), handler
+
+
+def test_latest_modifications_stop_early():
+    async def scenario():
+        history, handler = _history()
+        latest = await latest_modifications(history, 1)
+        await asyncio.sleep(0)
+        return [modification.tx_id for modification in latest], handler.requests
+
+    latest, requests = asyncio.run(scenario())
+    assert latest == ['tx7300']
+    # the prefetch of the second page is dropped and the peer iterator closed
+    assert requests == ['close']
+
+
+def test_modifications_since_and_counts():
+    async def scenario():
+        history, handler = _history()
+        recent = [modification.tx_id async for modification in modifications_since(history, 3650)]
+        everything, _ = _history()
+        return recent, handler.requests, await count_modifications(everything), \
+            await count_modifications(_history()[0], since=3600)
+
+    recent, requests, total, since = asyncio.run(scenario())
+    assert recent == ['tx7300', 'tx7200', 'tx3700']
+    # tx3600 is on the second page, the third one is never asked for
+    assert requests == ['next', 'close']
+    assert (total, since) == (5, 4)
+
+
+def test_windowed_counts():
+    async def scenario():
+        return [window async for window in windowed_counts(_history()[0], 3600)]
+
+    assert asyncio.run(scenario()) == [Window(7200, 2, 1), Window(3600, 2, 0), Window(0, 1, 0)]
+
+
+def test_helpers_over_a_mock_stub_history():
+    async def scenario():
+        stub = MockStub('history')
+        for value in (b'1', b'2', None):
+            stub.begin()
+            if value is None:
+                await stub.delete_state('asset1')
+            else:
+                await stub.put_state('asset1', value)
+            stub.commit()
+        latest = await latest_modifications(await stub.get_history_for_key('asset1'), 2)
+        return latest, await count_modifications(await stub.get_history_for_key('asset1'))
+
+    latest, count = asyncio.run(scenario())
+    assert [(modification.value, modification.is_delete) for modification in latest] == [(b'', True), (b'2', False)]
+    assert count == 3
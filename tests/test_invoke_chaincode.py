@@ -0,0 +1,70 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Chaincode to chaincode calls against a fake peer whose callee echoes its first arg
+
+import asyncio
+
+from fabric_protos_python.peer import proposal_response_pb2 as pb
+from src.fabric_shim.interfaces import Chaincode, ChaincodeStubInterface
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.server import _internal_server
+
+from tests.fake_peer import FakePeerConnection
+
+CC_ID = 'test_1.0:invoke'
+
+
+class CallerChaincode(Chaincode):
+    """Calls the callee once per parameter (all with invoke_chaincodes), returns the payloads joined with commas"""
+
+    async def init(self, stub: ChaincodeStubInterface) -> pb.Response:
+        return pb.Response(status=ResponseCode.OK)
+
+    async def invoke(self, stub: ChaincodeStubInterface) -> pb.Response:
+        function, params = stub.get_function_and_parameters()
+        calls = [('callee', [param]) for param in params]
+        if function == 'Cached':
+            responses = await stub.invoke_chaincodes(calls, cache=True)
+        else:
+            responses = await stub.invoke_chaincodes(calls, timeout=0.3)
+        return pb.Response(status=ResponseCode.OK, payload=b','.join(response.payload for response in responses))
+
+
+def _run(address, args, delay=0.0):
+    async def scenario():
+        server = _internal_server(ccid=CC_ID, cc=CallerChaincode, address=address, key=None, cert=None)
+        await server.start()
+        peer = FakePeerConnection(address, delay=delay)
+        try:
+            await peer.connect()
+            return await peer.invoke(args), peer.received
+        finally:
+            await peer.close()
+            await server.stop(0)
+
+    return asyncio.run(scenario())
+
+
+def test_call_deadline_does_not_count_the_wait_behind_earlier_calls():
+    # each call takes 0.2s within its 0.3s timeout, the last one is sent 0.4s after it was made
+    response, received = _run('127.0.0.1:19111', [b'Invoke', b'a', b'b', b'c'], delay=0.2)
+
+    assert response.status == ResponseCode.OK, response.message
+    assert response.payload == b'a,b,c'
+    assert received['INVOKE_CHAINCODE'] == 3
+
+
+def test_cached_calls_reach_the_callee_once():
+    response, received = _run('127.0.0.1:19112', [b'Cached', b'a', b'a', b'b'])
+
+    assert response.status == ResponseCode.OK and response.payload == b'a,a,b'
+    assert received['INVOKE_CHAINCODE'] == 2
+
+
+def test_calls_are_not_cached_by_default():
+    response, received = _run('127.0.0.1:19113', [b'Invoke', b'a', b'a'])
+
+    assert response.status == ResponseCode.OK and response.payload == b'a,a'
+    assert received['INVOKE_CHAINCODE'] == 2
@@ -0,0 +1,104 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Paging of the query iterators against a fake handler, and their closing at the end of a transaction
+
+import asyncio
+
+from fabric_protos_python.ledger.queryresult import kv_query_result_pb2 as kv_pb
+from fabric_protos_python.peer import chaincode_shim_pb2 as ccshim_pb2
+from fabric_protos_python.peer import proposal_response_pb2 as pb
+from src.fabric_shim.interfaces import Chaincode, ChaincodeStubInterface
+from src.fabric_shim.iterators import StateQueryIterator
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.server import _internal_server
+
+from tests.fake_peer import FakePeerConnection
+
+ChaincodeMessage = ccshim_pb2.ChaincodeMessage
+
+
+def page(keys, has_more):
+    return ccshim_pb2.QueryResponse(
+        results=[ccshim_pb2.QueryResultBytes(resultBytes=kv_pb.KV(key=key, value=b'v').SerializeToString())
+                 for key in keys],
+        has_more=has_more, id='query1')
+
+
+class PagingHandler:
+    """Serves pages of two keys and records the query requests"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    async def handle_query_state_next(self, query_id, channel_id, tx_id):
+        self.requests.append('next')
+        return self.pages.pop(0)
+
+    async def handle_query_state_close(self, query_id, channel_id, tx_id):
+        self.requests.append('close')
+
+
+def test_prefetch_starts_with_the_iteration():
+    async def scenario():
+        handler = PagingHandler([page(['k3', 'k4'], False)])
+        iterator = StateQueryIterator(handler, 'mychannel', 'tx1', page(['k1', 'k2'], True))
+        await asyncio.sleep(0)
+        before = list(handler.requests)
+        keys = [kv.key async for kv in iterator]
+        return before, keys, handler.requests
+
+    before, keys, requests = asyncio.run(scenario())
+    assert before == []
+    assert keys == ['k1', 'k2', 'k3', 'k4']
+    assert requests == ['next']
+
+
+def test_async_with_closes_when_the_loop_breaks():
+    async def scenario():
+        handler = PagingHandler([page(['k3', 'k4'], True)])
+        async with StateQueryIterator(handler, 'mychannel', 'tx1', page(['k1', 'k2'], True)) as iterator:
+            async for kv in iterator:
+                if kv.key == 'k1':
+                    break
+        return list(handler.requests)
+
+    # the prefetch is cancelled and the server side iterator closed as soon as the block exits
+    assert asyncio.run(scenario()) == ['close']
+
+
+class BreakingChaincode(Chaincode):
+    """Leaves a range query after its first result, returns its key"""
+
+    async def init(self, stub: ChaincodeStubInterface) -> pb.Response:
+        return pb.Response(status=ResponseCode.OK)
+
+    async def invoke(self, stub: ChaincodeStubInterface) -> pb.Response:
+        async for kv in await stub.get_state_by_range('', ''):
+            break
+        return pb.Response(status=ResponseCode.OK, payload=kv.key.encode())
+
+
+def test_the_transaction_closes_the_iterators_left_open():
+    async def scenario():
+        address = '127.0.0.1:19121'
+        server = _internal_server(ccid='test_1.0:iterators', cc=BreakingChaincode, address=address, key=None,
+                                  cert=None)
+        await server.start()
+        peer = FakePeerConnection(address, {('', 'k%d' % i): b'v' for i in range(5)})
+        peer.recorded = []
+        try:
+            await peer.connect()
+            return await peer.invoke([b'Break']), peer
+        finally:
+            await peer.close()
+            await server.stop(0)
+
+    response, peer = asyncio.run(scenario())
+    assert response.status == ResponseCode.OK and response.payload == b'k0'
+    # the iterator is closed before COMPLETED, whether the prefetched page was sent or dropped from the queue
+    types = [ChaincodeMessage.Type.Name(msg.type) for msg in peer.recorded]
+    assert types[-2:] == ['QUERY_STATE_CLOSE', 'COMPLETED']
+    assert peer.received['QUERY_STATE_CLOSE'] == 1
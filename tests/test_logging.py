@@ -0,0 +1,23 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Logging configuration from the environment
+
+import logging
+
+from src.fabric_shim.logging import LOGGER, configure_logging
+
+
+def test_log_level_is_a_name_or_a_number(monkeypatch):
+    levels = []
+    try:
+        for value in ('20', 'debug', ' Error '):
+            monkeypatch.setenv('CHAINCODE_LOG_LEVEL', value)
+            configure_logging()
+            levels.append(LOGGER.level)
+    finally:
+        monkeypatch.delenv('CHAINCODE_LOG_LEVEL')
+        configure_logging()
+
+    assert levels == [logging.INFO, logging.DEBUG, logging.ERROR]
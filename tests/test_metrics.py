@@ -0,0 +1,102 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Prometheus text exposition of the metrics, and the exporter serving it
+
+import asyncio
+
+from src.fabric_shim import metrics
+from src.fabric_shim.metrics import METRICS, Counter, Gauge, Histogram, MetricsExporter, MetricsRegistry
+
+
+def test_counter_and_gauge_exposition():
+    counter = Counter('tx_total', 'Transactions by status', ('method', 'status'))
+    counter.inc('invoke', 200)
+    counter.inc('invoke', 200, amount=2)
+    counter.inc('in"it\\', 500)
+    gauge = Gauge('running', 'Running transactions')
+    gauge.set(3)
+
+    assert counter.render() == [
+        '# HELP tx_total Transactions by status',
+        '# TYPE tx_total counter',
+        'tx_total{method="invoke",status="200"} 3',
+        'tx_total{method="in\\"it\\\\",status="500"} 1',
+    ]
+    assert gauge.render() == ['# HELP running Running transactions', '# TYPE running gauge', 'running 3']
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency_seconds', 'Latency', ('request',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, 'GetState')
+
+    assert histogram.render()[2:] == [
+        'latency_seconds_bucket{request="GetState",le="0.1"} 2',
+        'latency_seconds_bucket{request="GetState",le="1.0"} 3',
+        'latency_seconds_bucket{request="GetState",le="+Inf"} 4',
+        'latency_seconds_sum{request="GetState"} 2.65',
+        'latency_seconds_count{request="GetState"} 4',
+    ]
+
+
+def test_label_sets_beyond_the_limit_are_folded(monkeypatch):
+    monkeypatch.setattr(metrics, 'MAX_SERIES', 2)
+    counter = Counter('calls_total', 'Calls by function', ('function',))
+    for function in ('a', 'b', 'c', 'd', 'a'):
+        counter.inc(function)
+
+    assert counter.render()[2:] == [
+        'calls_total{function="a"} 2',
+        'calls_total{function="b"} 1',
+        'calls_total{function="%s"} 2' % metrics.OVERFLOW_LABEL,
+    ]
+
+
+class Source:
+    def collect_metrics(self):
+        return {'running': 2, 'pending': 1, 'live': 3, 'leaked': 1, 'requests': 4}
+
+
+def test_registry_renders_every_metric_with_the_sources_sampled():
+    registry = MetricsRegistry()
+    source = Source()
+    registry.add_source(source)
+    text = registry.render()
+
+    assert text.endswith('\n')
+    lines = text.splitlines()
+    assert sum(line.startswith('# TYPE ') for line in lines) == len(registry._metrics)
+    for sample in ('chaincode_tx_running 2', 'chaincode_tx_pending 1', 'chaincode_tx_contexts{state="live"} 3',
+                   'chaincode_tx_contexts{state="leaked"} 1', 'chaincode_peer_requests_pending 4',
+                   'chaincode_peer_streams 1'):
+        assert sample in lines
+
+
+def test_exporter_serves_http_and_writes_the_file(tmp_path):
+    path = str(tmp_path / 'metrics.prom')
+
+    async def get(target):
+        reader, writer = await asyncio.open_connection('127.0.0.1', 19151)
+        writer.write(b'GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n' % target)
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def scenario():
+        enabled = METRICS.enabled
+        exporter = MetricsExporter('127.0.0.1:19151', path, interval=60)
+        await exporter.start()
+        try:
+            return await get(b'/metrics'), await get(b'/other')
+        finally:
+            await exporter.stop()
+            METRICS.enabled = enabled
+
+    found, not_found = asyncio.run(scenario())
+    assert found.startswith(b'HTTP/1.1 200 OK\r\n')
+    assert b'# TYPE chaincode_tx_duration_seconds histogram\n' in found
+    assert not_found.startswith(b'HTTP/1.1 404')
+    with open(path) as f:
+        assert '# TYPE chaincode_tx_responses_total counter' in f.read()
@@ -0,0 +1,73 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Chaincode to chaincode calls between MockStubs
+
+import asyncio
+
+from fabric_protos_python.peer import proposal_response_pb2 as pb
+from src.fabric_shim.interfaces import Chaincode, ChaincodeStubInterface
+from src.fabric_shim.mock_stub import MockStub
+from src.fabric_shim.response import ResponseCode
+
+
+class PutChaincode(Chaincode):
+    """Put(key, value) writes the key, Fail(key, value) writes it and answers with an error"""
+
+    async def init(self, stub: ChaincodeStubInterface) -> pb.Response:
+        return pb.Response(status=ResponseCode.OK)
+
+    async def invoke(self, stub: ChaincodeStubInterface) -> pb.Response:
+        function, params = stub.get_function_and_parameters()
+        await stub.put_state(params[0], params[1])
+        if function == 'Fail':
+            return pb.Response(status=ResponseCode.ERROR, message='failed')
+        return pb.Response(status=ResponseCode.OK)
+
+
+class CallerChaincode(Chaincode):
+    """Writes 'caller', calls Put on the callee, then answers with the status named by its first parameter"""
+
+    async def init(self, stub: ChaincodeStubInterface) -> pb.Response:
+        return pb.Response(status=ResponseCode.OK)
+
+    async def invoke(self, stub: ChaincodeStubInterface) -> pb.Response:
+        _, params = stub.get_function_and_parameters()
+        await stub.put_state('caller', b'1')
+        await stub.invoke_chaincode('callee', [b'Put', b'a', b'1'])
+        await stub.invoke_chaincode('callee', [b'Fail', b'b', b'1'])
+        return pb.Response(status=ResponseCode.OK if params[0] == 'ok' else ResponseCode.ERROR)
+
+
+def _stubs():
+    callee = MockStub('callee', PutChaincode)
+    caller = MockStub('caller', CallerChaincode)
+    caller.invokables['callee'] = callee
+    return caller, callee
+
+
+def test_callee_writes_commit_with_the_caller():
+    async def scenario():
+        caller, callee = _stubs()
+        resp = await caller.mock_invoke([b'Invoke', b'ok'])
+        assert resp.status == ResponseCode.OK
+        assert caller.collections[''].get('caller') == b'1'
+        assert callee.collections[''].get('a') == b'1'
+        # the failed call left nothing behind
+        assert 'b' not in callee.collections['']
+        assert callee.tx_id is None
+
+    asyncio.run(scenario())
+
+
+def test_callee_writes_are_dropped_with_the_caller():
+    async def scenario():
+        caller, callee = _stubs()
+        resp = await caller.mock_invoke([b'Invoke', b'error'])
+        assert resp.status == ResponseCode.ERROR
+        assert 'caller' not in caller.collections['']
+        assert len(callee.collections['']) == 0
+        assert callee.tx_id is None
+
+    asyncio.run(scenario())
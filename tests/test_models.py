@@ -0,0 +1,107 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Models and their codecs, and the state helpers on a MockStub
+
+import asyncio
+import json
+import typing
+
+import pytest
+from src.fabric_shim.mock_stub import MockStub
+from src.fabric_shim.models import Codec, Model, StructCodec, get_codec, get_model, get_models, put_model, \
+    register_codec
+
+
+class Asset(Model):
+    id: str
+    color: str = ''
+    size: int = 0
+    owner: typing.Optional[str] = 'nobody'
+
+
+class Document(Asset):
+    __codec__ = 'struct'
+    price: float = 0.0
+    transferable: bool = True
+    content: bytes = b''
+
+
+DOCUMENT = Document('doc1', 'blue', 5, 'Tomoko', 12.5, False, bytes(range(256)))
+
+
+def test_fields_slots_and_defaults():
+    asset = Asset('asset1', size=5)
+    assert Document._fields == ('id', 'color', 'size', 'owner', 'price', 'transferable', 'content')
+    assert asset.to_dict() == {'id': 'asset1', 'color': '', 'size': 5, 'owner': 'nobody'}
+    assert Asset.from_dict({'id': 'asset1', 'size': 5, 'unknown': 1}) == asset
+    assert repr(asset) == "Asset(id='asset1', color='', size=5, owner='nobody')"
+    # no per-instance dict
+    with pytest.raises(AttributeError):
+        asset.colour = 'blue'
+
+
+def test_json_codec_matches_json_dumps():
+    asset = Asset('asset1', 'blue', 5, 'Tomoko')
+    assert asset.to_bytes() == json.dumps(asset.to_dict()).encode()
+    assert Asset.from_bytes(b'{"id": "asset1", "size": 5}') == Asset('asset1', size=5)
+
+
+@pytest.mark.parametrize('codec', ['json', 'struct', 'protobuf'])
+def test_codecs_round_trip(codec):
+    record = DOCUMENT if codec != 'json' else Asset('asset1', 'blüe', -5, 'Tomoko')
+    assert type(record).from_bytes(record.to_bytes(codec), codec) == record
+
+
+def test_struct_codec_checks_its_version():
+    class Versioned(Model):
+        size: int = 0
+
+    # the first byte is the version
+    assert Versioned(5).to_bytes('struct')[0] == 1
+    newer_encode, _ = StructCodec(version=2).compile(Versioned)
+    with pytest.raises(ValueError):
+        Versioned.from_bytes(newer_encode(Versioned(5)), 'struct')
+
+
+def test_codecs_refuse_unsupported_fields():
+    class Nested(Model):
+        tags: typing.List[str] = None
+
+    with pytest.raises(TypeError):
+        Nested.from_bytes(b'', 'struct')
+    with pytest.raises(TypeError):
+        Nested.from_bytes(b'', 'protobuf')
+
+
+def test_registered_codecs_are_used_by_name():
+    class ReprCodec(Codec):
+        name = 'test-repr'
+
+        def compile(self, model_cls):
+            return lambda record: repr(record).encode(), lambda data: data.decode()
+
+    register_codec(ReprCodec())
+    assert get_codec('test-repr').name == 'test-repr'
+    assert Asset('asset1').to_bytes('test-repr') == b"Asset(id='asset1', color='', size=0, owner='nobody')"
+    with pytest.raises(KeyError):
+        get_codec('missing')
+
+
+def test_state_helpers_use_the_model_codec():
+    async def scenario():
+        stub = MockStub('models')
+        stub.begin()
+        await put_model(stub, 'doc1', DOCUMENT)
+        await put_model(stub, 'asset1', Asset('asset1'), codec='protobuf')
+        stub.commit()
+        stored = stub.collections[''].get('doc1')
+        return (stored, await get_model(stub, Document, 'doc1'), await get_model(stub, Asset, 'asset1', 'protobuf'),
+                await get_models(stub, Document, ['doc1', 'missing']))
+
+    stored, document, asset, documents = asyncio.run(scenario())
+    assert stored == DOCUMENT.to_bytes('struct')
+    assert document == DOCUMENT
+    assert asset == Asset('asset1')
+    assert documents == [DOCUMENT, None]
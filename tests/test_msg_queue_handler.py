@@ -0,0 +1,53 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# One request in flight per transaction context, against a fake handler
+
+import asyncio
+
+from fabric_protos_python.peer import chaincode_shim_pb2 as ccshim_pb2
+from src.fabric_shim.msg_queue_handler import MsgQueueHandler, QueueMessage
+
+ChaincodeMessage = ccshim_pb2.ChaincodeMessage
+
+
+class WritingHandler:
+    """Records the messages written to the stream"""
+
+    def __init__(self):
+        self.context = None
+        self.written = []
+        self.background = []
+
+    async def write_message(self, msg):
+        self.written.append(msg.payload)
+
+    def flow_changed(self):
+        pass
+
+    def run_in_background(self, coro):
+        self.background.append(asyncio.ensure_future(coro))
+
+
+def _message(payload):
+    msg = ChaincodeMessage(type=ChaincodeMessage.GET_STATE, payload=payload, txid='tx1', channel_id='mychannel')
+    return QueueMessage(msg, 'GetState', asyncio.get_running_loop().create_future())
+
+
+def test_a_request_cancelled_while_waiting_is_not_sent():
+    async def scenario():
+        handler = WritingHandler()
+        queue = MsgQueueHandler(handler)
+        first, cancelled, last = _message(b'first'), _message(b'cancelled'), _message(b'last')
+        for message in (first, cancelled, last):
+            await queue.queue_msg(message)
+        cancelled.cancel()
+        queue.handle_msg_response(ChaincodeMessage(type=ChaincodeMessage.RESPONSE, txid='tx1',
+                                                   channel_id='mychannel'))
+        await asyncio.gather(*handler.background)
+        return handler.written, queue.stats()['pending_requests']
+
+    written, pending = asyncio.run(scenario())
+    assert written == [b'first', b'last']
+    assert pending == 1
@@ -0,0 +1,110 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Private data calls against a fake peer, with and without write batching
+
+import asyncio
+import hashlib
+
+from fabric_protos_python.peer import chaincode_pb2 as cc_pb2
+from fabric_protos_python.peer import chaincode_shim_pb2 as ccshim_pb2
+from fabric_protos_python.peer import proposal_response_pb2 as pb
+from src.fabric_shim.interfaces import Chaincode, ChaincodeStubInterface
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.server import _internal_server
+
+from tests.fake_peer import FakePeerConnection
+
+CC_ID = 'test_1.0:private'
+ChaincodeMessage = ccshim_pb2.ChaincodeMessage
+
+
+class PrivateChaincode(Chaincode):
+    """Read key...: values joined with commas, and whether each key exists
+    Hash key: the hash of the value
+    Endorse key policy: puts the key then sets its endorsement policy, returns the policy read back
+    Purge key: puts another key then purges `key`"""
+
+    async def init(self, stub: ChaincodeStubInterface) -> pb.Response:
+        return pb.Response(status=ResponseCode.OK)
+
+    async def invoke(self, stub: ChaincodeStubInterface) -> pb.Response:
+        function, params = stub.get_function_and_parameters()
+        if function == 'Read':
+            values = await stub.get_private_data_multiple('secrets', params)
+            values.append(await stub.get_private_data('secrets', params[0]))
+            exists = [await stub.has_private_data('secrets', key) for key in params]
+            return pb.Response(status=ResponseCode.OK, payload=b','.join(values), message=repr(exists))
+        if function == 'Hash':
+            return pb.Response(status=ResponseCode.OK, payload=await stub.get_private_data_hash('secrets', params[0]))
+        if function == 'Endorse':
+            await stub.put_private_data('secrets', params[0], b'endorsed')
+            await stub.set_private_data_validation_parameter('secrets', params[0], params[1].encode())
+            policy = await stub.get_private_data_validation_parameter('secrets', params[0])
+            return pb.Response(status=ResponseCode.OK, payload=policy)
+        await stub.put_private_data('secrets', 'other', b'1')
+        await stub.purge_private_data('secrets', params[0])
+        return pb.Response(status=ResponseCode.OK)
+
+
+def _run(address, args, store, write_batch=False):
+    async def scenario():
+        server = _internal_server(ccid=CC_ID, cc=PrivateChaincode, address=address, key=None, cert=None,
+                                  write_batch=write_batch)
+        await server.start()
+        peer = FakePeerConnection(address, store)
+        if write_batch:
+            peer.peer_params = cc_pb2.ChaincodeAdditionalParams(use_write_batch=True, max_size_write_batch=100)
+        peer.recorded = []
+        try:
+            await peer.connect()
+            return await peer.invoke(args), peer
+        finally:
+            await peer.close()
+            await server.stop(0)
+
+    return asyncio.run(scenario())
+
+
+def _types(peer):
+    return [ChaincodeMessage.Type.Name(msg.type) for msg in peer.recorded]
+
+
+def test_reads_go_through_the_collection_read_cache():
+    store = {('secrets', 'a'): b'1', ('', 'b'): b'public'}
+    response, peer = _run('127.0.0.1:19161', [b'Read', b'a', b'b'], store)
+
+    assert response.status == ResponseCode.OK, response.message
+    # b is public data, not in the collection
+    assert response.payload == b'1,,1' and response.message == '[True, False]'
+    # every value was read once, has_private_data answered from the cache
+    assert _types(peer)[1:] == ['GET_STATE', 'GET_STATE', 'COMPLETED']
+
+
+def test_hash_of_a_private_value():
+    store = {('secrets', 'a'): b'1'}
+    response, _ = _run('127.0.0.1:19162', [b'Hash', b'a'], store)
+
+    assert response.payload == hashlib.sha256(b'1').digest()
+
+
+def test_buffered_writes_are_flushed_before_the_metadata_write():
+    store = {}
+    response, peer = _run('127.0.0.1:19163', [b'Endorse', b'a', b'policy'], store, write_batch=True)
+
+    assert response.status == ResponseCode.OK, response.message
+    assert response.payload == b'policy'
+    # the key exists on the peer when its endorsement policy is set
+    assert _types(peer)[1:] == ['WRITE_BATCH_STATE', 'PUT_STATE_METADATA', 'GET_STATE_METADATA', 'COMPLETED']
+    assert store == {('secrets', 'a'): b'endorsed'}
+    assert peer.metadata == {('secrets', 'a'): {'VALIDATION_PARAMETER': b'policy'}}
+
+
+def test_buffered_writes_are_flushed_before_the_purge():
+    store = {('secrets', 'a'): b'1'}
+    response, peer = _run('127.0.0.1:19164', [b'Purge', b'a'], store, write_batch=True)
+
+    assert response.status == ResponseCode.OK, response.message
+    assert _types(peer)[1:] == ['WRITE_BATCH_STATE', 'PURGE_PRIVATE_DATA', 'COMPLETED']
+    assert store == {('secrets', 'other'): b'1'}
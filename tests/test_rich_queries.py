@@ -0,0 +1,104 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Rich queries, streamed and paginated, against a fake peer
+
+import asyncio
+import json
+
+from fabric_protos_python.peer import proposal_response_pb2 as pb
+from src.fabric_shim.interfaces import Chaincode, ChaincodeStubInterface
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.server import _internal_server
+
+from tests.fake_peer import FakePeerConnection
+
+CC_ID = 'test_1.0:rich_queries'
+STORE = {('', 'asset%d' % i): json.dumps({'color': 'red' if i % 3 == 0 else 'blue', 'size': i}).encode()
+         for i in range(1, 10)}
+BLUE = ['asset%d' % i for i in range(1, 10) if i % 3]
+
+
+def _query(color):
+    return json.dumps({'selector': {'color': color}})
+
+
+class QueryChaincode(Chaincode):
+    """All color: every matching key and size, values decoded with json.loads
+    Raw color: every matching key, undecoded
+    Page color page_size [bookmark]: one page of keys and sizes, with the bookmark of the next one"""
+
+    async def init(self, stub: ChaincodeStubInterface) -> pb.Response:
+        return pb.Response(status=ResponseCode.OK)
+
+    async def invoke(self, stub: ChaincodeStubInterface) -> pb.Response:
+        function, params = stub.get_function_and_parameters()
+        if function == 'All':
+            results = [[kv.key, kv.value['size']]
+                       async for kv in await stub.get_query_result(_query(params[0]), decode=json.loads)]
+            return pb.Response(status=ResponseCode.OK, payload=json.dumps(results).encode())
+        if function == 'Raw':
+            keys = [kv.key async for kv in await stub.get_query_result(_query(params[0]))]
+            return pb.Response(status=ResponseCode.OK, payload=json.dumps(keys).encode())
+        iterator, metadata = await stub.get_query_result_with_pagination(
+            _query(params[0]), int(params[1]), params[2] if len(params) > 2 else '', decode=json.loads)
+        results = [[kv.key, kv.value['size']] async for kv in iterator]
+        return pb.Response(status=ResponseCode.OK, payload=json.dumps({
+            'results': results, 'count': metadata.fetched_records_count, 'bookmark': metadata.bookmark}).encode())
+
+
+def _run(address, *calls):
+    async def scenario():
+        server = _internal_server(ccid=CC_ID, cc=QueryChaincode, address=address, key=None, cert=None)
+        await server.start()
+        peer = FakePeerConnection(address, dict(STORE))
+        try:
+            await peer.connect()
+            responses = []
+            for call in calls:
+                args = call(responses) if callable(call) else call
+                if args is None:
+                    break
+                responses.append(await peer.invoke(args))
+            return responses, peer.received
+        finally:
+            await peer.close()
+            await server.stop(0)
+
+    return asyncio.run(scenario())
+
+
+def test_streamed_query_decodes_every_page():
+    responses, received = _run('127.0.0.1:19171', [b'All', b'blue'], [b'Raw', b'red'])
+
+    assert [response.status for response in responses] == [ResponseCode.OK] * 2, responses[0].message
+    assert json.loads(responses[0].payload) == [[key, int(key[5:])] for key in BLUE]
+    assert json.loads(responses[1].payload) == ['asset3', 'asset6', 'asset9']
+    # 6 then 3 results, two per peer page
+    assert received['QUERY_STATE_NEXT'] == 2 + 1
+
+
+def test_pages_resume_from_the_bookmark_across_transactions():
+    def next_page(responses):
+        if not responses:
+            return [b'Page', b'blue', b'4']
+        bookmark = json.loads(responses[-1].payload)['bookmark']
+        return [b'Page', b'blue', b'4', bookmark.encode()] if bookmark else None
+
+    responses, received = _run('127.0.0.1:19172', *[next_page] * 4)
+
+    pages = [json.loads(response.payload) for response in responses]
+    assert [page['count'] for page in pages] == [4, 2]
+    assert [key for page in pages for key, _ in page['results']] == BLUE
+    assert pages[0]['bookmark'] == 'asset7' and pages[1]['bookmark'] == ''
+    # a page comes in one response
+    assert received['QUERY_STATE_NEXT'] == 0
+
+
+def test_page_size_must_be_positive():
+    [response], received = _run('127.0.0.1:19173', [b'Page', b'blue', b'0'])
+
+    assert response.status == ResponseCode.ERROR
+    assert 'page_size must be a positive integer' in response.message
+    assert received['GET_QUERY_RESULT'] == 0
@@ -0,0 +1,159 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Chaincode server (ChaincodeService) driven by in-process fake peers
+
+import asyncio
+import multiprocessing
+
+from fabric_protos_python.peer import proposal_response_pb2 as pb
+from src.fabric_shim.interfaces import Chaincode, ChaincodeStubInterface
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.server import _build_server, _graceful_shutdown, _internal_server, start
+
+from tests.fake_peer import FakePeerConnection
+
+CC_ID = 'test_1.0:server'
+
+
+class StoreChaincode(Chaincode):
+    """Set key value [delay]: waits `delay` seconds, writes the key and returns the value read back"""
+
+    async def init(self, stub: ChaincodeStubInterface) -> pb.Response:
+        return pb.Response(status=ResponseCode.OK)
+
+    async def invoke(self, stub: ChaincodeStubInterface) -> pb.Response:
+        _, params = stub.get_function_and_parameters()
+        if len(params) > 2:
+            await asyncio.sleep(float(params[2]))
+        await stub.put_state(params[0], params[1].encode())
+        return pb.Response(status=ResponseCode.OK, payload=await stub.get_state(params[0]))
+
+
+def test_concurrent_streams_are_isolated():
+    address = '127.0.0.1:19071'
+
+    async def scenario():
+        server = _internal_server(ccid=CC_ID, cc=StoreChaincode, address=address, key=None, cert=None)
+        await server.start()
+        stores = [{}, {}, {}]
+        peers = [FakePeerConnection(address, store) for store in stores]
+        try:
+            await peers[0].connect()
+            # the handshakes of the other streams happen while a transaction runs on the first one
+            slow = asyncio.ensure_future(peers[0].invoke([b'Set', b'slow', b'p0', b'0.2']))
+            await asyncio.gather(peers[1].connect(), peers[2].connect())
+            values = [b'p%d-%d' % (i, n) for n in range(5) for i in range(len(peers))]
+            responses = await asyncio.gather(*(peers[int(value[1:2])].invoke([b'Set', value, value])
+                                               for value in values))
+            slow_response = await slow
+
+            # the other streams keep working once one of them is closed
+            await peers[1].close()
+            after = await asyncio.gather(peers[0].invoke([b'Set', b'after', b'p0']),
+                                         peers[2].invoke([b'Set', b'after', b'p2']))
+            return slow_response, list(zip(values, responses)), after, stores
+        finally:
+            for peer in peers:
+                await peer.close()
+            await server.stop(0)
+
+    slow_response, responses, after, stores = asyncio.run(scenario())
+
+    assert slow_response.status == ResponseCode.OK and slow_response.payload == b'p0'
+    for value, response in responses:
+        assert response.status == ResponseCode.OK, response.message
+        assert response.payload == value
+    assert [response.payload for response in after] == [b'p0', b'p2']
+    # each stream wrote to its own peer only
+    for i, store in enumerate(stores):
+        expected = {('', 'p%d-%d' % (i, n)): b'p%d-%d' % (i, n) for n in range(5)}
+        if i != 1:
+            expected[('', 'after')] = b'p%d' % i
+        if i == 0:
+            expected[('', 'slow')] = b'p0'
+        assert store == expected
+
+
+def test_full_queue_pauses_reads_instead_of_failing():
+    address = '127.0.0.1:19073'
+
+    async def scenario():
+        # one transaction runs and one waits, the others stay on the stream until there is room
+        server = _internal_server(ccid=CC_ID, cc=StoreChaincode, address=address, key=None, cert=None,
+                                  max_concurrent_tx=1, max_pending_tx=1)
+        await server.start()
+        peer = FakePeerConnection(address)
+        try:
+            await peer.connect()
+            # each transaction needs peer replies, which arrive on the stream the reader pauses
+            return await asyncio.wait_for(asyncio.gather(*(peer.invoke([b'Set', b'k%d' % i, b'v%d' % i, b'0.01'])
+                                                           for i in range(20))), 30)
+        finally:
+            await peer.close()
+            await server.stop(0)
+
+    responses = asyncio.run(scenario())
+    for i, response in enumerate(responses):
+        assert response.status == ResponseCode.OK, response.message
+        assert response.payload == b'v%d' % i
+
+
+def test_graceful_shutdown_completes_running_transactions():
+    address = '127.0.0.1:19074'
+
+    async def scenario():
+        server, service = _build_server(ccid=CC_ID, cc=StoreChaincode, address=address, key=None, cert=None)
+        await server.start()
+        peer = FakePeerConnection(address)
+        try:
+            await peer.connect()
+            running = asyncio.ensure_future(peer.invoke([b'Set', b'long', b'done', b'0.5']))
+            await asyncio.sleep(0.1)
+            started = asyncio.get_running_loop().time()
+            shutdown = asyncio.ensure_future(_graceful_shutdown(server, service, 10))
+            await asyncio.sleep(0.1)
+            # arriving while draining
+            refused = await peer.invoke([b'Set', b'late', b'v'])
+            response = await running
+            drained = await shutdown
+            return response, refused, drained, asyncio.get_running_loop().time() - started
+        finally:
+            await peer.close()
+            await server.stop(0)
+
+    response, refused, drained, seconds = asyncio.run(scenario())
+    # the running transaction sent its COMPLETED message before the streams were closed
+    assert response.status == ResponseCode.OK and response.payload == b'done'
+    assert refused.status == ResponseCode.ERROR
+    assert (drained['streams'], drained['in_flight'], drained['finished'], drained['refused']) == (1, 1, 1, 1)
+    # the server stopped once drained, without waiting for the stop grace period
+    assert seconds < 5
+
+
+def _start(address):
+    start(StoreChaincode, cc_id=CC_ID, address=address)
+
+
+def test_start_serves_and_stops_on_sigterm():
+    address = '127.0.0.1:19072'
+    # spawned, so the server never inherits this process' gRPC state
+    server = multiprocessing.get_context('spawn').Process(target=_start, args=(address,))
+    server.start()
+
+    async def scenario():
+        peer = FakePeerConnection(address)
+        try:
+            await asyncio.wait_for(peer.connect(), 30)
+            return await peer.invoke([b'Set', b'key', b'value'])
+        finally:
+            await peer.close()
+
+    try:
+        response = asyncio.run(scenario())
+    finally:
+        server.terminate()
+        server.join(30)
+    assert response.status == ResponseCode.OK and response.payload == b'value'
+    assert server.exitcode == 0
@@ -0,0 +1,29 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Worker processes of the WorkerSupervisor
+
+import signal
+import time
+
+from src.fabric_shim.workers import WorkerSupervisor
+
+
+def test_workers_do_not_inherit_the_supervisor_sigterm_handler():
+    supervisor = WorkerSupervisor(1, time.sleep, (30,), stop_timeout=5)
+    previous = signal.signal(signal.SIGTERM, supervisor._request_stop)
+    try:
+        supervisor._spawn(0)
+        # past the worker's start
+        time.sleep(0.5)
+        started = time.monotonic()
+        supervisor.stop()
+        stopped = time.monotonic() - started
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+    # ended by the SIGTERM itself, not killed at the stop timeout
+    assert supervisor._procs[0].exitcode == -signal.SIGTERM
+    assert stopped < 5
+    assert not supervisor._stopping
@@ -0,0 +1,113 @@
+# Copyright the Institute of Cryptography, Faculty of Mathematics and Computer Science at University of Havana
+# contributors. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+# Write batching (start(write_batch=True)) against a fake peer, with and without peer support
+
+import asyncio
+
+from fabric_protos_python.peer import chaincode_pb2 as cc_pb2
+from fabric_protos_python.peer import chaincode_shim_pb2 as ccshim_pb2
+from fabric_protos_python.peer import proposal_response_pb2 as pb
+from src.fabric_shim.interfaces import Chaincode, ChaincodeStubInterface
+from src.fabric_shim.response import ResponseCode
+from src.fabric_shim.server import _internal_server
+
+from tests.fake_peer import FakePeerConnection
+
+CC_ID = 'test_1.0:write_batch'
+ChaincodeMessage = ccshim_pb2.ChaincodeMessage
+
+
+class WritesChaincode(Chaincode):
+    """Rewrite: a=1 then a=2, b=1 then delete b, c=1; ReadAfterPut key: puts the key and returns the value read back"""
+
+    async def init(self, stub: ChaincodeStubInterface) -> pb.Response:
+        return pb.Response(status=ResponseCode.OK)
+
+    async def invoke(self, stub: ChaincodeStubInterface) -> pb.Response:
+        function, params = stub.get_function_and_parameters()
+        if function == 'ReadAfterPut':
+            await stub.put_state(params[0], b'new')
+            return pb.Response(status=ResponseCode.OK, payload=await stub.get_state(params[0]))
+        await stub.put_state('a', b'1')
+        await stub.put_state('b', b'1')
+        await stub.put_state('a', b'2')
+        await stub.delete_state('b')
+        await stub.put_state('c', b'1')
+        return pb.Response(status=ResponseCode.OK)
+
+
+def _run(address, args, store, peer_params=None):
+    async def scenario():
+        server = _internal_server(ccid=CC_ID, cc=WritesChaincode, address=address, key=None, cert=None,
+                                  write_batch=True)
+        await server.start()
+        peer = FakePeerConnection(address, store)
+        peer.peer_params = peer_params
+        peer.recorded = []
+        try:
+            await peer.connect()
+            response = await peer.invoke(args)
+            return response, peer
+        finally:
+            await peer.close()
+            await server.stop(0)
+
+    return asyncio.run(scenario())
+
+
+def _batches(peer):
+    return [ccshim_pb2.WriteBatchState.FromString(msg.payload) for msg in peer.recorded
+            if msg.type == ChaincodeMessage.WRITE_BATCH_STATE]
+
+
+def test_batch_merges_the_writes_of_a_key():
+    store = {('', 'b'): b'0'}
+    params = cc_pb2.ChaincodeAdditionalParams(use_write_batch=True, max_size_write_batch=100)
+    response, peer = _run('127.0.0.1:19091', [b'Rewrite'], store, params)
+
+    assert response.status == ResponseCode.OK, response.message
+    assert peer.received['WRITE_BATCH_STATE'] == 1
+    assert peer.received['PUT_STATE'] == 0 and peer.received['DEL_STATE'] == 0
+    # one record per key, the last write wins, in the order the keys were first written
+    [batch] = _batches(peer)
+    assert [(record.key, record.type, record.value) for record in batch.rec] == [
+        ('a', ccshim_pb2.WriteRecord.PUT_STATE, b'2'),
+        ('b', ccshim_pb2.WriteRecord.DEL_STATE, b''),
+        ('c', ccshim_pb2.WriteRecord.PUT_STATE, b'1'),
+    ]
+    assert store == {('', 'a'): b'2', ('', 'c'): b'1'}
+
+
+def test_batch_is_split_at_the_peer_limit():
+    store = {}
+    params = cc_pb2.ChaincodeAdditionalParams(use_write_batch=True, max_size_write_batch=2)
+    response, peer = _run('127.0.0.1:19092', [b'Rewrite'], store, params)
+
+    assert response.status == ResponseCode.OK, response.message
+    assert [len(batch.rec) for batch in _batches(peer)] == [2, 1]
+    assert store == {('', 'a'): b'2', ('', 'c'): b'1'}
+
+
+def test_peer_without_write_batch_gets_one_message_per_key():
+    store = {('', 'b'): b'0'}
+    response, peer = _run('127.0.0.1:19093', [b'Rewrite'], store)
+
+    assert response.status == ResponseCode.OK, response.message
+    assert peer.received['WRITE_BATCH_STATE'] == 0
+    # still merged: a and c are put once, b is only deleted
+    assert peer.received['PUT_STATE'] == 2 and peer.received['DEL_STATE'] == 1
+    assert store == {('', 'a'): b'2', ('', 'c'): b'1'}
+
+
+def test_reads_do_not_flush_and_the_flush_precedes_completed():
+    store = {('', 'k'): b'old'}
+    params = cc_pb2.ChaincodeAdditionalParams(use_write_batch=True)
+    response, peer = _run('127.0.0.1:19094', [b'ReadAfterPut', b'k'], store, params)
+
+    # like on a peer, a transaction reads the committed state, not its own writes
+    assert response.status == ResponseCode.OK and response.payload == b'old'
+    types = [ChaincodeMessage.Type.Name(msg.type) for msg in peer.recorded]
+    assert types == ['REGISTER', 'GET_STATE', 'WRITE_BATCH_STATE', 'COMPLETED']
+    assert store == {('', 'k'): b'new'}